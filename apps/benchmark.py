@@ -0,0 +1,530 @@
+"""
+Benchmarks for the pytmx loader.
+
+Run from the apps folder:  python benchmark.py [name ...]
+
+Large maps are generated into a temporary folder, so the numbers are not
+dominated by the small maps that ship with the test data.  Images are not
+loaded; only the work done by pytmx is measured.
+"""
+import base64
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+import tracemalloc
+import zlib
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytmx
+
+logger = logging.getLogger(__name__)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+benchmarks = list()
+
+
+def benchmark(func):
+    benchmarks.append(func)
+    return func
+
+
+def best_of(func, number=1, repeat=5):
+    """ Return the best time, in milliseconds, of calling func
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1000
+
+
+def report(name, ms):
+    logger.info('  %-40s %10.2f ms', name, ms)
+
+
+def peak_memory(func):
+    """ Return the peak memory, in MiB, allocated while calling func
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / float(1 << 20)
+    finally:
+        tracemalloc.stop()
+
+
+def report_memory(name, mib):
+    logger.info('  %-40s %10.2f MiB', name, mib)
+
+
+def make_map(path, width=512, height=512, layers=4, tiles=300, seed=0):
+    """ Write a random map, in TMX and JSON formats, and return both paths
+    """
+    rnd = random.Random(seed)
+    layer_data = [[rnd.randint(0, tiles) for i in range(width * height)]
+                  for n in range(layers)]
+
+    tmx = os.path.join(path, 'bench.tmx')
+    with open(tmx, 'w') as fh:
+        fh.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        fh.write('<map version="1.0" orientation="orthogonal" width="{0}" '
+                 'height="{1}" tilewidth="16" tileheight="16">\n'
+                 .format(width, height))
+        fh.write(' <tileset firstgid="1" name="tiles" tilewidth="16" '
+                 'tileheight="16">\n'
+                 '  <image source="tiles.png" width="320" height="320"/>\n'
+                 ' </tileset>\n')
+        for n, data in enumerate(layer_data):
+            raw = array('I', data)
+            if sys.byteorder == 'big':
+                raw.byteswap()
+            text = base64.b64encode(zlib.compress(raw.tobytes()))
+            fh.write(' <layer name="layer{0}" width="{1}" height="{2}">\n'
+                     '  <data encoding="base64" compression="zlib">{3}'
+                     '</data>\n </layer>\n'
+                     .format(n, width, height, text.decode('ascii')))
+        fh.write('</map>\n')
+
+    doc = {'version': 1, 'orientation': 'orthogonal',
+           'width': width, 'height': height,
+           'tilewidth': 16, 'tileheight': 16,
+           'tilesets': [{'firstgid': 1, 'name': 'tiles',
+                         'tilewidth': 16, 'tileheight': 16,
+                         'image': 'tiles.png',
+                         'imagewidth': 320, 'imageheight': 320,
+                         'margin': 0, 'spacing': 0}],
+           'layers': [{'type': 'tilelayer', 'name': 'layer{0}'.format(n),
+                       'width': width, 'height': height, 'x': 0, 'y': 0,
+                       'opacity': 1, 'visible': True, 'data': data}
+                      for n, data in enumerate(layer_data)]}
+
+    js = os.path.join(path, 'bench.json')
+    with open(js, 'w') as fh:
+        json.dump(doc, fh)
+
+    return tmx, js
+
+
+@benchmark
+def tmx_vs_json(path):
+    logger.info('TMX and JSON loaders')
+    tmx, js = make_map(path)
+    report('TiledMap (TMX, base64 zlib)', best_of(lambda: pytmx.TiledMap(tmx)))
+    report('TiledMap.from_json', best_of(lambda: pytmx.TiledMap.from_json(js)))
+
+    tmx = os.path.join('data', 'legacy', 'formosa-csv.tmx')
+    js = os.path.join('data', '0.9.1', 'formosa.json')
+    report('formosa-csv.tmx', best_of(lambda: pytmx.TiledMap(tmx), 20))
+    report('formosa.json', best_of(lambda: pytmx.TiledMap.from_json(js), 20))
+
+
+@benchmark
+def compiled(path):
+    from pytmx.tmxc import load_compiled
+    logger.info('Compiled map cache')
+    tmx, js = make_map(path)
+    report('TiledMap', best_of(lambda: pytmx.TiledMap(tmx)))
+    load_compiled(tmx)
+    report('load_compiled, cache is current',
+           best_of(lambda: load_compiled(tmx), 20))
+
+
+@benchmark
+def layer_filter(path):
+    logger.info('Loading one of four layers')
+    tmx, js = make_map(path)
+    report('all layers', best_of(lambda: pytmx.TiledMap(tmx)))
+    report('layers=["layer0"]',
+           best_of(lambda: pytmx.TiledMap(tmx, layers=['layer0'])))
+    report('layers=["layer0"], streaming',
+           best_of(lambda: pytmx.TiledMap(tmx, layers=['layer0'],
+                                          streaming=True)))
+    report('TiledMap.from_json, layers=["layer0"]',
+           best_of(lambda: pytmx.TiledMap.from_json(js, layers=['layer0'])))
+
+
+@benchmark
+def streaming_memory(path, width=256, height=256, layers=4, objects=2000):
+    logger.info('Peak memory of streaming')
+    tmx, js = make_map(path)
+    parsed = peak_memory(lambda: pytmx.TiledMap(tmx))
+    streamed = peak_memory(lambda: pytmx.TiledMap(tmx, streaming=True))
+    report_memory('TiledMap (TMX, base64 zlib)', parsed)
+    report_memory('streaming', streamed)
+
+    # xml encoded layers make a tree that is much larger than the layers
+    rnd = random.Random(0)
+    tmx = os.path.join(path, 'bench-xml.tmx')
+    with open(tmx, 'w') as fh:
+        fh.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        fh.write('<map version="1.0" orientation="orthogonal" width="{0}" '
+                 'height="{1}" tilewidth="16" tileheight="16">\n'
+                 .format(width, height))
+        fh.write(' <tileset firstgid="1" name="tiles" tilewidth="16" '
+                 'tileheight="16">\n'
+                 '  <image source="tiles.png" width="320" height="320"/>\n'
+                 ' </tileset>\n')
+        for n in range(layers):
+            fh.write(' <layer name="layer{0}" width="{1}" height="{2}">\n'
+                     '  <data>\n'.format(n, width, height))
+            for i in range(width * height):
+                fh.write('   <tile gid="{0}"/>\n'.format(rnd.randint(0, 300)))
+            fh.write('  </data>\n </layer>\n')
+
+        # object groups are kept in the tree until the end of the file
+        fh.write(' <objectgroup name="objects">\n')
+        for i in range(objects):
+            fh.write('  <object id="{0}" x="{1}" y="{2}" width="16" '
+                     'height="16"/>\n'.format(i + 1, i % 1000, i // 1000))
+        fh.write(' </objectgroup>\n</map>\n')
+
+    parsed_xml = peak_memory(lambda: pytmx.TiledMap(tmx))
+    streamed_xml = peak_memory(lambda: pytmx.TiledMap(tmx, streaming=True))
+    report_memory('TiledMap (TMX, xml)', parsed_xml)
+    report_memory('streaming (TMX, xml)', streamed_xml)
+
+    # the decoded layers must be held anyway; streaming should not need
+    # much more than that, and never more than parsing the whole tree
+    layer_size = width * height * layers * 2 / float(1 << 20)
+    report_memory('decoded xml layers, about', layer_size)
+    if streamed > parsed or streamed_xml > parsed_xml:
+        logger.warning('  streaming used more memory than parsing the tree')
+
+
+@benchmark
+def headless(path):
+    logger.info('Headless loading')
+    tmx, js = make_map(path)
+    report('TiledMap', best_of(lambda: pytmx.TiledMap(tmx)))
+    report('headless', best_of(lambda: pytmx.TiledMap(tmx, headless=True)))
+    report('headless, raw_gids',
+           best_of(lambda: pytmx.TiledMap(tmx, headless=True, raw_gids=True)))
+
+
+@benchmark
+def tileset_lookup(path, count=64):
+    logger.info('get_tileset_from_gid, %d tilesets', count)
+    tiled_map = pytmx.TiledMap()
+    for n in range(count):
+        tileset = pytmx.TiledTileset(tiled_map)
+        tileset.firstgid = n * 100 + 1
+        tiled_map.add_tileset(tileset)
+    gids = [tiled_map.register_gid(n * 100 + 50) for n in range(count)] * 100
+
+    get_tileset_from_gid = tiled_map.get_tileset_from_gid
+    report('{0} lookups'.format(len(gids)),
+           best_of(lambda: [get_tileset_from_gid(gid) for gid in gids]))
+
+
+@benchmark
+def tile_locations(path):
+    logger.info('get_tile_locations_by_gid')
+    tmx, js = make_map(path, width=128, height=128)
+    tiled_map = pytmx.TiledMap(tmx)
+    report('first search, builds the index',
+           best_of(lambda: list(tiled_map.get_tile_locations_by_gid(5)),
+                   repeat=1))
+    report('later searches',
+           best_of(lambda: list(tiled_map.get_tile_locations_by_gid(5))))
+
+
+@benchmark
+def image_threads(path, count=16, size=1 << 22):
+    logger.info('Image loading in threads, %d tilesets', count)
+
+    # zlib releases the GIL while decompressing, like most image decoders
+    rnd = random.Random(0)
+    data = zlib.compress(bytes(bytearray(rnd.randint(0, 15)
+                                         for i in range(size))))
+    tilesets = list()
+    for n in range(count):
+        filename = 'tiles{0}.z'.format(n)
+        with open(os.path.join(path, filename), 'wb') as fh:
+            fh.write(data)
+        tilesets.append(' <tileset firstgid="{0}" name="tiles{1}" '
+                        'tilewidth="16" tileheight="16">\n'
+                        '  <image source="{2}" width="64" height="64"/>\n'
+                        ' </tileset>\n'.format(n * 16 + 1, n, filename))
+
+    tmx = os.path.join(path, 'tilesets.tmx')
+    with open(tmx, 'w') as fh:
+        fh.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<map version="1.0" orientation="orthogonal" width="1" '
+                 'height="1" tilewidth="16" tileheight="16">\n')
+        fh.writelines(tilesets)
+        fh.write('</map>\n')
+
+    def image_loader(filename, colorkey, **kwargs):
+        with open(filename, 'rb') as fh:
+            image = zlib.decompress(fh.read())
+
+        def load(rect=None, flags=None):
+            return len(image), rect, flags
+
+        return load
+
+    kwargs = {'image_loader': image_loader, 'load_all': True}
+    report('serial', best_of(lambda: pytmx.TiledMap(tmx, **kwargs)))
+    for threads in (2, 4, 8):
+        report('image_threads={0}'.format(threads),
+               best_of(lambda: pytmx.TiledMap(tmx, image_threads=threads,
+                                              **kwargs)))
+
+
+@benchmark
+def bulk_queries(path, count=100000):
+    import numpy
+    logger.info('Looking up %d tiles', count)
+    tmx, js = make_map(path)
+    tiled_map = pytmx.TiledMap(tmx)
+    rnd = numpy.random.RandomState(0)
+    xs = rnd.randint(0, tiled_map.width, count)
+    ys = rnd.randint(0, tiled_map.height, count)
+    points = list(zip(xs.tolist(), ys.tolist()))
+
+    get_tile_gid = tiled_map.get_tile_gid
+    report('get_tile_gid', best_of(lambda: [get_tile_gid(x, y, 0)
+                                            for x, y in points]))
+    report('get_tile_gids', best_of(lambda: tiled_map.get_tile_gids(xs, ys, 0)))
+
+    get_tile_properties = tiled_map.get_tile_properties
+    report('get_tile_properties', best_of(
+        lambda: [(get_tile_properties(x, y, 0) or {}).get('name')
+                 for x, y in points]))
+    report('get_tile_property_column', best_of(
+        lambda: tiled_map.get_tile_property_column('name', xs, ys, 0)))
+
+
+@benchmark
+def object_lookup(path, groups=8, count=500):
+    logger.info('Object lookups, %d objects', groups * count)
+    tiled_map = pytmx.TiledMap()
+    for n in range(groups):
+        group = pytmx.TiledObjectGroup(tiled_map)
+        group.name = 'group{0}'.format(n)
+        for i in range(count):
+            obj = pytmx.TiledObject(tiled_map)
+            obj.id = n * count + i + 1
+            obj.name = 'object{0}'.format(obj.id)
+            obj.type = 'type{0}'.format(i % 10)
+            group.append(obj)
+        tiled_map.add_layer(group)
+
+    names = ['object{0}'.format(i * 37 % (groups * count) + 1)
+             for i in range(1000)]
+
+    def scan(name):
+        for obj in tiled_map.objects:
+            if obj.name == name:
+                return obj
+
+    report('1000 names, linear search',
+           best_of(lambda: [scan(name) for name in names]))
+    get_object_by_name = tiled_map.get_object_by_name
+    report('1000 names, get_object_by_name',
+           best_of(lambda: [get_object_by_name(name) for name in names]))
+    report('get_objects_by_type, 1000 times',
+           best_of(lambda: [tiled_map.get_objects_by_type('type3')
+                            for i in range(1000)]))
+
+
+@benchmark
+def object_queries(path, count=2000, queries=1000):
+    logger.info('Object queries, %d objects', count)
+    tiled_map = pytmx.TiledMap()
+    tiled_map.tilewidth = tiled_map.tileheight = 16
+    group = pytmx.TiledObjectGroup(tiled_map)
+    rnd = random.Random(0)
+    for i in range(count):
+        obj = pytmx.TiledObject(tiled_map)
+        obj.x, obj.y = rnd.uniform(0, 8192), rnd.uniform(0, 8192)
+        obj.width, obj.height = rnd.uniform(8, 64), rnd.uniform(8, 64)
+        obj.rotation = rnd.choice((0, 0, 45))
+        group.append(obj)
+    tiled_map.add_layer(group)
+
+    rects = [(rnd.uniform(0, 8192), rnd.uniform(0, 8192), 256, 256)
+             for i in range(queries)]
+    points = [rect[:2] for rect in rects]
+    scan = pytmx.ObjectGrid(group, cell_size=1 << 20)
+    grid = tiled_map.object_grid
+
+    report('building the grid', best_of(lambda: pytmx.ObjectGrid(
+        group, tiled_map.object_grid_cell_size)))
+    report('query_rect, linear scan', best_of(
+        lambda: [scan.query_rect(rect) for rect in rects]))
+    report('query_rect, grid', best_of(
+        lambda: [grid.query_rect(rect) for rect in rects]))
+    report('query_point, linear scan', best_of(
+        lambda: [scan.query_point(x, y) for x, y in points]))
+    report('query_point, grid', best_of(
+        lambda: [grid.query_point(x, y) for x, y in points]))
+    report('nearest, linear scan', best_of(
+        lambda: [scan.nearest(x, y) for x, y in points[:100]]))
+    report('nearest, grid', best_of(
+        lambda: [grid.nearest(x, y) for x, y in points[:100]]))
+
+
+@benchmark
+def visible_tiles(path, views=100):
+    logger.info('Tiles in %d camera rects of 640x480', views)
+    tmx, js = make_map(path)
+    tiled_map = pytmx.TiledMap(tmx)
+    rnd = random.Random(0)
+    rects = [(rnd.randint(0, 7000), rnd.randint(0, 7000), 640, 480)
+             for i in range(views)]
+
+    get_tile_image = tiled_map.get_tile_image
+    tw, th = tiled_map.tilewidth, tiled_map.tileheight
+
+    def per_cell():
+        for x, y, w, h in rects:
+            for layer in tiled_map.visible_tile_layers:
+                for ty in range(y // th, (y + h) // th + 1):
+                    for tx in range(x // tw, (x + w) // tw + 1):
+                        get_tile_image(tx, ty, layer)
+
+    report('get_tile_image for each cell', best_of(per_cell))
+    report('get_visible_tiles', best_of(
+        lambda: [tiled_map.get_visible_tiles(rect) for rect in rects]))
+
+    # most layers of real maps are mostly empty
+    for layer in tiled_map.layers[1:]:
+        for i in range(len(layer.buffer)):
+            if i % 7:
+                layer.buffer[i] = 0
+        for y in range(layer.height):
+            if y % 4:
+                layer.buffer[y * layer.width:(y + 1) * layer.width] = \
+                    array(layer.buffer.typecode, [0]) * layer.width
+        layer.reset_caches()
+    report('get_visible_tiles, sparse layers', best_of(
+        lambda: [tiled_map.get_visible_tiles(rect) for rect in rects]))
+
+
+@benchmark
+def layer_gids(path):
+    from itertools import product
+    logger.info('Tile properties of the gids in a layer')
+    tmx, js = make_map(path)
+    tiled_map = pytmx.TiledMap(tmx)
+    layer = tiled_map.layers[0]
+
+    def every_cell():
+        p = product(range(tiled_map.width), range(tiled_map.height))
+        return set(layer.data[y][x] for x, y in p)
+
+    report('set of every cell', best_of(every_cell))
+    report('first call, counts the cells', best_of(
+        lambda: (layer.reset_caches(),
+                 list(tiled_map.get_tile_properties_by_layer(0)))))
+    report('get_tile_properties_by_layer', best_of(
+        lambda: list(tiled_map.get_tile_properties_by_layer(0)), 100))
+    report('get_tileset_usage', best_of(tiled_map.get_tileset_usage, 100))
+
+
+@benchmark
+def tile_property_queries(path):
+    import tracemalloc
+    logger.info('Cells of tiles with solid=true')
+    tmx, js = make_map(path)
+    tiled_map = pytmx.TiledMap(tmx)
+    for gid in range(1, tiled_map.maxgid):
+        tiled_map.set_tile_properties(gid, {'solid': str(gid % 10 == 0),
+                                            'kind': 'kind{0}'.format(gid % 7)})
+    layer = tiled_map.layers[0]
+
+    def scan():
+        gids = set(gid for gid, props in tiled_map.tile_properties.items()
+                   if props.get('solid') == 'True')
+        return [(x, y) for x, y, gid in layer.iter_data() if gid in gids]
+
+    def query():
+        return tiled_map.get_tile_locations_by_property('solid', 'True', 0)
+
+    report('scan properties, then every cell', best_of(scan))
+    report('first query, builds the indexes', best_of(query, repeat=1))
+    report('later queries', best_of(query, 20))
+
+    # measured separately, as tracing makes everything slower
+    tiled_map.reset_tile_property_index()
+    layer.reset_caches()
+    tracemalloc.start()
+    tiled_map.get_gids_by_property('solid', 'True')
+    size = tracemalloc.get_traced_memory()[0]
+    logger.info('  %-40s %10.1f KB', 'memory of the property index',
+                size / 1024.0)
+    query()
+    logger.info('  %-40s %10.1f KB', 'memory of the layer indexes',
+                (tracemalloc.get_traced_memory()[0] - size) / 1024.0)
+    tracemalloc.stop()
+
+    report('get_gids_by_property', best_of(
+        lambda: tiled_map.get_gids_by_property('kind', 'kind3'), 1000))
+
+
+@benchmark
+def tile_editing(path, count=10000):
+    logger.info('Changing %d tiles', count)
+    tmx, js = make_map(path)
+    tiled_map = pytmx.TiledMap(tmx)
+    layer = tiled_map.layers[0]
+    rnd = random.Random(0)
+    edits = [(rnd.randrange(tiled_map.width), rnd.randrange(tiled_map.height),
+              rnd.randint(0, 300)) for i in range(count)]
+
+    set_tile_gid = tiled_map.set_tile_gid
+    report('set_tile_gid', best_of(
+        lambda: [set_tile_gid(x, y, 0, gid) for x, y, gid in edits]))
+
+    layer.get_locations_by_gid(1)
+    layer.get_gid_counts()
+    tiled_map.get_visible_tiles((0, 0, 640, 480))
+    report('set_tile_gid, layer indexes built', best_of(
+        lambda: [set_tile_gid(x, y, 0, gid) for x, y, gid in edits]))
+    report('fill_rect, 100x100', best_of(
+        lambda: tiled_map.fill_rect((0, 0, 100, 100), 0, 7)))
+    report('paste, 100x100', best_of(
+        lambda: tiled_map.paste(0, 0, 0, [[7, 8, 9, 10] * 25] * 100)))
+    layer.pop_dirty_rects()
+
+
+@benchmark
+def collision_rects(path, size=512):
+    logger.info('Rects of a %dx%d collision layer', size, size)
+    rnd = random.Random(0)
+    points = [(x, y) for x in range(size) for y in range(size)
+              if rnd.random() < 0.6]
+    report('simplify_points, 60% random', best_of(
+        lambda: pytmx.simplify_points(points, 16, 16)))
+
+    points = [(x, y) for x in range(size) for y in range(size)
+              if (x // 8 + y // 8) % 3]
+    report('simplify_points, blocks', best_of(
+        lambda: pytmx.simplify_points(points, 16, 16)))
+
+    tmx, js = make_map(path, width=size, height=size, layers=1)
+    tiled_map = pytmx.TiledMap(tmx)
+    report('build_tile_rects', best_of(
+        lambda: pytmx.build_tile_rects(tiled_map, 0)))
+
+
+def main(names):
+    path = tempfile.mkdtemp()
+    try:
+        for func in benchmarks:
+            if not names or func.__name__ in names:
+                func(path)
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    main(sys.argv[1:])
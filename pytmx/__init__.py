@@ -16,4 +16,4 @@ except ImportError:
 __version__ = (3, 20, 17)
 __author__ = 'bitcraft'
 __author_email__ = 'leif.theden@gmail.com'
-__description__ = 'Map loader for TMX Files - Python 2 and 3'
+__description__ = 'Map loader for TMX Files - Python 3'
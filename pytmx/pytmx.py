@@ -1,14 +1,15 @@
-from __future__ import division
-from __future__ import print_function
-
+import array
+import io
+import json
 import logging
-import six
+import math
 import os
+import sys
+from base64 import b64decode
+from bisect import bisect_left, bisect_right
 from itertools import chain, product
-from collections import defaultdict, namedtuple
+from collections import Counter, defaultdict, namedtuple
 from xml.etree import ElementTree
-from six.moves import zip, map
-from operator import attrgetter
 
 logger = logging.getLogger(__name__)
 ch = logging.StreamHandler()
@@ -23,8 +24,16 @@ __all__ = ['TiledElement',
            'TiledObject',
            'TiledObjectGroup',
            'TiledImageLayer',
+           'ObjectGrid',
            'TileFlags',
+           'TilesetUsage',
+           'TilesetCache',
+           'tileset_cache',
            'convert_to_bool',
+           'load_maps',
+           'build_tile_rects',
+           'simplify_points',
+           'parse_json_properties',
            'parse_properties']
 
 # internal flags
@@ -36,6 +45,7 @@ TRANS_ROT = 4
 GID_TRANS_FLIPX = 1 << 31
 GID_TRANS_FLIPY = 1 << 30
 GID_TRANS_ROT = 1 << 29
+GID_MASK = ~(GID_TRANS_FLIPX | GID_TRANS_FLIPY | GID_TRANS_ROT)
 
 # error message format strings go here
 duplicate_name_fmt = 'Cannot set user {} property on {} "{}"; Tiled property already exists.'
@@ -46,8 +56,56 @@ flag_names = (
     'flipped_diagonally',)
 
 TileFlags = namedtuple('TileFlags', flag_names)
+
+# every possible TileFlags, indexed by the top three bits of a raw gid.
+# shared so that decoding a gid never has to build a new tuple.
+flag_combinations = tuple(TileFlags(bool(i & 4), bool(i & 2), bool(i & 1))
+                          for i in range(8))
+no_flags = flag_combinations[0]
+
+# maps the most significant byte of a raw gid to its index in flag_combinations
+flag_table = bytes(bytearray(i >> 5 for i in range(256)))
+
+# maps the most significant byte of a raw gid to the same byte without flags
+mask_table = bytes(bytearray(i & 0x1f for i in range(256)))
+
 AnimationFrame = namedtuple('AnimationFrame', ['gid', 'duration'])
 
+# how much of a tileset the tile layers of a map use: the number of
+# different tiles, and the number of cells they are in
+TilesetUsage = namedtuple('TilesetUsage', ['tileset', 'tiles', 'cells'])
+
+# layer data in a compact form for pickling: all rows as one byte string
+PackedLayerData = namedtuple('PackedLayerData', ['typecode', 'width',
+                                                 'height', 'raw'])
+
+# everything needed to load a tileset, read from its xml node
+TilesetData = namedtuple('TilesetData', ['items', 'properties', 'tiles',
+                                         'offset', 'image'])
+
+# typecode of an unsigned 32-bit array, used to hold raw gids from TMX data
+gid_typecode = 'I' if array.array('I').itemsize == 4 else 'L'
+
+# typecodes of layer data, from narrowest to widest, and the largest gid
+# each can hold
+layer_typecodes = (('B', 0xff), ('H', 0xffff), (gid_typecode, 0xffffffff))
+layer_typecode_limits = dict(layer_typecodes)
+
+
+def layer_typecode(max_gid):
+    """ Return the narrowest array typecode that can hold pytmx gids
+
+    :param max_gid: largest gid that will be stored
+    :return: 'B', 'H', or the typecode of a 32-bit array
+    """
+    for typecode, limit in layer_typecodes:
+        if max_gid <= limit:
+            return typecode
+
+    msg = 'gid {0} is too large to be stored in a layer'
+    logger.error(msg.format(max_gid))
+    raise ValueError
+
 
 def default_image_loader(filename, flags, **kwargs):
     """ This default image loader just returns filename, rect, and any flags
@@ -58,6 +116,91 @@ def default_image_loader(filename, flags, **kwargs):
     return load
 
 
+class ImageSource(object):
+    """ An image file used by a map, and the tiles that are loaded from it
+
+    The image loader for the file is created the first time it is needed.
+    """
+    __slots__ = ('image_loader', 'filename', 'colorkey', 'kwargs',
+                 'tiles', '_loader')
+
+    def __init__(self, image_loader, filename, colorkey, **kwargs):
+        self.image_loader = image_loader
+        self.filename = filename
+        self.colorkey = colorkey
+        self.kwargs = kwargs
+        self.tiles = list()  # (gid, rect, flags) tuples
+        self._loader = None
+
+    @property
+    def loader(self):
+        """ Function returned by the image loader for this file
+        """
+        if self._loader is None:
+            self._loader = self.image_loader(self.filename, self.colorkey,
+                                             **self.kwargs)
+        return self._loader
+
+    def load(self):
+        """ Load all the tiles from this file
+
+        :return: list of images, in the same order as self.tiles
+        """
+        loader = self.loader
+        return [loader(rect, flags) for gid, rect, flags in self.tiles]
+
+
+class LazyImage(object):
+    """ Placeholder for a tile image that has not been loaded yet
+    """
+    __slots__ = ('source', 'rect', 'flags')
+
+    def __init__(self, source, rect, flags):
+        self.source = source
+        self.rect = rect
+        self.flags = flags
+
+    def load(self):
+        """ Load the image
+
+        :return: whatever the image loader returns for this tile
+        """
+        return self.source.loader(self.rect, self.flags)
+
+
+class LazyImageList(list):
+    """ List of images that loads each image the first time it is used
+
+    This is TiledMap.images when a map is loaded with lazy_images.  Items
+    are LazyImage placeholders until they are read.
+    """
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        item = list.__getitem__(self, index)
+        if isinstance(item, LazyImage):
+            item = item.load()
+            list.__setitem__(self, index, item)
+        return item
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _import_numpy():
+    """ Import numpy, which is only needed for the array methods
+    """
+    try:
+        import numpy
+    except ImportError:
+        logger.error('cannot import numpy (is it installed?)')
+        raise
+    return numpy
+
+
 def decode_gid(raw_gid):
     """ Decode a GID from TMX data
 
@@ -67,12 +210,132 @@ def decode_gid(raw_gid):
     :param raw_gid: 32-bit number from TMX layer data
     :return: gid, flags
     """
-    flags = TileFlags(
-        raw_gid & GID_TRANS_FLIPX == GID_TRANS_FLIPX,
-        raw_gid & GID_TRANS_FLIPY == GID_TRANS_FLIPY,
-        raw_gid & GID_TRANS_ROT == GID_TRANS_ROT)
-    gid = raw_gid & ~(GID_TRANS_FLIPX | GID_TRANS_FLIPY | GID_TRANS_ROT)
-    return gid, flags
+    return raw_gid & GID_MASK, flag_combinations[raw_gid >> 29]
+
+
+def _flag_index(flags):
+    """ Return the index of TileFlags in flag_combinations
+
+    :param flags: TileFlags, or None for no flags
+    """
+    if flags is None:
+        return 0
+    return (bool(flags[0]) << 2) | (bool(flags[1]) << 1) | bool(flags[2])
+
+
+def encode_gid(gid, flags=None):
+    """ Encode a GID and its flags like TMX data, the reverse of decode_gid
+
+    :param gid: GID of a tile in a tileset, without flags
+    :param flags: TileFlags, or None for no flags
+    :return: 32-bit number for TMX layer data
+    """
+    return gid | (_flag_index(flags) << 29)
+
+
+def unpack_flags(raw_gids):
+    """ Return the flip flags of raw gids, as indexes of flag_combinations
+
+    The flags are the top three bits of each gid, so they are read from
+    the most significant byte of each item without any python work for
+    each tile.
+
+    :param raw_gids: array of raw 32-bit gids, as returned by unpack_gids
+    :return: array of bytes, one for each gid
+    """
+    data = memoryview(raw_gids).cast('B')
+    if sys.byteorder == 'little':
+        data = data[3::4]
+    else:
+        data = data[0::4]
+    return array.array('B', data.tobytes().translate(flag_table))
+
+
+def mask_gids(raw_gids, typecode=None):
+    """ Return raw gids without their flip flags, in an array of typecode
+
+    Each gid is split into its bytes with slices, so there is no python
+    work for each tile.
+
+    :param raw_gids: array of raw 32-bit gids, as returned by unpack_gids
+    :param typecode: typecode of the returned array; by default, the
+                     narrowest one that holds every gid
+    :return: array of gids
+    """
+    data = raw_gids.tobytes()
+    little = sys.byteorder == 'little'
+
+    # bytes of every gid, from the least significant to the most
+    planes = [data[i if little else 3 - i::4] for i in range(4)]
+    planes[3] = planes[3].translate(mask_table)
+
+    if typecode is None:
+        typecode = layer_typecodes[0][0]
+        for size, (code, limit) in enumerate(layer_typecodes[1:], 1):
+            if any(plane.count(0) != len(plane) for plane in planes[size:]):
+                typecode = code
+
+    size = array.array(typecode).itemsize
+    out = bytearray(len(data) // 4 * size)
+    for i, plane in enumerate(planes[:size]):
+        out[i if little else size - 1 - i::size] = plane
+
+    gids = array.array(typecode)
+    gids.frombytes(bytes(out))
+    return gids
+
+
+def unpack_gids(text, encoding=None, compression=None):
+    """ Decode the text of a layer's data and return the raw gids in bulk
+
+    Base64 data is read directly into an array of unsigned 32-bit
+    integers, so no python work is done for each tile.  The returned
+    gids still have the Tiled flip flags set; see decode_gid.
+
+    :param text: text of the TMX data node
+    :param encoding: 'base64', 'csv', or None
+    :param compression: 'gzip', 'zlib', or None
+    :return: array of raw 32-bit gids
+    """
+    if encoding == 'base64':
+        data = b64decode(text.strip())
+
+        if compression == 'gzip':
+            import gzip
+
+            with gzip.GzipFile(fileobj=io.BytesIO(data)) as fh:
+                data = fh.read()
+
+        elif compression == 'zlib':
+            import zlib
+
+            data = zlib.decompress(data)
+
+        elif compression:
+            msg = 'TMX compression type: {0} is not supported.'
+            logger.error(msg.format(compression))
+            raise Exception
+
+        gids = array.array(gid_typecode)
+        gids.frombytes(data)
+
+        # TMX data is always little-endian
+        if sys.byteorder == 'big':
+            gids.byteswap()
+
+        return gids
+
+    elif encoding == 'csv':
+        if compression:
+            msg = 'TMX compression type: {0} is not supported for csv.'
+            logger.error(msg.format(compression))
+            raise Exception
+
+        return array.array(gid_typecode, map(int, text.strip().split(',')))
+
+    msg = 'TMX encoding type: {0} is not supported.'
+    logger.error(msg.format(encoding))
+    raise Exception
 
 
 def convert_to_bool(text):
@@ -99,11 +362,17 @@ def convert_to_bool(text):
 
     raise ValueError
 
+
+def _str(value):
+    """ Keep a value as it was read; xml attributes are already str
+    """
+    return value
+
+
 # used to change the unicode string returned from xml to
 # proper python variable types.
-types = defaultdict(lambda: six.u)
+types = defaultdict(lambda: _str)
 
-_str = six.u
 types.update({
     "version": str,
     "orientation": _str,
@@ -130,6 +399,9 @@ types.update({
     "rotation": float,
     "offsetx": float,
     "offsety": float,
+    "infinite": convert_to_bool,
+    "startx": int,
+    "starty": int,
 })
 
 
@@ -146,6 +418,126 @@ def parse_properties(node):
     return d
 
 
+def _json_color(color):
+    """ Return a JSON color in the form used in TMX files ("ff00ff")
+
+    :param color: "#ff00ff", or None
+    :return: text, or None
+    """
+    if color:
+        return color.lstrip('#')
+    return None
+
+
+def parse_json_properties(data):
+    """ Parse a Tiled JSON object and return a dict of its "properties"
+
+    Both the old (dict) and new (list of name/type/value) layouts are
+    supported.  Values are returned as text, the same as parse_properties,
+    so maps behave the same whether loaded from TMX or JSON.
+
+    :param data: dict from a Tiled JSON file
+    :return: dict
+    """
+    properties = data.get('properties', None) or dict()
+    if isinstance(properties, dict):
+        items = properties.items()
+    else:
+        items = ((p['name'], p.get('value')) for p in properties)
+
+    d = dict()
+    for name, value in items:
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif not isinstance(value, str):
+            value = str(value)
+        d[name] = value
+    return d
+
+
+def read_tileset_node(node):
+    """ Read the parts of a Tiled tileset xml node that pytmx uses
+
+    The result does not depend on the map, so it can be shared between
+    all the maps that use an external tileset.
+
+    :param node: etree element
+    :return: TilesetData
+    """
+    tiles = list()
+    for child in node.iter('tile'):
+        anim = child.find('animation')
+        if anim is None:
+            frames = ()
+        else:
+            frames = tuple((int(frame.get('tileid')), int(frame.get('duration')))
+                           for frame in anim.findall('frame'))
+
+        image = child.find('image')
+        if image is not None:
+            image = dict(image.items())
+
+        tiles.append((int(child.get('id')), parse_properties(child),
+                      image, frames))
+
+    offset = node.find('tileoffset')
+    if offset is not None:
+        offset = (offset.get('x', 0), offset.get('y', 0))
+
+    image = node.find('image')
+    if image is not None:
+        image = dict(image.items())
+
+    return TilesetData(node.items(), parse_properties(node), tiles,
+                       offset, image)
+
+
+class TilesetCache(object):
+    """ Process-wide cache of parsed external tilesets (TSX files)
+
+    Tilesets are keyed by absolute path and modification time, so loading
+    many maps that share tilesets parses each of them only once.  Each map
+    still applies its own firstgid to the cached data.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._tilesets = dict()
+
+    def get(self, path):
+        """ Return the TilesetData of a TSX file, parsing it if needed
+
+        :param path: absolute path of the TSX file
+        :rtype: TilesetData
+        :raises: IOError if the file cannot be read
+        """
+        mtime = os.stat(path).st_mtime
+        try:
+            cached_mtime, data = self._tilesets[path]
+        except KeyError:
+            pass
+        else:
+            if cached_mtime == mtime:
+                self.hits += 1
+                return data
+
+        data = read_tileset_node(ElementTree.parse(path).getroot())
+        self._tilesets[path] = mtime, data
+        self.misses += 1
+        return data
+
+    def clear(self):
+        """ Forget all cached tilesets and reset the counters
+        """
+        self._tilesets.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+tileset_cache = TilesetCache()
+
+
 class TiledElement(object):
     """ Base class for all pytmx types
     """
@@ -173,15 +565,7 @@ class TiledElement(object):
             return False
 
         for k, v in items:
-            # i'm not sure why, but this has attr causes problems on python 2.7 with unicode
-            try:
-                # this will be called in py 3+
-                _hasattr = hasattr(self, k)
-            except UnicodeError:
-                # this will be called in py 2.7
-                _hasattr = hasattr(self, k.encode('utf-8'))
-
-            if _hasattr:
+            if hasattr(self, k):
                 msg = duplicate_name_fmt.format(k, self.__class__.__name__, self.name)
                 logger.error(msg)
                 return True
@@ -202,8 +586,16 @@ class TiledElement(object):
         :param node: etree element
         :return: dict
         """
-        self._cast_and_set_attributes_from_node_items(node.items())
-        properties = parse_properties(node)
+        self._set_attributes_and_properties(node.items(),
+                                            parse_properties(node))
+
+    def _set_attributes_and_properties(self, items, properties):
+        """ Set Tiled attributes and user properties, checking their names
+
+        :param items: iterable of (name, value) attributes, not yet cast
+        :param properties: dict of user properties
+        """
+        self._cast_and_set_attributes_from_node_items(items)
         if (not self.allow_duplicate_names and
                 self._contains_invalid_property_name(properties.items())):
             self._log_property_error_message()
@@ -211,9 +603,27 @@ class TiledElement(object):
 
         self.properties = properties
 
+    def _set_json_properties(self, data, skip=()):
+        """ Create dict containing Tiled object attributes from JSON data
+
+        The JSON equivalent of _set_properties.  Values that are lists or
+        objects, and keys in skip, are not set as attributes; the caller
+        is expected to handle them.
+
+        :param data: dict from a Tiled JSON file
+        :param skip: keys that should not be set as attributes
+        """
+        self._set_attributes_and_properties(
+            ((k, v) for k, v in data.items()
+             if k not in skip and k != 'properties'
+             and not isinstance(v, (list, dict))),
+            parse_json_properties(data))
+
     def __getattr__(self, item):
+        # look in __dict__ directly; properties may not exist yet while
+        # the object is being unpickled
         try:
-            return self.properties[item]
+            return self.__dict__['properties'][item]
         except KeyError:
             raise AttributeError
 
@@ -236,6 +646,16 @@ class TiledMap(TiledElement):
         :param invert_y: invert the y axis
         :param load_all_tiles: load all tile images, even if never used
         :param allow_duplicate_names: allow duplicates in objects' metatdata
+        :param streaming: decode tile layers while the file is being read
+        :param lazy_images: load each tile image the first time it is used
+        :param image_threads: number of threads used to load image files
+        :param layers: only load layers with these names, or for which
+                       this function of the layer name returns True
+        :param exclude_layers: do not load layers with these names, or for
+                               which this function returns True
+        :param headless: do not load or prepare any images
+        :param raw_gids: keep the gids of the map file in the layer data, and
+                         the flip flags of each tile in layer.flags
 
         image_loader:
           this must be a reference to a function that will accept a tuple:
@@ -250,6 +670,12 @@ class TiledMap(TiledElement):
         self.optional_gids = kwargs.get('optional_gids', set())
         self.load_all_tiles = kwargs.get('load_all', False)
         self.invert_y = kwargs.get('invert_y', True)
+        self.lazy_images = kwargs.get('lazy_images', False)
+        self.image_threads = kwargs.get('image_threads', None)
+        self.include_layers = kwargs.get('layers', None)
+        self.exclude_layers = kwargs.get('exclude_layers', None)
+        self.headless = kwargs.get('headless', False)
+        self.raw_gids = kwargs.get('raw_gids', False)
 
         # allow duplicate names to be parsed and loaded
         TiledElement.allow_duplicate_names = \
@@ -257,9 +683,42 @@ class TiledMap(TiledElement):
 
         self.layers = list()           # all layers in proper order
         self.tilesets = list()         # TiledTileset objects
+
+        # firstgid of each tileset, sorted, and the tilesets in that order
+        self._firstgids = list()
+        self._tilesets_by_firstgid = list()
+
+        # tileset of each pytmx gid; built when first needed, extended when
+        # gids are registered, and built again if the number of tilesets
+        # changes
+        self._gid_tilesets = None
+        self._gid_tilesets_key = None
+
+        # where images of each pytmx gid are drawn, relative to the cell
+        self._tile_draw_offsets = None
+
+        # property key: {value: sorted gids}; each key is indexed when it
+        # is first searched
+        self._tile_property_index = dict()
+        self._tile_property_count = 0
+
+        # property name: (default, numpy array of the value of each gid)
+        self._tile_property_columns = dict()
+
+        # objects by name, id and type; built when first needed, and
+        # forgotten when object groups change
+        self._object_index = None
+        self._object_layer_count = 0
+        self.indexed_object_properties = set()
+        self._object_property_index = dict()
+        self._object_grid = None
         self.tile_properties = dict()  # tiles that have properties
         self.layernames = dict()
 
+        # properties of every tile in the tilesets, by tiled gid, so tiles
+        # that are first used after loading can get their properties
+        self.tiled_tile_properties = dict()
+
         # only used tiles are actually loaded, so there will be a difference
         # between the GIDs in the Tiled map data (tmx) and the data in this
         # object and the layers.  This dictionary keeps track of that.
@@ -268,8 +727,15 @@ class TiledMap(TiledElement):
         self.tiledgidmap = dict()  # mapping of tiledgid to pytmx gid
         self.maxgid = 1
 
+        # typecode of all layer data, widened as more gids are registered
+        self.layer_typecode = layer_typecodes[0][0]
+
         # should be filled in by a loader function
         self.images = list()
+        self._image_sources = dict()  # ImageSource by filename
+
+        # memory mapped file the layer data was read from; see pytmx.tmxc
+        self._compiled_buffer = None
 
         # defaults from the TMX specification
         self.version = 0.0
@@ -279,16 +745,53 @@ class TiledMap(TiledElement):
         self.tilewidth = 0   # width of a tile in pixels
         self.tileheight = 0  # height of a tile in pixels
         self.background_color = None
+        self.infinite = False
 
         # initialize the gid mapping
         self.imagemap[(0, 0)] = 0
 
         if filename:
-            self.parse_xml(ElementTree.parse(self.filename).getroot())
+            if kwargs.get('streaming', False):
+                self.parse_xml_stream(self.filename)
+            else:
+                self.parse_xml(ElementTree.parse(self.filename).getroot())
 
     def __repr__(self):
         return '<{0}: "{1}">'.format(self.__class__.__name__, self.filename)
 
+    def __getstate__(self):
+        # images are objects of the graphics library and usually cannot be
+        # pickled; call reload_images after unpickling to load them again
+        state = self.__dict__.copy()
+        state['images'] = list()
+        state['_image_sources'] = dict()
+        state['_object_index'] = None
+        state['_object_property_index'] = dict()
+        state['_object_grid'] = None
+        state['_compiled_buffer'] = None
+        state['_tile_property_columns'] = dict()
+
+        # layer filters are only used while loading, and may be functions
+        state['include_layers'] = None
+        state['exclude_layers'] = None
+        return state
+
+    @classmethod
+    def from_json(cls, filename, image_loader=default_image_loader, **kwargs):
+        """ Load a map saved by Tiled in the JSON format
+
+        Accepts the same keyword arguments as the constructor.
+
+        :param filename: filename of tiled JSON map to load
+        :param image_loader: function that will load images
+        :rtype: TiledMap
+        """
+        tiled_map = cls(image_loader=image_loader, **kwargs)
+        tiled_map.filename = filename
+        with open(filename) as fh:
+            data = json.load(fh)
+        return tiled_map.parse_json(data)
+
     # iterate over layers and objects in map
     def __iter__(self):
         return chain(self.layers, self.objects)
@@ -308,24 +811,114 @@ class TiledMap(TiledElement):
         :param node: ElementTree xml node
         :return: self
         """
+        for item in self._parse_xml_steps(node):
+            pass
+
+        self.reload_images()
+        return self
+
+    def _parse_xml_steps(self, node):
+        """ Parse a map from ElementTree xml node, one element at a time
+
+        Images are not loaded.
+
+        :param node: ElementTree xml node
+        :return: generator of each layer and tileset after it is added
+        """
         self._set_properties(node)
         self.background_color = node.get('backgroundcolor',
                                          self.background_color)
 
         # ***         do not change this load order!         *** #
         # ***    gid mapping errors will occur if changed    *** #
+        wanted = self.is_layer_wanted
         for subnode in node.findall('layer'):
-            self.add_layer(TiledTileLayer(self, subnode))
+            if wanted(subnode.get('name')):
+                yield self.add_layer(TiledTileLayer(self, subnode))
 
         for subnode in node.findall('imagelayer'):
-            self.add_layer(TiledImageLayer(self, subnode))
+            if wanted(subnode.get('name')):
+                yield self.add_layer(TiledImageLayer(self, subnode))
 
         for subnode in node.findall('objectgroup'):
-            self.add_layer(TiledObjectGroup(self, subnode))
+            if wanted(subnode.get('name')):
+                yield self.add_layer(TiledObjectGroup(self, subnode))
 
         for subnode in node.findall('tileset'):
-            self.add_tileset(TiledTileset(self, subnode))
+            yield self.add_tileset(TiledTileset(self, subnode))
+
+        self._post_load()
+
+    def parse_json(self, data):
+        """ Parse a map from a dict read from a Tiled JSON file
+
+        :param data: dict
+        :return: self
+        """
+        for item in self._parse_json_steps(data):
+            pass
+
+        self.reload_images()
+        return self
+
+    def _parse_json_steps(self, data):
+        """ Parse a map from a Tiled JSON dict, one element at a time
+
+        Images are not loaded.
+
+        :param data: dict
+        :return: generator of each layer and tileset after it is added
+        """
+        self._set_json_properties(data, ('backgroundcolor',))
+        self.height = int(self.height)
+        self.width = int(self.width)
+        self.background_color = data.get('backgroundcolor',
+                                         self.background_color)
+
+        # ***         do not change this load order!         *** #
+        # ***    gid mapping errors will occur if changed    *** #
+        layers = [item for item in data.get('layers', list())
+                  if self.is_layer_wanted(item.get('name'))]
+        for item in layers:
+            if item.get('type') == 'tilelayer':
+                yield self.add_layer(TiledTileLayer(self).parse_json(item))
+
+        for item in layers:
+            if item.get('type') == 'imagelayer':
+                yield self.add_layer(TiledImageLayer(self).parse_json(item))
+
+        for item in layers:
+            if item.get('type') == 'objectgroup':
+                yield self.add_layer(TiledObjectGroup(self).parse_json(item))
 
+        for item in data.get('tilesets', list()):
+            yield self.add_tileset(TiledTileset(self).parse_json(item))
+
+        self._post_load()
+
+    def is_layer_wanted(self, name):
+        """ Check a layer name against the layers and exclude_layers options
+
+        Layers that are not wanted are skipped while parsing: their data is
+        not decoded and their gids are not registered.
+
+        :param name: name of the layer
+        :rtype: bool
+        """
+        for names, result in ((self.include_layers, False),
+                              (self.exclude_layers, True)):
+            if names is None:
+                continue
+            if callable(names):
+                if bool(names(name)) is result:
+                    return False
+            elif (name in names) is result:
+                return False
+        return True
+
+    def _post_load(self):
+        """ Finish loading after all layers and tilesets have been parsed
+        """
         # "tile objects", objects with a GID, have need to have their attributes
         # set after the tileset is loaded, so this step must be performed last
         # also, this step is performed for objects to load their tiles.
@@ -356,8 +949,81 @@ class TiledMap(TiledElement):
                 o.tileheight = tileset.tileheight
                 o.tilewidth = tileset.tilewidth
 
-        self.reload_images()
-        return self
+    def parse_xml_stream(self, source):
+        """ Parse a map from a TMX file without holding all of it in memory
+
+        Tile layers are decoded as soon as they have been read, and then
+        discarded from the xml tree.  Tiles of xml encoded layers are
+        consumed one by one, so peak memory stays close to the size of
+        the decoded layers.  The rest of the map is small and is passed
+        to parse_xml once the file has been read.
+
+        :param source: filename or file object of the TMX map
+        :return: self
+        """
+        path = list()  # currently open elements, starting with the map
+        gids = None
+        skip = False   # True while in a layer that is not wanted
+
+        for event, elem in ElementTree.iterparse(source, ('start', 'end')):
+            if event == 'start':
+                if not path:
+                    self.infinite = convert_to_bool(elem.get('infinite', '0'))
+                elif len(path) == 1 and elem.tag == 'layer':
+                    skip = not self.is_layer_wanted(elem.get('name'))
+                path.append(elem)
+                continue
+
+            path.pop()
+            depth = len(path)
+            if depth < 1 or depth > 3:
+                continue
+
+            parent = path[-1]
+            if depth == 3:
+                if elem.tag == 'tile' and parent.tag == 'data':
+                    if not skip:
+                        if gids is None:
+                            gids = array.array(gid_typecode)
+                        gids.append(int(elem.get('gid', 0)))
+
+                    # the parser may already be ahead of the events, so this
+                    # tile is not always the last child.  consumed tiles are
+                    # removed though, so it will be found near the front.
+                    parent.remove(elem)
+
+            elif depth == 2:
+                if elem.tag == 'data' and parent.tag == 'layer' and skip:
+                    elem.clear()
+
+                # chunks of infinite maps are decoded by the layer later
+                elif (elem.tag == 'data' and parent.tag == 'layer' and
+                        not self.infinite and elem.find('chunk') is None):
+                    encoding = elem.get('encoding', None)
+                    if encoding:
+                        gids = unpack_gids(elem.text, encoding,
+                                           elem.get('compression', None))
+                    elif gids is None:
+                        gids = array.array(gid_typecode)
+                    elem.clear()
+
+            elif elem.tag == 'layer':
+                if skip:
+                    parent.remove(elem)
+                    continue
+
+                if gids is None:
+                    layer = TiledTileLayer(self, elem)
+                else:
+                    layer = TiledTileLayer(self)
+                    layer._set_properties(elem)
+                    layer._load_gids(gids)
+                self.add_layer(layer)
+                gids = None
+                parent.remove(elem)
+
+        # tile layers are removed, so this will load everything else
+        return self.parse_xml(elem)
 
     def reload_images(self):
         """ Load the map images from disk
@@ -366,9 +1032,106 @@ class TiledMap(TiledElement):
         to do the loading or will use a generic default, in which case no
         images will be loaded.
 
+        With lazy_images, images are not loaded here.  Instead, the images
+        list holds placeholders which are loaded when first accessed.
+
+        With image_threads, each image file is loaded in a thread pool of
+        that size.  The images end up the same as when loaded serially.
+
+        Headless maps have no images, so only the gids of the tileset
+        tiles that must be loaded are registered.
+
         :return: None
         """
+        self._register_tileset_gids()
+        if self.headless:
+            return
+
+        sources = self._collect_image_sources()
+
+        if self.lazy_images:
+            self._set_lazy_images(sources)
+            return
+
+        if self.image_threads and len(sources) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(self.image_threads) as executor:
+                loaded = list(executor.map(ImageSource.load, sources))
+        else:
+            loaded = [source.load() for source in sources]
+
+        self._set_images(sources, loaded)
+
+    def _set_images(self, sources, loaded):
+        """ Fill the images list from loaded image sources
+
+        :param sources: list of ImageSource
+        :param loaded: list of images returned by ImageSource.load()
+        """
+        # sources are applied in order; later ones may replace some images
+        self._image_sources = dict((i.filename, i) for i in sources)
         self.images = [None] * self.maxgid
+        for source, images in zip(sources, loaded):
+            for (gid, rect, flags), image in zip(source.tiles, images):
+                self.images[gid] = image
+
+    def _set_lazy_images(self, sources):
+        """ Fill the images list with placeholders for the image sources
+
+        :param sources: list of ImageSource
+        """
+        self._image_sources = dict((i.filename, i) for i in sources)
+        self.images = LazyImageList([None] * self.maxgid)
+        for source in sources:
+            for gid, rect, flags in source.tiles:
+                list.__setitem__(self.images, gid,
+                                 LazyImage(source, rect, flags))
+
+    def _register_tileset_gids(self):
+        """ Register the tileset tiles that are loaded even if not used
+
+        With load_all_tiles or raw_gids, every tile of the tilesets is
+        registered, including tiles that have their own image, otherwise
+        only the optional_gids.  Images are not needed for this, so it is
+        also done for headless maps.
+        """
+        if self.load_all_tiles or self.raw_gids:
+            # tiles with their own image are only found in the properties
+            wanted = set(self.tiled_tile_properties)
+            for ts in self.tilesets:
+
+                # skip tilesets without a source
+                if ts.source is None:
+                    continue
+
+                columns, rows = ts._get_grid_size()
+                wanted.update(range(ts.firstgid,
+                                    ts.firstgid + columns * rows))
+
+        elif self.optional_gids:
+            wanted = set(self.optional_gids)
+        else:
+            return
+
+        # gidmap is a defaultdict; get does not add empty entries
+        gidmap = self.gidmap
+        # TODO: handle flags? - might never be an issue, though
+        new = [self.register_gid(real_gid) for real_gid in sorted(wanted)
+               if not gidmap.get(real_gid)]
+        if new:
+            self._load_new_gids(new)
+
+    def _collect_image_sources(self):
+        """ Find every image file used by the map, and the gids it provides
+
+        Gids of image layers are registered here.  Tiles that are loaded
+        even if they are not used are registered by _register_tileset_gids.
+
+        :rtype: list of ImageSource, in the order they must be loaded
+        """
+        sources = list()
+        dirname = os.path.dirname(self.filename or '')
 
         # iterate through tilesets to get source images
         for ts in self.tilesets:
@@ -377,9 +1140,10 @@ class TiledMap(TiledElement):
             if ts.source is None:
                 continue
 
-            path = os.path.join(os.path.dirname(self.filename), ts.source)
+            path = os.path.join(dirname, ts.source)
             colorkey = getattr(ts, 'trans', None)
-            loader = self.image_loader(path, colorkey, tileset=ts)
+            source = ImageSource(self.image_loader, path, colorkey, tileset=ts)
+            sources.append(source)
 
             p = product(range(ts.margin,
                               ts.height + ts.margin - ts.tileheight + 1,
@@ -391,33 +1155,25 @@ class TiledMap(TiledElement):
             # iterate through the tiles
             for real_gid, (y, x) in enumerate(p, ts.firstgid):
                 rect = (x, y, ts.tilewidth, ts.tileheight)
-                gids = self.map_gid(real_gid)
-
-                # gids is None if the tile is never used
-                # but give another chance to load the gid anyway
-                if gids is None:
-                    if self.load_all_tiles or real_gid in self.optional_gids:
-                        # TODO: handle flags? - might never be an issue, though
-                        gids = [self.register_gid(real_gid, flags=0)]
-
-                if gids:
-                    # flags might rotate/flip the image, so let the loader
-                    # handle that here
-                    for gid, flags in gids:
-                        self.images[gid] = loader(rect, flags)
+                # flags might rotate/flip the image, so let the loader
+                # handle that here
+                for gid, flags in self.gidmap.get(real_gid, ()):
+                    source.tiles.append((gid, rect, flags))
 
         # load image layer images
         for layer in (i for i in self.layers if isinstance(i, TiledImageLayer)):
             source = getattr(layer, 'source', None)
             if source:
                 colorkey = getattr(layer, 'trans', None)
-                real_gid = len(self.images)
-                gid = self.register_gid(real_gid)
-                layer.gid = gid
-                path = os.path.join(os.path.dirname(self.filename), source)
-                loader = self.image_loader(path, colorkey)
-                image = loader()
-                self.images.append(image)
+
+                # keep the gid if the images are being reloaded
+                if not layer.gid:
+                    layer.gid = self.register_gid(self.maxgid)
+
+                path = os.path.join(dirname, source)
+                source = ImageSource(self.image_loader, path, colorkey)
+                source.tiles.append((layer.gid, None, None))
+                sources.append(source)
 
         # load images in tiles.
         # instead of making a new gid, replace the reference to the tile that
@@ -426,10 +1182,12 @@ class TiledMap(TiledElement):
             source = props.get('source', None)
             if source:
                 colorkey = props.get('trans', None)
-                path = os.path.join(os.path.dirname(self.filename), source)
-                loader = self.image_loader(path, colorkey)
-                image = loader()
-                self.images[real_gid] = image
+                path = os.path.join(dirname, source)
+                source = ImageSource(self.image_loader, path, colorkey)
+                source.tiles.append((real_gid, None, None))
+                sources.append(source)
+
+        return sources
 
     def get_tile_image(self, x, y, layer):
         """ Return the tile image for this location
@@ -440,7 +1198,7 @@ class TiledMap(TiledElement):
         :rtype: surface if found, otherwise 0
         """
         try:
-            assert (x >= 0 and y >= 0)
+            assert (self.infinite or (x >= 0 and y >= 0))
         except AssertionError:
             raise ValueError
 
@@ -463,6 +1221,147 @@ class TiledMap(TiledElement):
         else:
             return self.get_tile_image_by_gid(gid)
 
+    def get_visible_tiles(self, rect, in_tiles=False):
+        """ Return the tiles of the visible tile layers inside a rect
+
+        The tiles are a draw list for a camera: the position of each tile
+        image in pixels, including the offsets of the layer and tileset, in
+        the order they should be drawn.  Tiles taller than the map's tiles
+        are drawn up from the bottom of their cell, like Tiled does.  Empty
+        rows and the empty ends of rows are skipped without reading them.
+
+        Headless maps have no images, so they raise ValueError.
+
+        :param rect: (x, y, width, height) in pixels, or in tiles
+        :param in_tiles: True if rect is in tiles
+        :rtype: list of (x, y, image) tuples
+        """
+        if self.headless:
+            msg = 'Map {0} is headless and has no images to draw'
+            logger.error(msg.format(self.filename))
+            raise ValueError
+
+        tw, th = self.tilewidth, self.tileheight
+        x, y, width, height = rect
+        view_right = x + width
+        view_bottom = y + height
+        images = self.images
+
+        draw = list()
+        append = draw.append
+        for layer in self.visible_layers:
+            if not isinstance(layer, TiledTileLayer):
+                continue
+
+            ox, oy = layer.offsetx, layer.offsety
+
+            # chunks of infinite maps may register gids when they are
+            # decoded; if that changes the overhang, the rows are read again
+            offsets = None
+            while offsets is not self._get_tile_draw_offsets():
+                offsets = self._get_tile_draw_offsets()
+                if in_tiles:
+                    x1, y1 = int(x), int(y)
+                    x2, y2 = x1 + int(width), y1 + int(height)
+                else:
+                    # cells whose images, which may be larger than the
+                    # cell, overlap the rect
+                    left, top, right, bottom = offsets[3] or (0, 0, 0, 0)
+                    x1 = int(math.floor((x - ox - right) / tw))
+                    y1 = int(math.floor((y - oy - bottom) / th))
+                    x2 = int(math.ceil((x + width - ox + left) / tw))
+                    y2 = int(math.ceil((y + height - oy + top) / th))
+                rows = list(layer._rows_in_rect(x1, y1, x2, y2))
+
+            # if images are not the size of their cells, cells at the edges
+            # are checked one at a time
+            offsetx, offsety, sizes, overhang = offsets
+            clip = overhang is not None and not in_tiles
+
+            for tx, ty, row in rows:
+                px = tx * tw + ox
+                py = ty * th + oy
+                if overhang is None:
+                    for gid in row:
+                        if gid:
+                            append((px, py, images[gid]))
+                        px += tw
+                    continue
+
+                for gid in row:
+                    if gid:
+                        ix = px + offsetx[gid]
+                        iy = py + offsety[gid]
+                        if clip:
+                            iw, ih = sizes[gid]
+                            if (ix >= view_right or iy >= view_bottom or
+                                    ix + iw <= x or iy + ih <= y):
+                                px += tw
+                                continue
+                        append((ix, iy, images[gid]))
+                    px += tw
+
+        return draw
+
+    def _get_tile_draw_offsets(self):
+        """ Return where the image of each gid is drawn, relative to its cell
+
+        :return: (list of x offsets, list of y offsets, list of (width,
+                 height), (left, top, right, bottom) largest distance an
+                 image reaches past its cell, or None if every image is
+                 drawn exactly in its cell)
+        """
+        # the offsets are forgotten when the gid tileset table is rebuilt
+        table = self._get_gid_tilesets()
+        offsets = self._tile_draw_offsets
+        if offsets is None:
+            offsets = self._build_tile_draw_offsets(table)
+        return offsets
+
+    def _build_tile_draw_offsets(self, table):
+        tw, th = self.tilewidth, self.tileheight
+        self._tile_draw_offsets = ([0] * self.maxgid, [0] * self.maxgid,
+                                   [(tw, th)] * self.maxgid, None)
+        for gid, tileset in enumerate(table):
+            if tileset is not None:
+                self._add_tile_draw_offset(gid, tileset)
+        return self._tile_draw_offsets
+
+    def _add_tile_draw_offset(self, gid, tileset):
+        """ Set where the image of a gid is drawn, relative to its cell
+
+        The offsets are replaced by a new tuple only if the overhang
+        changes; otherwise the lists are changed in place.
+
+        :param gid: pytmx gid, which may be past the end of the lists
+        :param tileset: TiledTileset of the gid, or None
+        """
+        offsetx, offsety, sizes, overhang = self._tile_draw_offsets
+        tw, th = self.tilewidth, self.tileheight
+        missing = self.maxgid - len(offsetx)
+        if missing > 0:
+            offsetx.extend([0] * missing)
+            offsety.extend([0] * missing)
+            sizes.extend([(tw, th)] * missing)
+
+        if tileset is None:
+            return
+
+        dx = int(tileset.offset[0])
+        dy = int(tileset.offset[1]) + th - tileset.tileheight
+        size = tileset.tilewidth, tileset.tileheight
+        if not dx and not dy and size == (tw, th):
+            return
+
+        offsetx[gid] = dx
+        offsety[gid] = dy
+        sizes[gid] = size
+        left, top, right, bottom = overhang or (0, 0, 0, 0)
+        reach = (max(left, -dx), max(top, -dy),
+                 max(right, dx + size[0] - tw), max(bottom, dy + size[1] - th))
+        if reach != overhang:
+            self._tile_draw_offsets = (offsetx, offsety, sizes, reach)
+
     def get_tile_image_by_gid(self, gid):
         """ Return the tile image for this location
 
@@ -490,7 +1389,7 @@ class TiledMap(TiledElement):
         :rtype: surface if found, otherwise ValueError
         """
         try:
-            assert (x >= 0 and y >= 0 and layer >= 0)
+            assert (layer >= 0 and (self.infinite or (x >= 0 and y >= 0)))
         except AssertionError:
             raise ValueError
 
@@ -501,6 +1400,56 @@ class TiledMap(TiledElement):
             logger.debug(msg, (x, y, layer))
             raise ValueError
 
+    def get_tile_flags(self, x, y, layer):
+        """ Return the flip flags of the tile at this location
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :param layer: layer number
+        :rtype: TileFlags, otherwise ValueError
+        """
+        try:
+            assert (layer >= 0 and (self.infinite or (x >= 0 and y >= 0)))
+        except AssertionError:
+            raise ValueError
+
+        x, y = int(x), int(y)
+        try:
+            layer = self.layers[int(layer)]
+            if not self.raw_gids:
+                gid = layer.data[y][x]
+                return self.get_tile_flags_by_gid(gid)
+            elif isinstance(layer.data, ChunkedLayerData):
+                return flag_combinations[layer.data.get_flags(x, y)]
+            elif x < layer.width:
+                return flag_combinations[layer.flags[y * layer.width + x]]
+            raise IndexError
+        except (IndexError, ValueError):
+            msg = "Coords: ({0},{1}) in layer {2} is invalid"
+            logger.debug(msg.format(x, y, layer))
+            raise ValueError
+
+    def get_tile_flags_by_gid(self, gid):
+        """ Return the flip flags of a GID
+
+        With raw_gids, GIDs have no flags; see get_tile_flags.
+
+        :param gid: GID
+        :rtype: TileFlags, otherwise ValueError
+        """
+        if not gid:
+            return no_flags
+
+        try:
+            tiled_gid = self.tiledgidmap[gid]
+        except KeyError:
+            raise ValueError
+
+        for pytmx_gid, flags in self.gidmap[tiled_gid]:
+            if pytmx_gid == gid:
+                return flags
+        raise ValueError
+
     def get_tile_properties(self, x, y, layer):
         """ Return the tile image GID for this location
 
@@ -510,7 +1459,7 @@ class TiledMap(TiledElement):
         :rtype: python dict if found, otherwise None
         """
         try:
-            assert (x >= 0 and y >= 0 and layer >= 0)
+            assert (layer >= 0 and (self.infinite or (x >= 0 and y >= 0)))
         except AssertionError:
             raise ValueError
 
@@ -531,26 +1480,217 @@ class TiledMap(TiledElement):
             except KeyError:
                 return None
 
+    def get_tile_gids(self, xs, ys, layer):
+        """ Return the GIDs of many locations at once, as a numpy array
+
+        This is the bulk version of get_tile_gid, for arrays of
+        coordinates.  Requires numpy.
+
+        :param xs: array-like of x coordinates
+        :param ys: array-like of y coordinates, same shape as xs
+        :param layer: layer number
+        :rtype: numpy array of GIDs, same shape as xs and ys
+        """
+        numpy = _import_numpy()
+        try:
+            layer = self.layers[int(layer)]
+        except IndexError:
+            raise ValueError
+
+        xs, ys = numpy.broadcast_arrays(numpy.asarray(xs, dtype=int),
+                                        numpy.asarray(ys, dtype=int))
+
+        if isinstance(layer.data, ChunkedLayerData):
+            get_gid = layer.data.get_gid
+            gids = [get_gid(x, y) for x, y in zip(xs.ravel().tolist(),
+                                                  ys.ravel().tolist())]
+            return numpy.array(gids, dtype=self.layer_typecode).reshape(
+                xs.shape)
+
+        if xs.size and (xs.min() < 0 or ys.min() < 0 or
+                        xs.max() >= layer.width or ys.max() >= layer.height):
+            msg = "Coords in layer {0} are out of range"
+            logger.debug(msg.format(layer))
+            raise ValueError
+
+        return layer.as_array()[ys, xs]
+
+    def get_tile_property_column(self, name, xs, ys, layer, default=None):
+        """ Return one tile property of many locations, as a numpy array
+
+        The property is looked up for each GID, and then gathered for all
+        locations at once.  Requires numpy.
+
+        The values of each property are kept in an array indexed by GID,
+        which is rebuilt when GIDs are registered or tile properties are
+        set with set_tile_properties.  After changing the properties of a
+        tile directly, call reset_tile_property_index.
+
+        :param name: name of the tile property
+        :param xs: array-like of x coordinates
+        :param ys: array-like of y coordinates, same shape as xs
+        :param layer: layer number
+        :param default: value for tiles without the property
+        :rtype: numpy array of values, same shape as xs and ys
+        """
+        numpy = _import_numpy()
+        if self._tile_property_count != len(self.tile_properties):
+            self.reset_tile_property_index()
+
+        cached = self._tile_property_columns.get(name, None)
+        if (cached is not None and type(cached[0]) is type(default) and
+                cached[0] == default):
+            column = cached[1]
+        else:
+            values = [default] * self.maxgid
+            for gid, props in self.tile_properties.items():
+                if name in props:
+                    values[gid] = props[name]
+            column = numpy.array(values)
+            self._tile_property_columns[name] = default, column
+
+        return column[self.get_tile_gids(xs, ys, layer)]
+
     def get_tile_locations_by_gid(self, gid):
         """ Search map for tile locations by the GID
 
         Return (int, int, int) tuples, where the layer is index of
-        the visible tile layers.
+        the visible tile layers.  Locations are in layer order, then row
+        by row.
 
-        Note: Not a fast operation.  Cache results if used often.
+        Each layer builds an index of the locations of every GID the
+        first time it is searched, so later searches are fast.
 
         :param gid: GID to be searched for
         :rtype: generator of tile locations
         """
-        # use this func to make sure GID is valid
-        self.get_tile_image_by_gid(gid)
+        gid = int(gid)
+        if not 0 <= gid < self.maxgid:
+            msg = "GID {0} is not used in this map"
+            logger.debug(msg.format(gid))
+            raise ValueError
+
+        layers = self.layers
+        return ((x, y, l) for l in self.visible_tile_layers
+                for x, y in layers[l].get_locations_by_gid(gid))
+
+    def register_tile(self, tiled_gid, flags=None):
+        """ Return the pytmx GID of a tile, registering it if it is new
+
+        New tiles get their properties, and their images if the images of
+        the map are loaded, so they can be used right away.
+
+        :param tiled_gid: GID of the tile in Tiled, without flags
+        :param flags: TileFlags, or None
+        :rtype: pytmx GID
+        """
+        tiled_gid = int(tiled_gid)
+        if tiled_gid:
+            try:
+                self._get_tileset_from_tiled_gid(tiled_gid)
+            except ValueError:
+                msg = "GID {0} is not in a tileset"
+                logger.debug(msg.format(tiled_gid))
+                raise
+
+            # with raw_gids, register_gids only removes the flags
+            if self.raw_gids:
+                self.register_gid(tiled_gid)
+
+        raw = array.array(gid_typecode, [encode_gid(tiled_gid, flags)])
+        return self.register_gids(raw)[0]
+
+    def set_tile_gid(self, x, y, layer, tiled_gid, flags=None):
+        """ Change the tile at a location
+
+        Unlike changing layer data directly, this registers the tile,
+        keeps the indexes of the layer up to date and adds the tile to the
+        dirty_rects of the layer.
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :param layer: layer number
+        :param tiled_gid: GID of the tile in Tiled, without flags, or 0
+        :param flags: TileFlags, or None
+        :rtype: pytmx GID of the tile
+        """
+        tile_layer = self._get_tile_layer(layer)
+        gid = self.register_tile(tiled_gid, flags)
+        tile_layer.set_gid(x, y, gid, flags)
+        return gid
+
+    def fill_rect(self, rect, layer, tiled_gid, flags=None):
+        """ Change every tile in a rect to the same tile
 
-        p = product(range(self.width),
-                    range(self.height),
-                    self.visible_tile_layers)
+        :param rect: (x, y, width, height) in tiles
+        :param layer: layer number
+        :param tiled_gid: GID of the tile in Tiled, without flags, or 0
+        :param flags: TileFlags, or None
+        :rtype: pytmx GID of the tile
+        """
+        x, y, width, height = [int(i) for i in rect]
+        tile_layer = self._get_tile_layer(layer)
+        tile_layer._check_area(x, y, width, height)
+        gid = self.register_tile(tiled_gid, flags)
+
+        tile_layer.add_dirty_rect(x, y, width, height)
+        set_gid = tile_layer.set_gid
+        for ty in range(y, y + height):
+            for tx in range(x, x + width):
+                set_gid(tx, ty, gid, flags)
+        return gid
+
+    def paste(self, x, y, layer, tiles, skip_empty=False):
+        """ Copy rows of tiles into a layer
+
+        The tiles are GIDs as in TMX data, with the flip flags in the top
+        bits; see encode_gid.  Rows may have different lengths.
+
+        :param x: x coordinate of the first column
+        :param y: y coordinate of the first row
+        :param layer: layer number
+        :param tiles: sequence of rows of GIDs
+        :param skip_empty: do not copy tiles that are 0, like a stamp
+        """
+        x, y = int(x), int(y)
+        rows = [array.array(gid_typecode, row) for row in tiles]
+        if not rows:
+            return
+
+        width = max(len(row) for row in rows)
+        tile_layer = self._get_tile_layer(layer)
+        tile_layer._check_area(x, y, width, len(rows))
+
+        raw = array.array(gid_typecode, chain(*rows))
+        for tiled_gid in set(mask_gids(raw)):
+            if tiled_gid:
+                self._get_tileset_from_tiled_gid(tiled_gid)
+                if self.raw_gids:
+                    self.register_gid(tiled_gid)
+        gids = self.register_gids(raw)
+        flags = unpack_flags(raw)
+
+        tile_layer.add_dirty_rect(x, y, width, len(rows))
+        set_gid = tile_layer.set_gid
+        i = 0
+        for ty, row in enumerate(rows, y):
+            for tx in range(x, x + len(row)):
+                gid = gids[i]
+                if gid or not skip_empty:
+                    set_gid(tx, ty, gid, flag_combinations[flags[i]])
+                i += 1
+
+    def _get_tile_layer(self, layer):
+        try:
+            tile_layer = self.layers[int(layer)]
+        except (IndexError, TypeError):
+            tile_layer = None
 
-        return ((x, y, l) for (x, y, l) in p if
-                self.layers[l].data[y][x] == gid)
+        if not isinstance(tile_layer, TiledTileLayer):
+            msg = "Layer {0} is not a tile layer"
+            logger.debug(msg.format(layer))
+            raise ValueError
+        return tile_layer
 
     def get_tile_properties_by_gid(self, gid):
         """ Get the tile properties of a tile GID
@@ -570,6 +1710,77 @@ class TiledMap(TiledElement):
         :param properties: python dict of properties for GID
         """
         self.tile_properties[gid] = properties
+        self.reset_tile_property_index()
+
+    def get_gids_by_property(self, key, value):
+        """ Return the GIDs of tiles with a property set to value
+
+        Each property is indexed the first time it is searched, so later
+        searches are a dict lookup.  The index is forgotten when tile
+        properties are set with set_tile_properties; after changing the
+        properties of a tile directly, call reset_tile_property_index.
+
+        :param key: name of the property
+        :param value: value of the property
+        :rtype: list of GIDs, sorted
+        """
+        if self._tile_property_count != len(self.tile_properties):
+            self.reset_tile_property_index()
+
+        index = self._tile_property_index.get(key, None)
+        if index is None:
+            index = defaultdict(list)
+            for gid, props in sorted(self.tile_properties.items()):
+                try:
+                    index[props[key]].append(gid)
+                except (KeyError, TypeError):
+                    continue
+            index = self._tile_property_index[key] = dict(index)
+
+        try:
+            return list(index.get(value, ()))
+        except TypeError:
+            # values like animation frames cannot be indexed
+            return [gid for gid, props in sorted(self.tile_properties.items())
+                    if key in props and props[key] == value]
+
+    def get_tile_locations_by_property(self, key, value, layer=None):
+        """ Search map for the tiles with a property set to value
+
+        Uses the index of get_gids_by_property, then the GIDs used by each
+        layer and the locations of each GID in the layer, so only cells
+        with matching tiles are visited.
+
+        :param key: name of the property
+        :param value: value of the property
+        :param layer: layer number, or None for all visible tile layers
+        :rtype: dict of layer number: list of (x, y) tuples, row by row
+        """
+        if layer is None:
+            layers = list(self.visible_tile_layers)
+        else:
+            layers = [int(layer)]
+
+        # counting decodes the chunks of infinite maps, which may give
+        # new gids their properties, so it is done before the search
+        used_gids = [self.layers[i].used_gids() for i in layers]
+        gids = self.get_gids_by_property(key, value)
+
+        found = dict()
+        for i, used in zip(layers, used_gids):
+            found[i] = self.layers[i].get_locations_by_gids(
+                [gid for gid in gids if gid in used])
+        return found
+
+    def reset_tile_property_index(self):
+        """ Forget the index and the columns of tile properties
+
+        Only needed after changing the properties of a tile directly.  It
+        will be rebuilt when needed.
+        """
+        self._tile_property_index = dict()
+        self._tile_property_count = len(self.tile_properties)
+        self._tile_property_columns = dict()
 
     def get_tile_properties_by_layer(self, layer):
         """ Get the tile properties of each GID in layer
@@ -585,19 +1796,49 @@ class TiledMap(TiledElement):
             logger.debug(msg.format(type(layer)))
             raise ValueError
 
-        p = product(range(self.width), range(self.height))
-        layergids = set(self.layers[layer].data[y][x] for x, y in p)
-
-        for gid in layergids:
+        for gid in self.layers[layer].used_gids():
             try:
                 yield gid, self.tile_properties[gid]
             except KeyError:
                 continue
 
+    def get_tileset_usage(self, layers=None):
+        """ Report how much of each tileset the tile layers use
+
+        Flipped and rotated tiles count as the same tile.  Tilesets that
+        are not used are included, with no tiles and no cells.
+
+        :param layers: layer numbers to count, or None for all tile layers
+        :rtype: list of TilesetUsage, in the order of self.tilesets
+        """
+        if layers is None:
+            layers = [layer for layer in self.layers
+                      if isinstance(layer, TiledTileLayer)]
+        else:
+            layers = [self.layers[int(i)] for i in layers]
+
+        counts = Counter()
+        for layer in layers:
+            counts.update(layer.get_gid_counts())
+
+        tiles = defaultdict(set)
+        cells = Counter()
+        for gid, count in counts.items():
+            try:
+                tileset = self.get_tileset_from_gid(gid)
+            except ValueError:
+                continue
+            tiles[tileset].add(self.tiledgidmap[gid])
+            cells[tileset] += count
+
+        return [TilesetUsage(tileset, len(tiles[tileset]), cells[tileset])
+                for tileset in self.tilesets]
+
     def add_layer(self, layer):
         """ Add a layer (TileTileLayer, TiledImageLayer, or TiledObjectGroup)
 
         :param layer: TileTileLayer, TiledImageLayer, TiledObjectGroup object
+        :return: the layer
         """
         assert (
             isinstance(layer,
@@ -605,15 +1846,26 @@ class TiledMap(TiledElement):
 
         self.layers.append(layer)
         self.layernames[layer.name] = layer
+        if isinstance(layer, TiledObjectGroup):
+            self.reset_object_indexes()
+        return layer
 
     def add_tileset(self, tileset):
         """ Add a tileset to the map
 
         :param tileset: TiledTileset
+        :return: the tileset
         """
         assert (isinstance(tileset, TiledTileset))
         self.tilesets.append(tileset)
 
+        # tilesets with the same firstgid are found in the order added
+        i = bisect_left(self._firstgids, tileset.firstgid)
+        self._firstgids.insert(i, tileset.firstgid)
+        self._tilesets_by_firstgid.insert(i, tileset)
+        self._gid_tilesets_key = None
+        return tileset
+
     def get_layer_by_name(self, name):
         """Return a layer by name
 
@@ -630,34 +1882,231 @@ class TiledMap(TiledElement):
     def get_object_by_name(self, name):
         """Find an object
 
+        If more than one object has the name, the first one is returned.
+
         :param name: Name of object.  Case-sensitive.
         :rtype: Object if found, otherwise ValueError
         """
+        try:
+            return self._get_object_index()['name'][name][0]
+        except KeyError:
+            raise ValueError
+
+    def get_objects_by_name(self, name):
+        """Return all objects with a name, in map order
+
+        :param name: Name of objects.  Case-sensitive.
+        :rtype: list of TiledObject
+        """
+        return list(self._get_object_index()['name'].get(name, ()))
+
+    def get_object_by_id(self, object_id):
+        """Find an object by its unique id
+
+        :param object_id: id of the object, set by Tiled
+        :rtype: Object if found, otherwise ValueError
+        """
+        try:
+            return self._get_object_index()['id'][object_id]
+        except KeyError:
+            raise ValueError
+
+    def get_objects_by_type(self, object_type):
+        """Return all objects of a type, in map order
+
+        :param object_type: type of objects.  Case-sensitive.
+        :rtype: list of TiledObject
+        """
+        return list(self._get_object_index()['type'].get(object_type, ()))
+
+    def index_object_property(self, key):
+        """Keep an index of objects by the value of a property
+
+        Makes get_objects_by_property a dict lookup for this property.
+        Without an index, get_objects_by_property checks every object.
+
+        :param key: name of the property
+        """
+        self.indexed_object_properties.add(key)
+
+    def get_objects_by_property(self, key, value):
+        """Return all objects with a property set to value, in map order
+
+        :param key: name of the property
+        :param value: value of the property
+        :rtype: list of TiledObject
+        """
+        if key not in self.indexed_object_properties:
+            return [obj for obj in self.objects
+                    if key in obj.properties and obj.properties[key] == value]
+
+        self._get_object_index()
+        index = self._object_property_index.get(key, None)
+        if index is None:
+            index = self._object_property_index[key] = defaultdict(list)
+            for obj in self.objects:
+                if key in obj.properties:
+                    index[obj.properties[key]].append(obj)
+
+        return list(index.get(value, ()))
+
+    def reset_object_indexes(self):
+        """ Forget the indexes of objects
+
+        Object groups do this when they are changed.  Only needed after
+        changing the name, id, type or properties of an object, or after
+        changing TiledMap.layers directly.  They will be rebuilt when needed.
+        """
+        self._object_index = None
+        self._object_property_index = dict()
+        self._object_grid = None
+
+    def _check_object_layers(self):
+        # layers may have been added or removed without add_layer
+        if self._object_layer_count != len(self.layers):
+            self.reset_object_indexes()
+            self._object_layer_count = len(self.layers)
+
+    def _get_object_index(self):
+        """ Return the indexes of objects by name, id and type
+
+        :rtype: dict of dicts
+        """
+        self._check_object_layers()
+        index = self._object_index
+        if index is None:
+            index = self._build_object_index()
+        return index
+
+    @property
+    def object_grid(self):
+        """ObjectGrid of all the objects in the map, made when first used
+
+        :rtype: ObjectGrid
+        """
+        self._check_object_layers()
+        if self._object_grid is None:
+            self._object_grid = ObjectGrid(self.objects,
+                                           self.object_grid_cell_size)
+        return self._object_grid
+
+    @property
+    def object_grid_cell_size(self):
+        """Size of the cells of object grids, four tiles by default
+
+        :rtype: int
+        """
+        return max(self.tilewidth, self.tileheight, 16) * 4
+
+    def _build_object_index(self):
+        by_name = defaultdict(list)
+        by_id = dict()
+        by_type = defaultdict(list)
         for obj in self.objects:
-            if obj.name == name:
-                return obj
-        raise ValueError
+            by_name[obj.name].append(obj)
+            by_type[obj.type].append(obj)
+            object_id = getattr(obj, 'id', None)
+            if object_id is not None:
+                by_id.setdefault(object_id, obj)
+
+        self._object_index = {'name': dict(by_name), 'id': by_id,
+                              'type': dict(by_type)}
+        return self._object_index
 
     def get_tileset_from_gid(self, gid):
         """ Return tileset that owns the gid
 
-        Note: this is a slow operation, so if you are expecting to do this
-              often, it would be worthwhile to cache the results of this.
+        The tileset of every gid is looked up once and kept in a table, so
+        this is a list lookup.
 
         :param gid: gid of tile image
         :rtype: TiledTileset if found, otherwise ValueError
         """
+        table = self._get_gid_tilesets()
         try:
-            tiled_gid = self.tiledgidmap[gid]
-        except KeyError:
+            tileset = table[gid] if gid > 0 else None
+        except (IndexError, TypeError):
             raise ValueError
 
-        for tileset in sorted(self.tilesets, key=attrgetter('firstgid'),
-                              reverse=True):
-            if tiled_gid >= tileset.firstgid:
-                return tileset
+        if tileset is None:
+            raise ValueError
+        return tileset
 
-        raise ValueError
+    def _get_gid_tilesets(self):
+        """ Return the table of the tileset of each pytmx gid
+
+        :rtype: list of TiledTileset or None, indexed by gid
+        """
+        if self._gid_tilesets_key != len(self.tilesets):
+            self._build_gid_tilesets()
+        return self._gid_tilesets
+
+    def _build_gid_tilesets(self):
+        """ Make the table of the tileset of each pytmx gid
+
+        :rtype: list of TiledTileset or None, indexed by gid
+        """
+        get_tileset = self._get_tileset_from_tiled_gid
+        tiledgidmap = self.tiledgidmap
+        table = [None] * self.maxgid
+        for gid in range(1, self.maxgid):
+            try:
+                table[gid] = get_tileset(tiledgidmap[gid])
+            except (KeyError, ValueError):
+                pass
+
+        self._gid_tilesets = table
+        self._gid_tilesets_key = len(self.tilesets)
+        self._tile_draw_offsets = None
+        return table
+
+    def _add_gid_tileset(self, gid):
+        """ Add a newly registered gid to the table of gid tilesets
+
+        :param gid: pytmx gid, which may be past the end of the table
+        """
+        table = self._gid_tilesets
+        table.extend([None] * (self.maxgid - len(table)))
+        try:
+            table[gid] = self._get_tileset_from_tiled_gid(self.tiledgidmap[gid])
+        except (KeyError, ValueError):
+            pass
+
+        if self._tile_draw_offsets is not None:
+            self._add_tile_draw_offset(gid, table[gid])
+
+    def _get_tileset_from_tiled_gid(self, tiled_gid):
+        """ Return tileset that owns the gid found in TMX data
+
+        :param tiled_gid: GID that is found in TMX data
+        :rtype: TiledTileset if found, otherwise ValueError
+        """
+        if len(self._firstgids) != len(self.tilesets):
+            self._index_tilesets()
+
+        i = bisect_right(self._firstgids, tiled_gid) - 1
+        if i < 0:
+            raise ValueError
+        return self._tilesets_by_firstgid[i]
+
+    def _index_tilesets(self):
+        """ Sort the tilesets by firstgid, if they were not added with
+        add_tileset
+        """
+        pairs = sorted(enumerate(self.tilesets),
+                       key=lambda i: (i[1].firstgid, -i[0]))
+        self._firstgids = [tileset.firstgid for i, tileset in pairs]
+        self._tilesets_by_firstgid = [tileset for i, tileset in pairs]
+        self._gid_tilesets_key = None
+
+    def reset_tileset_index(self):
+        """ Forget which tileset each GID belongs to
+
+        Tilesets added with add_tileset or appended to self.tilesets are
+        found without this.  Call it after changing the firstgid of a
+        tileset, or after replacing tilesets in self.tilesets.
+        """
+        self._index_tilesets()
 
     @property
     def objectgroups(self):
@@ -705,11 +2154,23 @@ class TiledMap(TiledElement):
     def register_gid(self, tiled_gid, flags=None):
         """ Used to manage the mapping of GIDs between the tmx and pytmx
 
+        With raw_gids, the pytmx GID is the same as the tiled GID, flags
+        are ignored, and every tile of the tilesets is registered.
+
         :param tiled_gid: GID that is found in TMX data
         :rtype: GID that pytmx uses for the the GID passed
         """
-        if flags is None:
-            flags = TileFlags(0, 0, 0)
+        if flags is None or self.raw_gids:
+            flags = no_flags
+
+        if tiled_gid and self.raw_gids:
+            if (tiled_gid, flags) not in self.imagemap:
+                self.maxgid = max(self.maxgid, tiled_gid + 1)
+                self.imagemap[(tiled_gid, flags)] = (tiled_gid, flags)
+                self.gidmap[tiled_gid].append((tiled_gid, flags))
+                self.tiledgidmap[tiled_gid] = tiled_gid
+                self._add_gid(tiled_gid)
+            return tiled_gid
 
         if tiled_gid:
             try:
@@ -720,11 +2181,159 @@ class TiledMap(TiledElement):
                 self.imagemap[(tiled_gid, flags)] = (gid, flags)
                 self.gidmap[tiled_gid].append((gid, flags))
                 self.tiledgidmap[gid] = tiled_gid
+                self._add_gid(gid)
                 return gid
 
         else:
             return 0
 
+    def register_gids(self, raw_gids):
+        """ Register all the raw gids of a layer and return the pytmx gids
+
+        Only the distinct values are decoded and registered, so a layer
+        with millions of cells but few different tiles costs only a few
+        python calls.  The layer is then remapped through a translation
+        table in one pass.
+
+        :param raw_gids: sequence of 32-bit gids from TMX data, flags set
+        :rtype: array of pytmx gids, in the same order as raw_gids
+        """
+        if self.raw_gids:
+            return self._mask_gids(raw_gids)
+
+        register_gid = self.register_gid
+        imagemap = self.imagemap
+        lut = dict()
+        new = list()
+        for raw_gid in dict.fromkeys(raw_gids):
+            tiled_gid, flags = decode_gid(raw_gid)
+            known = not tiled_gid or (tiled_gid, flags) in imagemap
+            lut[raw_gid] = gid = register_gid(tiled_gid, flags)
+            if not known:
+                new.append(gid)
+
+        if new:
+            self._load_new_gids(new)
+
+        return array.array(self.layer_typecode, map(lut.__getitem__, raw_gids))
+
+    def _mask_gids(self, raw_gids):
+        """ Return the gids of a layer for a map loaded with raw_gids
+
+        Every tile of every tileset is registered with raw_gids, so the
+        gids in the layer are not registered one by one.  Only the flags
+        are removed.
+
+        :param raw_gids: sequence of 32-bit gids from TMX data, flags set
+        :rtype: array of tiled gids, in the same order as raw_gids
+        """
+        if not isinstance(raw_gids, array.array):
+            raw_gids = array.array(gid_typecode, raw_gids)
+
+        gids = mask_gids(raw_gids)
+        order = [code for code, limit in layer_typecodes]
+        if order.index(gids.typecode) > order.index(self.layer_typecode):
+            self._widen_layers(gids.typecode)
+        elif gids.typecode != self.layer_typecode:
+            gids = mask_gids(raw_gids, self.layer_typecode)
+        return gids
+
+    def _add_gid(self, gid):
+        """ Update the tables indexed by gid after a gid is registered
+
+        Layer data is widened if it cannot hold the gid.
+
+        :param gid: pytmx gid that was registered
+        """
+        if self._gid_tilesets_key == len(self.tilesets):
+            self._add_gid_tileset(gid)
+        if self._tile_property_columns:
+            self._tile_property_columns = dict()
+        if gid > layer_typecode_limits[self.layer_typecode]:
+            self._widen_layers(layer_typecode(gid))
+
+    def _widen_layers(self, typecode):
+        """ Change the typecode of all layer data to a wider one
+
+        Layers use the narrowest typecode that can hold every gid of the
+        map.  Registering more gids may need a wider one; this is rare, so
+        the data of every layer is simply copied.
+
+        :param typecode: new typecode of the layer data
+        """
+        self.layer_typecode = typecode
+        for layer in self.layers:
+            if not isinstance(layer, TiledTileLayer):
+                continue
+
+            data = layer.data
+            if isinstance(data, ChunkedLayerData):
+                for key, chunk in data.chunks.items():
+                    if not isinstance(chunk, tuple):
+                        data.chunks[key] = array.array(typecode, chunk)
+            else:
+                layer._set_buffer(array.array(typecode, layer.buffer))
+
+    def _load_new_gids(self, gids):
+        """ Set the properties and images of newly registered gids
+
+        Gids are usually all registered before the images are loaded, but
+        chunks of infinite maps are only decoded when they are first used.
+        Their tiles may not have been seen before, so they are given their
+        properties and images here.
+
+        :param gids: pytmx gids that were registered
+        """
+        for gid in gids:
+            props = self.tiled_tile_properties.get(self.tiledgidmap[gid])
+            if props is not None:
+                self.set_tile_properties(gid, props)
+
+        # images are not loaded yet; reload_images will do it
+        if not self.images:
+            return
+
+        dirname = os.path.dirname(self.filename or '')
+        lazy = isinstance(self.images, LazyImageList)
+        self.images.extend([None] * (self.maxgid - len(self.images)))
+
+        for gid in gids:
+            tiled_gid = self.tiledgidmap[gid]
+            props = self.tile_properties.get(gid, dict())
+            kwargs = dict()
+
+            if props.get('source', None):
+                path = os.path.join(dirname, props['source'])
+                colorkey = props.get('trans', None)
+                rect = flags = None
+
+            else:
+                try:
+                    ts = self._get_tileset_from_tiled_gid(tiled_gid)
+                except ValueError:
+                    continue
+
+                rect = ts._get_tile_rect(tiled_gid - ts.firstgid)
+                if ts.source is None or rect is None:
+                    continue
+
+                path = os.path.join(dirname, ts.source)
+                colorkey = getattr(ts, 'trans', None)
+                kwargs['tileset'] = ts
+                flags = [f for g, f in self.gidmap[tiled_gid] if g == gid][0]
+
+            source = self._image_sources.get(path, None)
+            if source is None:
+                source = ImageSource(self.image_loader, path, colorkey,
+                                     **kwargs)
+                self._image_sources[path] = source
+
+            if lazy:
+                list.__setitem__(self.images, gid,
+                                 LazyImage(source, rect, flags))
+            else:
+                self.images[gid] = source.loader(rect, flags)
+
     def map_gid(self, tiled_gid):
         """ Used to lookup a GID read from a TMX file's data
 
@@ -748,11 +2357,14 @@ class TiledTileset(TiledElement):
     be the same after loaded.
     """
 
-    def __init__(self, parent, node):
+    def __init__(self, parent, node=None):
         TiledElement.__init__(self)
         self.parent = parent
         self.offset = (0, 0)
 
+        # absolute path of the tsx file, if this is an external tileset
+        self.external_source = None
+
         # defaults from the specification
         self.firstgid = 0
         self.source = None
@@ -765,19 +2377,19 @@ class TiledTileset(TiledElement):
         self.width = 0
         self.height = 0
 
-        self.parse_xml(node)
+        if node is not None:
+            self.parse_xml(node)
 
     def parse_xml(self, node):
         """ Parse a Tileset from ElementTree xml element
 
         A bit of mangling is done here so that tilesets that have external
-        TSX files appear the same as those that don't
+        TSX files appear the same as those that don't.  External tilesets
+        are read through tileset_cache, so each is parsed only once.
 
         :param node: ElementTree element
         :return: self
         """
-        import os
-
         # if true, then node references an external tileset
         source = node.get('source', None)
         if source:
@@ -790,113 +2402,801 @@ class TiledTileset(TiledElement):
                 dirname = os.path.dirname(self.parent.filename)
                 path = os.path.abspath(os.path.join(dirname, source))
                 try:
-                    node = ElementTree.parse(path).getroot()
+                    data = tileset_cache.get(path)
                 except IOError:
                     msg = "Cannot load external tileset: {0}"
                     logger.error(msg.format(path))
                     raise Exception
 
+                self.external_source = path
+
             else:
                 msg = "Found external tileset, but cannot handle type: {0}"
                 logger.error(msg.format(self.source))
                 raise Exception
 
-        self._set_properties(node)
+        else:
+            data = read_tileset_node(node)
 
-        # since tile objects [probably] don't have a lot of metadata,
-        # we store it separately in the parent (a TiledMap instance)
-        register_gid = self.parent.register_gid
-        for child in node.getiterator('tile'):
-            tiled_gid = int(child.get("id"))
-            p = parse_properties(child)
-
-            # handle tiles that have their own image
-            image = child.find('image')
-            if image is None:
-                p['width'] = self.tilewidth
-                p['height'] = self.tileheight
-            else:
-                p['source'] = image.get('source')
-                p['trans'] = image.get('trans', None)
-                p['width'] = image.get('width')
-                p['height'] = image.get('height')
-
-            # handle tiles with animations
-            anim = child.find('animation')
-            frames = list()
-            p['frames'] = frames
-            if anim is not None:
-                for frame in anim.findall("frame"):
-                    duration = int(frame.get('duration'))
-                    gid = register_gid(int(frame.get('tileid')) + self.firstgid)
-                    frames.append(AnimationFrame(gid, duration))
-
-            for gid, flags in self.parent.map_gid(tiled_gid + self.firstgid):
-                self.parent.set_tile_properties(gid, p)
+        return self._load_tileset_data(data)
+
+    def _load_tileset_data(self, data):
+        """ Load a tileset from the data read from its xml node
+
+        :param data: TilesetData, which may be shared with other maps
+        :return: self
+        """
+        self._set_attributes_and_properties(data.items, dict(data.properties))
+
+        for tile_id, properties, image, frames in data.tiles:
+            self._add_tile(tile_id, dict(properties), image, frames)
 
         # handle the optional 'tileoffset' node
-        self.offset = node.find('tileoffset')
-        if self.offset is None:
-            self.offset = (0, 0)
-        else:
-            self.offset = (self.offset.get('x', 0), self.offset.get('y', 0))
+        if data.offset is not None:
+            self.offset = data.offset
 
-        image_node = node.find('image')
-        if image_node is not None:
-            self.source = image_node.get('source')
-            self.trans = image_node.get('trans', None)
-            self.width = int(image_node.get('width'))
-            self.height = int(image_node.get('height'))
+        if data.image is not None:
+            self.source = data.image.get('source')
+            self.trans = data.image.get('trans', None)
+            self.width = int(data.image.get('width'))
+            self.height = int(data.image.get('height'))
 
         return self
 
+    def parse_json(self, data):
+        """ Parse a Tileset from a dict read from a Tiled JSON file
 
-class TiledTileLayer(TiledElement):
-    """ Represents a TileLayer
-
-    To just get the tile images, use TiledTileLayer.tiles()
-    """
+        :param data: dict
+        :return: self
+        """
+        source = data.get('source', None)
+        if source:
+            # external tsx tilesets are the same for both formats
+            if source[-4:].lower() == '.tsx':
+                node = ElementTree.Element('tileset',
+                                           firstgid=str(data['firstgid']),
+                                           source=source)
+                return self.parse_xml(node)
+
+            dirname = os.path.dirname(self.parent.filename)
+            path = os.path.abspath(os.path.join(dirname, source))
+            try:
+                with open(path) as fh:
+                    external = json.load(fh)
+            except IOError:
+                msg = "Cannot load external tileset: {0}"
+                logger.error(msg.format(path))
+                raise Exception
 
-    def __init__(self, parent, node):
-        TiledElement.__init__(self)
-        self.parent = parent
-        self.data = list()
+            external['firstgid'] = data['firstgid']
+            data = external
+            self.external_source = path
 
-        # defaults from the specification
-        self.name = None
-        self.offsetx = 0
-        self.offsety = 0
-        self.opacity = 1.0
-        self.visible = True
-        self.height = 0
-        self.width = 0
+        self._set_json_properties(data, ('image', 'imagewidth', 'imageheight',
+                                         'transparentcolor'))
 
-        self.parse_xml(node)
+        tiles = data.get('tiles', None) or list()
+        if isinstance(tiles, dict):
+            # older versions of tiled store tiles as a dict keyed by id
+            tiles = [dict(tile, id=int(i)) for i, tile in tiles.items()]
+        else:
+            tiles = list(tiles)
+
+        # older versions of tiled also store tile properties separately
+        tile_properties = data.get('tileproperties', dict())
+        seen = set(tile['id'] for tile in tiles)
+        tiles.extend({'id': int(i)} for i in tile_properties
+                     if int(i) not in seen)
+
+        for tile in tiles:
+            tile_id = tile['id']
+            p = parse_json_properties(tile)
+            p.update(parse_json_properties(
+                {'properties': tile_properties.get(str(tile_id))}))
+
+            image = None
+            if 'image' in tile:
+                image = {'source': tile['image'],
+                         'trans': _json_color(tile.get('transparentcolor')),
+                         'width': tile.get('imagewidth'),
+                         'height': tile.get('imageheight')}
+
+            frames = [(frame['tileid'], frame['duration'])
+                      for frame in tile.get('animation', ())]
+
+            self._add_tile(tile_id, p, image, frames)
+
+        offset = data.get('tileoffset', None)
+        if offset is not None:
+            self.offset = (offset.get('x', 0), offset.get('y', 0))
+
+        if 'image' in data:
+            self.source = data['image']
+            self.trans = _json_color(data.get('transparentcolor'))
+            self.width = int(data['imagewidth'])
+            self.height = int(data['imageheight'])
 
-    def __iter__(self):
-        return self.iter_data()
+        return self
 
-    def iter_data(self):
-        """ Iterate over layer data
+    def _add_tile(self, tile_id, properties, image, frames):
+        """ Store the metadata of a tile from this tileset in the parent
 
-        Yields X, Y, GID tuples for each tile in the layer
+        since tile objects [probably] don't have a lot of metadata,
+        we store it separately in the parent (a TiledMap instance)
 
-        :return: Generator
+        :param tile_id: id of the tile in this tileset
+        :param properties: dict of tile properties; will be modified
+        :param image: dict with the tile's own image attributes, or None
+        :param frames: sequence of (tile id, duration) animation frames
         """
-        for y, x in product(range(self.height), range(self.width)):
-            yield x, y, self.data[y][x]
+        p = properties
 
-    def tiles(self):
-        """ Iterate over tile images of this layer
+        # handle tiles that have their own image
+        if image is None:
+            p['width'] = self.tilewidth
+            p['height'] = self.tileheight
+        else:
+            p['source'] = image.get('source')
+            p['trans'] = image.get('trans', None)
+            p['width'] = image.get('width')
+            p['height'] = image.get('height')
 
-        This is an optimised generator function that returns
-        (tile_x, tile_y, tile_image) tuples,
+        # handle tiles with animations
+        register_gid = self.parent.register_gid
+        p['frames'] = [AnimationFrame(register_gid(tileid + self.firstgid),
+                                      duration)
+                       for tileid, duration in frames]
 
-        :rtype: Generator
-        :return: (x, y, image) tuples
-        """
+        self.parent.tiled_tile_properties[tile_id + self.firstgid] = p
+        if self.parent.raw_gids:
+            self.parent.set_tile_properties(tile_id + self.firstgid, p)
+            return
+
+        for gid, flags in self.parent.map_gid(tile_id + self.firstgid):
+            self.parent.set_tile_properties(gid, p)
+
+    def _get_grid_size(self):
+        """ Return the number of tiles in the tileset image
+
+        :rtype: (columns, rows)
+        """
+        columns = len(range(self.margin,
+                            self.width + self.margin - self.tilewidth + 1,
+                            self.tilewidth + self.spacing))
+        rows = len(range(self.margin,
+                         self.height + self.margin - self.tileheight + 1,
+                         self.tileheight + self.spacing))
+        return columns, rows
+
+    def _get_tile_rect(self, tile_id):
+        """ Return the area of a tile in the tileset image
+
+        :param tile_id: id of the tile in this tileset
+        :rtype: (x, y, width, height), or None if the tile is not in the image
+        """
+        step_x = self.tilewidth + self.spacing
+        step_y = self.tileheight + self.spacing
+        columns, rows = self._get_grid_size()
+
+        if not 0 <= tile_id < columns * rows:
+            return None
+
+        y, x = divmod(tile_id, columns)
+        return (self.margin + x * step_x, self.margin + y * step_y,
+                self.tilewidth, self.tileheight)
+
+
+class ChunkedLayerData(object):
+    """ Sparse data of a tile layer in an infinite map
+
+    Infinite maps are saved by Tiled in chunks, and only chunks that have
+    tiles are saved.  Chunks are stored in a dict by their position, so
+    empty parts of the map take no memory and any cell is found in
+    constant time.
+
+    Each chunk is kept as it was read from the map until one of its cells
+    is first used; only then is it decoded and its gids registered.
+
+    Cells are read with data[y][x] like other layers, but x and y are map
+    coordinates and may be negative.  Cells outside of every chunk are 0.
+    Rows cannot be iterated; use TiledTileLayer.iter_data instead.
+    """
+
+    # an infinite map has no last row
+    __iter__ = None
+
+    def __init__(self, parent, chunk_width, chunk_height):
+        self.parent = parent
+        self.chunk_width = chunk_width
+        self.chunk_height = chunk_height
+
+        # chunk position, in chunks: decoded array, or (encoding,
+        # compression, data) if the chunk has not been used yet
+        self.chunks = dict()
+
+        # chunk position: flags of each cell, for maps loaded with raw_gids
+        self.flags = dict()
+
+    def __getitem__(self, y):
+        return ChunkedLayerRow(self, y)
+
+    def add_chunk(self, x, y, data, encoding=None, compression=None):
+        """ Add a chunk, without decoding it
+
+        :param x: x coordinate of the first cell of the chunk
+        :param y: y coordinate of the first cell of the chunk
+        :param data: encoded data, or sequence of raw gids if not encoded
+        :param encoding: 'base64', 'csv', or None
+        :param compression: 'gzip', 'zlib', or None
+        """
+        if x % self.chunk_width or y % self.chunk_height:
+            msg = 'chunk at ({0}, {1}) is not aligned to chunk size {2}x{3}'
+            logger.error(msg.format(x, y, self.chunk_width, self.chunk_height))
+            raise Exception
+
+        key = x // self.chunk_width, y // self.chunk_height
+        self.chunks[key] = encoding, compression, data
+
+    def get_chunk(self, key):
+        """ Return the cells of a chunk, decoding it if needed
+
+        :param key: position of the chunk, in chunks
+        :rtype: array of pytmx gids, one row after another
+        """
+        chunk = self.chunks[key]
+        if isinstance(chunk, tuple):
+            encoding, compression, data = chunk
+            if encoding:
+                gids = unpack_gids(data, encoding, compression)
+            else:
+                gids = array.array(gid_typecode, data)
+
+            size = self.chunk_width * self.chunk_height
+            if len(gids) != size:
+                msg = 'chunk {0} has {1} tiles, expected {2}'
+                logger.error(msg.format(key, len(gids), size))
+                raise Exception
+
+            if self.parent.raw_gids:
+                self.flags[key] = unpack_flags(gids)
+            chunk = self.parent.register_gids(gids)
+            self.chunks[key] = chunk
+        return chunk
+
+    def get_gid(self, x, y):
+        """ Return the pytmx gid of a cell
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :rtype: gid, or 0 if there is no chunk at that cell
+        """
+        width = self.chunk_width
+        height = self.chunk_height
+        key = x // width, y // height
+        if key not in self.chunks:
+            return 0
+        return self.get_chunk(key)[(y % height) * width + x % width]
+
+    def get_flags(self, x, y):
+        """ Return the flip flags of a cell, for maps loaded with raw_gids
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :rtype: index of flag_combinations, or 0 if there is no chunk there
+        """
+        width = self.chunk_width
+        height = self.chunk_height
+        key = x // width, y // height
+        if key not in self.chunks:
+            return 0
+        self.get_chunk(key)
+        return self.flags[key][(y % height) * width + x % width]
+
+    def set_gid(self, x, y, gid, flags=0):
+        """ Change the pytmx gid of a cell, adding a chunk if needed
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :param gid: pytmx gid
+        :param flags: index of flag_combinations, kept with raw_gids
+        :return: the gid that was replaced
+        """
+        width = self.chunk_width
+        height = self.chunk_height
+        key = x // width, y // height
+        if key not in self.chunks:
+            size = width * height
+            self.chunks[key] = array.array(self.parent.layer_typecode,
+                                           [0]) * size
+            if self.parent.raw_gids:
+                self.flags[key] = array.array('B', [0]) * size
+
+        chunk = self.get_chunk(key)
+        i = (y % height) * width + x % width
+        old = chunk[i]
+        chunk[i] = gid
+        if self.parent.raw_gids:
+            self.flags[key][i] = flags
+        return old
+
+    def iter_chunks(self):
+        """ Iterate over the chunks, decoding them
+
+        Chunks are ordered by row, then by column.
+
+        :return: (x, y, chunk) tuples, x and y of the chunk's first cell
+        """
+        for key in sorted(self.chunks, key=lambda i: (i[1], i[0])):
+            yield (key[0] * self.chunk_width, key[1] * self.chunk_height,
+                   self.get_chunk(key))
+
+
+class ChunkedLayerRow(object):
+    """ A row of ChunkedLayerData, so cells can be read with data[y][x]
+    """
+    __slots__ = ('data', 'y')
+
+    # rows of an infinite map have no end
+    __iter__ = None
+
+    def __init__(self, data, y):
+        self.data = data
+        self.y = y
+
+    def __getitem__(self, x):
+        return self.data.get_gid(x, self.y)
+
+
+class TiledTileLayer(TiledElement):
+    """ Represents a TileLayer
+
+    To just get the tile images, use TiledTileLayer.tiles()
+    """
+
+    def __init__(self, parent, node=None):
+        TiledElement.__init__(self)
+        self.parent = parent
+        self.data = list()    # rows; each is a memoryview of the buffer
+        self.buffer = None    # array of every cell, one row after another
+        self.flags = None     # flags of every cell, if loaded with raw_gids
+
+        # gid: sorted array of packed locations; built when first needed
+        self._gid_index = None
+
+        # (first x, last x + 1) of the tiles in each row, or None for
+        # empty rows; built when first needed
+        self._row_spans = None
+
+        # gid: number of cells with the gid; built when first needed
+        self._gid_counts = None
+
+        # (x, y, width, height) of areas changed by set_gid, in tiles
+        self.dirty_rects = list()
+
+        # defaults from the specification
+        self.name = None
+        self.offsetx = 0
+        self.offsety = 0
+        self.opacity = 1.0
+        self.visible = True
+        self.height = 0
+        self.width = 0
+        self.startx = 0
+        self.starty = 0
+
+        if node is not None:
+            self.parse_xml(node)
+
+    def __iter__(self):
+        return self.iter_data()
+
+    def __getstate__(self):
+        # memoryviews cannot be pickled; send the buffer as bytes
+        state = self.__dict__.copy()
+        state['_gid_index'] = None
+        state['_row_spans'] = None
+        state['_gid_counts'] = None
+        buf = state.pop('buffer')
+        if buf is None:
+            return state
+
+        if isinstance(buf, memoryview):
+            typecode = buf.format
+        else:
+            typecode = buf.typecode
+        state['data'] = PackedLayerData(typecode, self.width, self.height,
+                                        buf.tobytes())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.buffer = None
+        data = state['data']
+        if isinstance(data, PackedLayerData):
+            buf = array.array(data.typecode)
+            buf.frombytes(data.raw)
+            self._set_buffer(buf)
+
+        # the compiled cache gives the buffer directly
+        elif isinstance(data, (array.array, memoryview)):
+            self._set_buffer(data)
+
+    def _set_buffer(self, buf):
+        """ Use an array of all cells as the layer data
+
+        Rows in self.data are memoryviews of the buffer, so they are not
+        copies, and changing a cell in a row changes the buffer.
+
+        :param buf: array or memoryview of width * height pytmx gids
+        """
+        view = memoryview(buf)
+        width = self.width
+        self.buffer = buf
+        self.data = tuple(view[y * width:(y + 1) * width]
+                          for y in range(self.height))
+
+    def as_array(self):
+        """ Return the layer data as a numpy array, without copying
+
+        The array has the shape (height, width), so it is indexed by
+        [y, x].  It shares memory with the layer, so changing the array
+        changes the layer.  Requires numpy.
+
+        :rtype: numpy array of GIDs
+        """
+        if self.buffer is None:
+            msg = 'layer "{0}" has no buffer; infinite layers are not arrays'
+            logger.error(msg.format(self.name))
+            raise ValueError
+
+        numpy = _import_numpy()
+        return numpy.asarray(memoryview(self.buffer)).reshape(self.height,
+                                                              self.width)
+
+    def set_gid(self, x, y, gid, flags=None):
+        """ Change the GID of a tile
+
+        Unlike changing layer.data directly, this keeps the indexes of the
+        layer up to date, and adds the tile to dirty_rects if it changed.
+        Layers of infinite maps get a new chunk if there is none at the
+        location.
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :param gid: pytmx GID, already registered with the map
+        :param flags: TileFlags of the tile; only used with raw_gids, where
+                      the flags are not part of the GID
+        :return: the GID that was replaced
+        """
+        x, y, gid = int(x), int(y), int(gid)
+        if not 0 <= gid < self.parent.maxgid:
+            msg = "GID {0} is not registered"
+            logger.debug(msg.format(gid))
+            raise ValueError
+
+        flag_index = _flag_index(flags)
+        old_flags = flag_index
+        data = self.data
+        if isinstance(data, ChunkedLayerData):
+            if self.parent.raw_gids:
+                old_flags = data.get_flags(x, y)
+            old = data.set_gid(x, y, gid, flag_index)
+            self._extend_bounds(x, y)
+        else:
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                msg = "Coords: ({0},{1}) in layer {2} are invalid"
+                logger.debug(msg.format(x, y, self.name))
+                raise ValueError
+
+            i = y * self.width + x
+            old = self.buffer[i]
+            self.buffer[i] = gid
+            if self.flags is not None:
+                old_flags = self.flags[i]
+                self.flags[i] = flag_index
+            if self._row_spans is not None and bool(old) != bool(gid):
+                self._row_spans[y] = self._row_span(y)
+
+        if old != gid or old_flags != flag_index:
+            self.add_dirty_rect(x, y, 1, 1)
+
+        counts = self._gid_counts
+        if old != gid and counts is not None:
+            if old:
+                counts[old] -= 1
+                if not counts[old]:
+                    del counts[old]
+            if gid:
+                counts[gid] = counts.get(gid, 0) + 1
+
+        if old != gid and self._gid_index is not None:
+            packed = self._pack_location(x, y)
+            if old:
+                locations = self._gid_index[old]
+                del locations[bisect_left(locations, packed)]
+                if not locations:
+                    del self._gid_index[old]
+            if gid:
+                locations = self._gid_index.get(gid, None)
+                if locations is None:
+                    locations = self._gid_index[gid] = self._new_locations()
+                locations.insert(bisect_left(locations, packed), packed)
+
+        return old
+
+    def _check_area(self, x, y, width, height):
+        """ Raise ValueError if an area is not inside the layer
+
+        Layers of infinite maps have no edges.
+        """
+        if isinstance(self.data, ChunkedLayerData):
+            return
+
+        if (x < 0 or y < 0 or width < 0 or height < 0 or
+                x + width > self.width or y + height > self.height):
+            msg = "Area ({0},{1},{2},{3}) is not inside layer {4}"
+            logger.debug(msg.format(x, y, width, height, self.name))
+            raise ValueError
+
+    def add_dirty_rect(self, x, y, width, height):
+        """ Add an area to dirty_rects, unless it is inside the last one
+
+        :param x: x coordinate of the first column
+        :param y: y coordinate of the first row
+        :param width: width in tiles
+        :param height: height in tiles
+        """
+        if self.dirty_rects:
+            lx, ly, lw, lh = self.dirty_rects[-1]
+            if (lx <= x and ly <= y and
+                    x + width <= lx + lw and y + height <= ly + lh):
+                return
+        self.dirty_rects.append((x, y, width, height))
+
+    def pop_dirty_rects(self):
+        """ Return the areas changed since the last call, and forget them
+
+        :rtype: list of (x, y, width, height) tuples, in tiles
+        """
+        rects = self.dirty_rects
+        self.dirty_rects = list()
+        return rects
+
+    def _extend_bounds(self, x, y):
+        """ Grow the area of a layer of an infinite map to hold a chunk
+
+        :param x: x coordinate of a tile in the chunk
+        :param y: y coordinate of a tile in the chunk
+        """
+        data = self.data
+        left = x - x % data.chunk_width
+        top = y - y % data.chunk_height
+        if not self.width:
+            self.startx, self.starty = left, top
+        right = max(self.startx + self.width, left + data.chunk_width)
+        bottom = max(self.starty + self.height, top + data.chunk_height)
+        self.startx = min(self.startx, left)
+        self.starty = min(self.starty, top)
+        self.width = right - self.startx
+        self.height = bottom - self.starty
+
+    def get_locations_by_gid(self, gid):
+        """ Return the locations of every tile with a GID
+
+        The first call builds an index of the locations of every GID in
+        the layer.  The index is kept up to date by set_gid; if the layer
+        data is changed directly, call reset_caches.
+
+        :param gid: GID to be searched for
+        :rtype: list of (x, y) tuples, row by row
+        """
+        if self._gid_index is None:
+            self._build_gid_index()
+
+        unpack = self._unpack_location
+        return [unpack(i) for i in self._gid_index.get(gid, ())]
+
+    def get_locations_by_gids(self, gids):
+        """ Return the locations of every tile with any of the GIDs
+
+        Uses the same index as get_locations_by_gid.
+
+        :param gids: GIDs to be searched for
+        :rtype: list of (x, y) tuples, row by row
+        """
+        if self._gid_index is None:
+            self._build_gid_index()
+
+        index = self._gid_index
+        found = [index[gid] for gid in gids if gid in index]
+        if len(found) == 1:
+            packed = found[0]
+        else:
+            packed = sorted(chain.from_iterable(found))
+
+        if isinstance(self.data, ChunkedLayerData):
+            unpack = self._unpack_location
+            return [unpack(i) for i in packed]
+
+        width = self.width
+        return [(i % width, i // width) for i in packed]
+
+    def reset_caches(self):
+        """ Forget indexes of the layer data
+
+        Only needed after changing layer.data, layer.buffer, or an array
+        from as_array directly.  They will be rebuilt when needed.
+        """
+        self._gid_index = None
+        self._row_spans = None
+        self._gid_counts = None
+
+    def get_gid_counts(self):
+        """ Return the number of cells with each GID
+
+        The first call counts every cell in one pass; later calls are
+        as fast as copying the counts.  They are kept up to date by
+        set_gid; if the layer data is changed directly, call reset_caches.
+
+        :rtype: dict of GID: number of cells, without empty cells
+        """
+        if self._gid_counts is None:
+            counts = Counter()
+            if isinstance(self.data, ChunkedLayerData):
+                for x, y, chunk in self.data.iter_chunks():
+                    counts.update(chunk)
+            else:
+                counts.update(self.buffer)
+            counts.pop(0, None)
+            self._gid_counts = dict(counts)
+        return dict(self._gid_counts)
+
+    def used_gids(self):
+        """ Return the GIDs used by the layer
+
+        :rtype: set of GIDs, without 0
+        """
+        if self._gid_counts is None:
+            self.get_gid_counts()
+        return set(self._gid_counts)
+
+    def _row_span(self, y):
+        """ Return (first x, last x + 1) of the tiles in a row, or None
+        """
+        row = self.data[y]
+        raw = row.tobytes()
+        end = len(raw.rstrip(b'\0'))
+        if not end:
+            return None
+        size = row.itemsize
+        start = len(raw) - len(raw.lstrip(b'\0'))
+        return start // size, (end - 1) // size + 1
+
+    def _rows_in_rect(self, left, top, right, bottom):
+        """ Iterate over the parts of rows inside a rect, top to bottom
+
+        Rows without tiles in the rect are skipped.  Parts of rows may
+        still have empty cells.
+
+        :param left: x of the first column
+        :param top: y of the first row
+        :param right: x after the last column
+        :param bottom: y after the last row
+        :return: (x, y, gids) tuples; x and y of the first cell of gids
+        """
+        data = self.data
+        if isinstance(data, ChunkedLayerData):
+            width, height = data.chunk_width, data.chunk_height
+            columns = range(left // width, (right - 1) // width + 1)
+            for cy in range(top // height, (bottom - 1) // height + 1):
+                chunks = [(cx, data.get_chunk((cx, cy))) for cx in columns
+                          if (cx, cy) in data.chunks]
+                if not chunks:
+                    continue
+
+                y1 = max(top, cy * height)
+                y2 = min(bottom, (cy + 1) * height)
+                for y in range(y1, y2):
+                    for cx, chunk in chunks:
+                        x1 = max(left, cx * width)
+                        x2 = min(right, (cx + 1) * width)
+                        i = (y - cy * height) * width - cx * width
+                        yield x1, y, memoryview(chunk)[i + x1:i + x2]
+            return
+
+        if self._row_spans is None:
+            self._row_spans = [self._row_span(y) for y in range(self.height)]
+        spans = self._row_spans
+
+        for y in range(max(top, 0), min(bottom, self.height)):
+            span = spans[y]
+            if span is None:
+                continue
+            x1 = max(left, span[0])
+            x2 = min(right, span[1])
+            if x1 < x2:
+                yield x1, y, data[y][x1:x2]
+
+    def _new_locations(self):
+        # packed locations are y * width + x, or for infinite maps,
+        # y * 2 ** 32 + x + 2 ** 31 so that negative coordinates sort too
+        if isinstance(self.data, ChunkedLayerData):
+            return array.array('q')
+        return array.array(gid_typecode)
+
+    def _pack_location(self, x, y):
+        if isinstance(self.data, ChunkedLayerData):
+            return (y << 32) + x + (1 << 31)
+        return y * self.width + x
+
+    def _unpack_location(self, packed):
+        if isinstance(self.data, ChunkedLayerData):
+            return (packed & 0xffffffff) - (1 << 31), packed >> 32
+        y, x = divmod(packed, self.width)
+        return x, y
+
+    def _build_gid_index(self):
+        """ Find the locations of every GID in the layer
+        """
+        new_locations = self._new_locations
+        index = dict()
+        if isinstance(self.data, ChunkedLayerData):
+            pack = self._pack_location
+            for x, y, gid in self.iter_data():
+                if gid:
+                    if gid not in index:
+                        index[gid] = new_locations()
+                    index[gid].append(pack(x, y))
+
+            # chunks are in order, but not the rows of different chunks
+            for gid, locations in index.items():
+                index[gid] = array.array('q', sorted(locations))
+
+        else:
+            for i, gid in enumerate(self.buffer):
+                if gid:
+                    if gid not in index:
+                        index[gid] = new_locations()
+                    index[gid].append(i)
+
+        self._gid_index = index
+
+    def iter_data(self):
+        """ Iterate over layer data
+
+        Yields X, Y, GID tuples for each tile in the layer.  Layers of
+        infinite maps yield each cell of each chunk, chunk by chunk.
+
+        :return: Generator
+        """
+        if isinstance(self.data, ChunkedLayerData):
+            width = self.data.chunk_width
+            for cx, cy, chunk in self.data.iter_chunks():
+                for i, gid in enumerate(chunk):
+                    y, x = divmod(i, width)
+                    yield cx + x, cy + y, gid
+            return
+
+        for y, x in product(range(self.height), range(self.width)):
+            yield x, y, self.data[y][x]
+
+    def tiles(self):
+        """ Iterate over tile images of this layer
+
+        This is an optimised generator function that returns
+        (tile_x, tile_y, tile_image) tuples,
+
+        :rtype: Generator
+        :return: (x, y, image) tuples
+        """
         images = self.parent.images
         data = self.data
+        if isinstance(data, ChunkedLayerData):
+            for x, y, gid in self.iter_data():
+                if gid:
+                    yield x, y, images[gid]
+            return
+
         for y, row in enumerate(data):
             for x, gid in enumerate(row):
                 if gid:
@@ -917,75 +3217,110 @@ class TiledTileLayer(TiledElement):
         :param node: ElementTree xml node
         :return: self
         """
-        import struct
-        import array
-
         self._set_properties(node)
-        data = None
-        next_gid = None
         data_node = node.find('data')
 
         encoding = data_node.get('encoding', None)
-        if encoding == 'base64':
-            from base64 import b64decode
+        chunks = data_node.findall('chunk')
+        if chunks or self.parent.infinite:
+            return self._load_chunks(
+                ((int(chunk.get('x')), int(chunk.get('y')),
+                  int(chunk.get('width')), int(chunk.get('height')),
+                  chunk.text if encoding else
+                  [int(child.get('gid', 0)) for child in chunk.findall('tile')])
+                 for chunk in chunks),
+                encoding, data_node.get('compression', None))
+
+        if encoding:
+            gids = unpack_gids(data_node.text, encoding,
+                               data_node.get('compression', None))
+
+        # without an encoding, the data is a bunch of tile elements
+        else:
+            gids = array.array(gid_typecode,
+                               (int(child.get('gid', 0))
+                                for child in data_node.findall('tile')))
 
-            data = b64decode(data_node.text.strip())
+        return self._load_gids(gids)
 
-        elif encoding == 'csv':
-            next_gid = map(int, "".join(
-                line.strip() for line in data_node.text.strip()
-            ).split(","))
+    def parse_json(self, data):
+        """ Parse a Tile Layer from a dict read from a Tiled JSON file
 
-        elif encoding:
-            msg = 'TMX encoding type: {0} is not supported.'
-            logger.error(msg.format(encoding))
-            raise Exception
+        :param data: dict
+        :return: self
+        """
+        self._set_json_properties(data, ('type', 'encoding', 'compression'))
+        self.height = int(self.height)
+        self.width = int(self.width)
 
-        compression = data_node.get('compression', None)
-        if compression == 'gzip':
-            import gzip
+        if 'chunks' in data:
+            encoding = data.get('encoding', 'csv')
+            if encoding == 'csv':
+                encoding = None
+            return self._load_chunks(
+                ((chunk['x'], chunk['y'], chunk['width'], chunk['height'],
+                  chunk['data']) for chunk in data['chunks']),
+                encoding, data.get('compression', None) or None)
+
+        gids = data.get('data', ())
+        if data.get('encoding', 'csv') == 'csv':
+            gids = array.array(gid_typecode, gids)
+        else:
+            gids = unpack_gids(gids, data['encoding'],
+                               data.get('compression', None) or None)
 
-            with gzip.GzipFile(fileobj=six.BytesIO(data)) as fh:
-                data = fh.read()
+        return self._load_gids(gids)
 
-        elif compression == 'zlib':
-            import zlib
+    def _load_chunks(self, chunks, encoding, compression):
+        """ Store the chunks of a layer in an infinite map, without decoding
 
-            data = zlib.decompress(data)
-
-        elif compression:
-            msg = 'TMX compression type: {0} is not supported.'
-            logger.error(msg.format(compression))
-            raise Exception
+        The layer's startx, starty, width and height are set to the area
+        covered by the chunks.
 
-        # if data is None, then it was not decoded or decompressed, so
-        # we assume here that it is going to be a bunch of tile elements
-        # TODO: this will/should raise an exception if there are no tiles
-        if encoding == next_gid is None:
-            def get_children(parent):
-                for child in parent.findall('tile'):
-                    yield int(child.get('gid'))
-
-            next_gid = get_children(data_node)
-
-        elif data:
-            if type(data) == bytes:
-                fmt = struct.Struct('<L')
-                iterator = (data[i:i + 4] for i in range(0, len(data), 4))
-                next_gid = (fmt.unpack(i)[0] for i in iterator)
-            else:
-                msg = 'layer data not in expected format ({})'
-                logger.error(msg.format(type(data)))
+        :param chunks: iterable of (x, y, width, height, data) of each chunk
+        :param encoding: 'base64', 'csv', or None if data are raw gids
+        :param compression: 'gzip', 'zlib', or None
+        :return: self
+        """
+        data = None
+        bounds = list()
+        for x, y, width, height, chunk in chunks:
+            if data is None:
+                data = ChunkedLayerData(self.parent, width, height)
+            elif (width, height) != (data.chunk_width, data.chunk_height):
+                msg = 'layer "{0}" has chunks of different sizes'
+                logger.error(msg.format(self.name))
                 raise Exception
 
-        init = lambda: [0] * self.width
-        reg = self.parent.register_gid
+            data.add_chunk(x, y, chunk, encoding, compression)
+            bounds.append((x, y, x + width, y + height))
 
-        # H (16-bit) may be a limitation for very detailed maps
-        self.data = tuple(array.array('H', init()) for i in range(self.height))
-        for (y, x) in product(range(self.height), range(self.width)):
-            self.data[y][x] = reg(*decode_gid(next(next_gid)))
+        if data is None:
+            data = ChunkedLayerData(self.parent, 16, 16)
+            bounds.append((0, 0, 0, 0))
 
+        self.startx = min(i[0] for i in bounds)
+        self.starty = min(i[1] for i in bounds)
+        self.width = max(i[2] for i in bounds) - self.startx
+        self.height = max(i[3] for i in bounds) - self.starty
+        self.data = data
+        return self
+
+    def _load_gids(self, gids):
+        """ Register raw gids from TMX data and store them as layer data
+
+        :param gids: sequence of raw 32-bit gids for every cell, flags set
+        :return: self
+        """
+        if len(gids) != self.width * self.height:
+            msg = 'layer "{0}" has {1} tiles, expected {2}'
+            logger.error(msg.format(self.name, len(gids),
+                                    self.width * self.height))
+            raise Exception
+
+        if self.parent.raw_gids:
+            self.flags = unpack_flags(gids)
+        self._set_buffer(self.parent.register_gids(gids))
         return self
 
 
@@ -995,7 +3330,7 @@ class TiledObject(TiledElement):
     Supported types: Box, Ellipse, Tile Object, Polyline, Polygon
     """
 
-    def __init__(self, parent, node):
+    def __init__(self, parent, node=None):
         TiledElement.__init__(self)
         self.parent = parent
 
@@ -1012,7 +3347,8 @@ class TiledObject(TiledElement):
         self.gid = 0
         self.visible = 1
 
-        self.parse_xml(node)
+        if node is not None:
+            self.parse_xml(node)
 
     @property
     def image(self):
@@ -1038,17 +3374,47 @@ class TiledObject(TiledElement):
         if self.gid:
             self.gid = self.parent.register_gid(self.gid)
 
-        points = None
         polygon = node.find('polygon')
         if polygon is not None:
-            points = read_points(polygon.get('points'))
-            self.closed = True
+            self._set_points(read_points(polygon.get('points')), True)
 
         polyline = node.find('polyline')
         if polyline is not None:
-            points = read_points(polyline.get('points'))
-            self.closed = False
+            self._set_points(read_points(polyline.get('points')), False)
+
+        return self
 
+    def parse_json(self, data):
+        """ Parse an Object from a dict read from a Tiled JSON file
+
+        :param data: dict
+        :return: self
+        """
+        self._set_json_properties(data, ('ellipse', 'point', 'template'))
+
+        # tiled writes empty strings where the tmx attribute would be missing
+        self.name = self.name or None
+        self.type = self.type or None
+
+        # correctly handle "tile objects" (object with gid set)
+        if self.gid:
+            self.gid = self.parent.register_gid(self.gid)
+
+        for key, closed in (('polygon', True), ('polyline', False)):
+            if key in data:
+                points = tuple((float(p['x']), float(p['y']))
+                               for p in data[key])
+                self._set_points(points, closed)
+
+        return self
+
+    def _set_points(self, points, closed):
+        """ Set the points of a polygon or polyline and update its size
+
+        :param points: sequence of (x, y) tuples, relative to the object
+        :param closed: True for polygons, False for polylines
+        """
+        self.closed = closed
         if points:
             x1 = x2 = y1 = y2 = 0
             for x, y in points:
@@ -1061,8 +3427,6 @@ class TiledObject(TiledElement):
             self.points = tuple(
                 [(i[0] + self.x, i[1] + self.y) for i in points])
 
-        return self
-
 
 class TiledObjectGroup(TiledElement, list):
     """ Represents a Tiled ObjectGroup
@@ -1070,7 +3434,7 @@ class TiledObjectGroup(TiledElement, list):
     Supports any operation of a normal list.
     """
 
-    def __init__(self, parent, node):
+    def __init__(self, parent, node=None):
         TiledElement.__init__(self)
         self.parent = parent
 
@@ -1081,8 +3445,70 @@ class TiledObjectGroup(TiledElement, list):
         self.offsety = 0
         self.opacity = 1
         self.visible = 1
+        self._object_grid = None
+
+        if node is not None:
+            self.parse_xml(node)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_object_grid'] = None
+        return state
+
+    @property
+    def object_grid(self):
+        """ObjectGrid of the objects in this group, made when first used
+
+        :rtype: ObjectGrid
+        """
+        if self._object_grid is None:
+            cell_size = getattr(self.parent, 'object_grid_cell_size', 64)
+            self._object_grid = ObjectGrid(self, cell_size)
+        return self._object_grid
+
+    def _changed(self):
+        self._object_grid = None
+
+        # parent is not set yet while unpickling
+        parent = getattr(self, 'parent', None)
+        if isinstance(parent, TiledMap):
+            parent.reset_object_indexes()
+
+    def append(self, item):
+        list.append(self, item)
+        self._changed()
+
+    def extend(self, items):
+        list.extend(self, items)
+        self._changed()
+
+    def insert(self, index, item):
+        list.insert(self, index, item)
+        self._changed()
+
+    def remove(self, item):
+        list.remove(self, item)
+        self._changed()
+
+    def pop(self, *args):
+        item = list.pop(self, *args)
+        self._changed()
+        return item
+
+    def __setitem__(self, index, item):
+        list.__setitem__(self, index, item)
+        self._changed()
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._changed()
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
 
-        self.parse_xml(node)
+    def clear(self):
+        del self[:]
 
     def parse_xml(self, node):
         """ Parse an Object Group from ElementTree xml node
@@ -1096,6 +3522,323 @@ class TiledObjectGroup(TiledElement, list):
 
         return self
 
+    def parse_json(self, data):
+        """ Parse an Object Group from a dict read from a Tiled JSON file
+
+        :param data: dict
+        :return: self
+        """
+        self._set_json_properties(data, ('type', 'width', 'height'))
+        self.extend(TiledObject(self.parent).parse_json(item)
+                    for item in data.get('objects', ()))
+
+        return self
+
+
+def _object_shape(obj):
+    """ Return the points of the outline of an object, in map pixels
+
+    Rectangles and ellipses are their four corners.  Tile objects are
+    anchored at their bottom left corner, and rotated around it, unless
+    TiledMap has already moved them to their top left corner (invert_y).
+    Other points are rotated around the x and y of the object, clockwise,
+    like Tiled does.
+
+    :param obj: TiledObject
+    :return: (list of (x, y) tuples, True if the shape is closed)
+    """
+    x, y = obj.x, obj.y
+    points = getattr(obj, 'points', None)
+    if points is not None:
+        closed = obj.closed
+        points = [(px - x, py - y) for px, py in points]
+    else:
+        width, height = obj.width, obj.height
+        if obj.gid and not (width and height):
+            try:
+                tileset = obj.parent.get_tileset_from_gid(obj.gid)
+                width, height = tileset.tilewidth, tileset.tileheight
+            except (AttributeError, ValueError):
+                pass
+
+        # tiled anchors tile objects at their bottom left corner, and
+        # rotates them around it.  TiledMap moves sized tile objects to
+        # their top left corner when invert_y is set, so move back here.
+        top = 0
+        if obj.gid:
+            top = -height
+            if obj.height and getattr(obj.parent, 'invert_y', False):
+                y += obj.height
+        if width or height:
+            closed = True
+            points = [(0, top), (width, top),
+                      (width, top + height), (0, top + height)]
+        else:
+            closed = False
+            points = [(0, 0)]
+
+    if obj.rotation:
+        angle = math.radians(obj.rotation)
+        cos, sin = math.cos(angle), math.sin(angle)
+        points = [(px * cos - py * sin, px * sin + py * cos)
+                  for px, py in points]
+
+    return [(px + x, py + y) for px, py in points], closed
+
+
+def _point_in_polygon(x, y, points):
+    """ Check if a point is inside a polygon, by the even-odd rule
+    """
+    inside = False
+    x1, y1 = points[-1]
+    for x2, y2 in points:
+        if (y1 > y) != (y2 > y):
+            if x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+def _segment_in_rect(x1, y1, x2, y2, left, top, right, bottom):
+    """ Check if any part of a line segment is inside a rect (Liang-Barsky)
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x1 - left), (dx, right - x1),
+                 (-dy, y1 - top), (dy, bottom - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                if t > t1:
+                    return False
+                if t > t0:
+                    t0 = t
+            else:
+                if t < t0:
+                    return False
+                if t < t1:
+                    t1 = t
+    return True
+
+
+def _point_segment_distance(x, y, x1, y1, x2, y2):
+    dx = x2 - x1
+    dy = y2 - y1
+    length = dx * dx + dy * dy
+    if length:
+        t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+        x1 += t * dx
+        y1 += t * dy
+    return math.hypot(x - x1, y - y1)
+
+
+class ObjectGrid(object):
+    """ Uniform grid of objects, for finding objects by position
+
+    Each object is added to the cells of the grid that its bounding box
+    covers, so queries only check the objects near the area they search.
+    Rotated objects are placed by their rotated corners, and the outline
+    of an object is checked exactly after its bounding box matches.
+
+    Coordinates are in pixels, like the x and y of objects.  Polylines and
+    point objects have no area, so they are never found by query_point.
+
+    The grid is not updated when objects are changed; make a new one.
+    """
+
+    def __init__(self, objects, cell_size=64):
+        """ Create a grid of objects
+
+        :param objects: iterable of TiledObject
+        :param cell_size: width and height of each cell, in pixels
+        """
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.objects = list()
+        self.shapes = list()  # (points, closed, bounding box) by object
+
+        # range of cells that have objects, used to stop nearest searches
+        self.cell_bounds = None
+
+        for obj in objects:
+            self.add(obj)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def add(self, obj):
+        """ Add an object to the grid
+
+        :param obj: TiledObject
+        """
+        points, closed = _object_shape(obj)
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        bbox = min(xs), min(ys), max(xs), max(ys)
+
+        index = len(self.objects)
+        self.objects.append(obj)
+        self.shapes.append((points, closed, bbox))
+
+        x1, y1, x2, y2 = self._cell_range(*bbox)
+        for cell in product(range(x1, x2 + 1), range(y1, y2 + 1)):
+            self.cells[cell].append(index)
+
+        if self.cell_bounds is None:
+            self.cell_bounds = x1, y1, x2, y2
+        else:
+            bx1, by1, bx2, by2 = self.cell_bounds
+            self.cell_bounds = (min(x1, bx1), min(y1, by1),
+                                max(x2, bx2), max(y2, by2))
+
+    def _cell_range(self, left, top, right, bottom):
+        size = self.cell_size
+        return (int(math.floor(left / size)), int(math.floor(top / size)),
+                int(math.floor(right / size)), int(math.floor(bottom / size)))
+
+    def _candidates(self, left, top, right, bottom):
+        """ Return the indexes of objects in the cells covering a rect, sorted
+        """
+        cells = self.cells
+        x1, y1, x2, y2 = self._cell_range(left, top, right, bottom)
+        found = set()
+        for cell in product(range(x1, x2 + 1), range(y1, y2 + 1)):
+            if cell in cells:
+                found.update(cells[cell])
+        return sorted(found)
+
+    def query_rect(self, rect):
+        """ Return the objects that overlap a rect, in the order added
+
+        Objects that only touch an edge of the rect are included.
+
+        :param rect: (x, y, width, height) in pixels
+        :rtype: list of TiledObject
+        """
+        x, y, width, height = rect
+        left, top, right, bottom = x, y, x + width, y + height
+        found = list()
+        for index in self._candidates(left, top, right, bottom):
+            points, closed, bbox = self.shapes[index]
+            if (bbox[0] > right or bbox[2] < left or
+                    bbox[1] > bottom or bbox[3] < top):
+                continue
+
+            if self._shape_in_rect(points, closed, left, top, right, bottom):
+                found.append(self.objects[index])
+        return found
+
+    @staticmethod
+    def _shape_in_rect(points, closed, left, top, right, bottom):
+        if len(points) == 1:
+            return True
+
+        # an edge inside the rect, or the rect inside a closed shape
+        segments = zip(points[-1:] + points[:-1] if closed else points[:-1],
+                       points if closed else points[1:])
+        for (x1, y1), (x2, y2) in segments:
+            if _segment_in_rect(x1, y1, x2, y2, left, top, right, bottom):
+                return True
+        return closed and _point_in_polygon(left, top, points)
+
+    def query_point(self, x, y):
+        """ Return the objects that contain a point, in the order added
+
+        :param x: x coordinate in pixels
+        :param y: y coordinate in pixels
+        :rtype: list of TiledObject
+        """
+        found = list()
+        for index in self._candidates(x, y, x, y):
+            points, closed, bbox = self.shapes[index]
+            if (closed and bbox[0] <= x <= bbox[2] and
+                    bbox[1] <= y <= bbox[3] and
+                    _point_in_polygon(x, y, points)):
+                found.append(self.objects[index])
+        return found
+
+    def distance(self, index, x, y):
+        """ Return the distance from a point to the outline of an object
+
+        The distance is 0 if the point is inside a closed shape.
+
+        :param index: index of the object in self.objects
+        :rtype: float
+        """
+        points, closed, bbox = self.shapes[index]
+        if len(points) == 1:
+            return math.hypot(x - points[0][0], y - points[0][1])
+
+        if closed and _point_in_polygon(x, y, points):
+            return 0.0
+
+        segments = zip(points[-1:] + points[:-1] if closed else points[:-1],
+                       points if closed else points[1:])
+        return min(_point_segment_distance(x, y, x1, y1, x2, y2)
+                   for (x1, y1), (x2, y2) in segments)
+
+    @staticmethod
+    def _ring(cx, cy, ring):
+        """ Return the cells on the edge of a square around a cell
+        """
+        if not ring:
+            return [(cx, cy)]
+
+        top, bottom = cy - ring, cy + ring
+        cells = [(i, j) for i in range(cx - ring, cx + ring + 1)
+                 for j in (top, bottom)]
+        cells.extend((i, j) for i in (cx - ring, cx + ring)
+                     for j in range(top + 1, bottom))
+        return cells
+
+    def nearest(self, x, y, max_distance=None):
+        """ Return the object nearest to a point
+
+        Cells are searched in rings around the point, until no closer
+        object can be found.  If objects are the same distance away, the
+        one added first is returned.
+
+        :param x: x coordinate in pixels
+        :param y: y coordinate in pixels
+        :param max_distance: only return objects this close to the point
+        :rtype: TiledObject, or None if there is no object close enough
+        """
+        if self.cell_bounds is None:
+            return None
+
+        cells = self.cells
+        cx, cy = self._cell_range(x, y, x, y)[:2]
+        bx1, by1, bx2, by2 = self.cell_bounds
+        rings = max(abs(cx - bx1), abs(cx - bx2), abs(cy - by1), abs(cy - by2))
+
+        best = None
+        best_distance = max_distance
+        seen = set()
+        for ring in range(rings + 1):
+            # everything in this ring is at least this far away
+            if best_distance is not None and \
+                    (ring - 1) * self.cell_size > best_distance:
+                break
+
+            for cell in self._ring(cx, cy, ring):
+                for index in cells.get(cell, ()):
+                    if index in seen:
+                        continue
+                    seen.add(index)
+                    distance = self.distance(index, x, y)
+                    if (best_distance is None or
+                            distance < best_distance or
+                            (distance == best_distance and
+                             (best is None or index < best))):
+                        best = index
+                        best_distance = distance
+
+        return None if best is None else self.objects[best]
+
 
 class TiledImageLayer(TiledElement):
     """ Represents Tiled Image Layer
@@ -1103,7 +3846,7 @@ class TiledImageLayer(TiledElement):
     The image associated with this layer will be loaded and assigned a GID.
     """
 
-    def __init__(self, parent, node):
+    def __init__(self, parent, node=None):
         TiledElement.__init__(self)
         self.parent = parent
         self.source = None
@@ -1117,7 +3860,8 @@ class TiledImageLayer(TiledElement):
         self.opacity = 1
         self.visible = 1
 
-        self.parse_xml(node)
+        if node is not None:
+            self.parse_xml(node)
 
     @property
     def image(self):
@@ -1139,3 +3883,168 @@ class TiledImageLayer(TiledElement):
         self.source = image_node.get('source')
         self.trans = image_node.get('trans', None)
         return self
+
+    def parse_json(self, data):
+        """ Parse an Image Layer from a dict read from a Tiled JSON file
+
+        :param data: dict
+        :return: self
+        """
+        self._set_json_properties(data, ('type', 'image', 'width', 'height',
+                                         'transparentcolor'))
+        self.source = data.get('image', None) or None
+        self.trans = _json_color(data.get('transparentcolor'))
+        return self
+
+
+def simplify_points(points, tilewidth=1, tileheight=1):
+    """ Return a list of rects that cover a list of points of a grid
+
+    Adjacent points are combined into as few rects as the method finds,
+    without overlapping.  Each row of the grid is split into runs of
+    points, and a run is merged with the run below it if both start and
+    end in the same columns.  The time is linear in the size of the area
+    with points, and no recursion is used, so large layers are fine.
+
+    :param points: iterable of (x, y) tuples, in tiles
+    :param tilewidth: width of a tile in the returned rects
+    :param tileheight: height of a tile in the returned rects
+    :rtype: list of (x, y, width, height) tuples, ordered by y, then x
+    """
+    points = set(points)
+    if not points:
+        return list()
+
+    left = min(p[0] for p in points)
+    top = min(p[1] for p in points)
+    width = max(p[0] for p in points) - left + 1
+    height = max(p[1] for p in points) - top + 1
+
+    grid = [bytearray(width) for y in range(height)]
+    for x, y in points:
+        grid[y - top][x - left] = 1
+
+    rects = list()
+    open_runs = dict()  # (first x, last x + 1): first row of the run
+    for y in range(height + 1):
+        runs = set()
+        if y < height:
+            row = grid[y]
+            start = row.find(b'\x01')
+            while start >= 0:
+                end = row.find(b'\x00', start)
+                if end < 0:
+                    end = width
+                runs.add((start, end))
+                start = row.find(b'\x01', end)
+
+        for run in [run for run in open_runs if run not in runs]:
+            first = open_runs.pop(run)
+            rects.append((run[0], first, run[1] - run[0], y - first))
+
+        for run in runs:
+            if run not in open_runs:
+                open_runs[run] = y
+
+    rects.sort(key=lambda r: (r[1], r[0]))
+    return [((x + left) * tilewidth, (y + top) * tileheight,
+             w * tilewidth, h * tileheight) for x, y, w, h in rects]
+
+
+def build_tile_rects(tmxmap, layer, tileset=None, real_gid=None):
+    """ Return rects that cover the tiles of a layer, for collisions
+
+    :param tmxmap: TiledMap object
+    :param layer: int or string name of layer
+    :param tileset: int or string name of tileset, only checked to exist
+    :param real_gid: Tiled GID of the tile + 1, or None for every tile
+    :rtype: list of (x, y, width, height) tuples, in pixels
+    """
+    if isinstance(tileset, int):
+        try:
+            tileset = tmxmap.tilesets[tileset]
+        except IndexError:
+            msg = "Tileset #{0} not found in map {1}."
+            logger.debug(msg.format(tileset, tmxmap))
+            raise IndexError
+
+    elif isinstance(tileset, str):
+        try:
+            tileset = [t for t in tmxmap.tilesets if t.name == tileset].pop()
+        except IndexError:
+            msg = "Tileset \"{0}\" not found in map {1}."
+            logger.debug(msg.format(tileset, tmxmap))
+            raise ValueError
+
+    elif tileset:
+        msg = "Tileset must be either a int or string. got: {0}"
+        logger.debug(msg.format(type(tileset)))
+        raise TypeError
+
+    gid = None
+    if real_gid:
+        try:
+            gid, flags = tmxmap.map_gid(real_gid)[0]
+        except (IndexError, TypeError):
+            msg = "GID #{0} not found"
+            logger.debug(msg.format(real_gid))
+            raise ValueError
+
+    if isinstance(layer, int):
+        layer = tmxmap.layers[layer]
+    else:
+        try:
+            layer = [l for l in tmxmap.layers if l.name == layer].pop()
+        except IndexError:
+            msg = "Layer \"{0}\" not found in map {1}."
+            logger.debug(msg.format(layer, tmxmap))
+            raise ValueError
+
+    if gid:
+        points = layer.get_locations_by_gid(gid)
+    elif layer.buffer is not None:
+        width = layer.width
+        points = [(i % width, i // width)
+                  for i, g in enumerate(layer.buffer) if g]
+    else:
+        points = [(x, y) for x, y, g in layer.iter_data() if g]
+
+    return simplify_points(points, tmxmap.tilewidth, tmxmap.tileheight)
+
+
+def _load_map(filename, kwargs):
+    """ Load a TMX or JSON map; used by load_maps in worker processes
+    """
+    if filename[-5:].lower() == '.json':
+        return TiledMap.from_json(filename, **kwargs)
+    return TiledMap(filename, **kwargs)
+
+
+def load_maps(filenames, image_loader=default_image_loader, max_workers=None,
+              **kwargs):
+    """ Load many maps at once, using a pool of processes
+
+    Maps are parsed in worker processes without images, and sent back
+    compactly pickled.  Images are then loaded here, in this process, with
+    image_loader.  Accepts the same keyword arguments as TiledMap.
+
+    On platforms that spawn processes (windows, macOS), this must be
+    called from code guarded by "if __name__ == '__main__':".
+
+    :param filenames: iterable of filenames of TMX or JSON maps
+    :param image_loader: function that will load images
+    :param max_workers: number of processes; defaults to number of CPUs
+    :rtype: list of TiledMap, in the same order as filenames
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import repeat
+
+    filenames = list(filenames)
+    with ProcessPoolExecutor(max_workers) as executor:
+        maps = list(executor.map(_load_map, filenames, repeat(kwargs)))
+
+    for tiled_map in maps:
+        tiled_map.image_loader = image_loader
+        tiled_map.reload_images()
+
+    return maps
@@ -0,0 +1,320 @@
+"""
+Compiled map cache for pytmx
+
+Parsing a map means reading xml, decoding and decompressing the layers and
+registering gids, and the result is the same every time for an unchanged
+map.  This module saves a loaded TiledMap to a ".tmxc" file next to the
+map, and loads it from there when neither the map nor any external tileset
+it uses has changed.
+
+Layer data is stored as raw little-endian arrays, and is memory mapped when
+loading, so it is not copied or decoded.  Images are never cached; they are
+loaded with the image loader every time.
+
+The map itself is stored as a pickle, so only load caches from trusted
+directories.  The key used to check if a cache is out of date is JSON, so
+out of date or foreign caches are never unpickled.
+
+    from pytmx.tmxc import load_compiled
+    tiled_map = load_compiled('map.tmx', image_loader=pygame_image_loader)
+"""
+import array
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+from .pytmx import TiledElement, TiledMap, PackedLayerData
+from .pytmx import default_image_loader
+
+logger = logging.getLogger(__name__)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+__all__ = ['load_compiled', 'save_compiled', 'compiled_filename']
+
+MAGIC = b'TMXC'
+VERSION = 2
+
+# magic, version, length of the JSON key, length of the map pickle
+header = struct.Struct('<4sIII')
+
+# layer arrays start on multiples of this, relative to the file
+alignment = 8
+
+
+def _aligned(offset):
+    return offset + -offset % alignment
+
+
+def compiled_filename(filename):
+    """ Return the default filename of the compiled cache for a map
+
+    :param filename: filename of the TMX or JSON map
+    :return: filename ending with .tmxc
+    """
+    return os.path.splitext(filename)[0] + '.tmxc'
+
+
+def _file_key(path):
+    """ Return (path, mtime, size, sha1) used to detect changes to a file
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    with open(path, 'rb') as fh:
+        digest = hashlib.sha1(fh.read()).hexdigest()
+    return path, st.st_mtime, st.st_size, digest
+
+
+def _file_changed(key):
+    """ Check a key from _file_key against the file
+
+    The hash is only checked if the modification time is different, so
+    unchanged files are not read at all.
+    """
+    path, mtime, size, digest = key
+    try:
+        st = os.stat(path)
+    except OSError:
+        return True
+
+    if st.st_size != size:
+        return True
+    if st.st_mtime == mtime:
+        return False
+    return _file_key(path)[3] != digest
+
+
+def _options(invert_y=True, load_all=False, optional_gids=(),
+             layers=None, exclude_layers=None, headless=False, raw_gids=False):
+    """ Return the loading options that change the contents of a map
+
+    Layer filters must be collections of names; functions cannot be cached.
+    """
+    return {'invert_y': bool(invert_y),
+            'load_all': bool(load_all),
+            'optional_gids': sorted(optional_gids),
+            'layers': None if layers is None else sorted(layers),
+            'exclude_layers': (None if exclude_layers is None
+                               else sorted(exclude_layers)),
+            'headless': bool(headless),
+            'raw_gids': bool(raw_gids)}
+
+
+def _map_key(tiled_map):
+    sources = [ts.external_source for ts in tiled_map.tilesets
+               if ts.external_source]
+    return {'source': _file_key(tiled_map.filename),
+            'externals': [_file_key(path) for path in sources],
+            'options': _options(tiled_map.invert_y,
+                                tiled_map.load_all_tiles,
+                                tiled_map.optional_gids,
+                                tiled_map.include_layers,
+                                tiled_map.exclude_layers,
+                                tiled_map.headless,
+                                tiled_map.raw_gids)}
+
+
+class _MapPickler(pickle.Pickler):
+    """ Pickles a map, leaving out layer data and the image loader
+
+    Packed layer data is replaced by a reference to a raw array, which is
+    written after the pickle.  Offsets are relative to the start of the
+    arrays.
+    """
+
+    def __init__(self, fh, tiled_map):
+        pickle.Pickler.__init__(self, fh, pickle.HIGHEST_PROTOCOL)
+        self.arrays = list()
+        self.offset = 0
+        self.image_loader = tiled_map.image_loader
+
+    def persistent_id(self, obj):
+        if obj is self.image_loader:
+            return 'image_loader',
+
+        if isinstance(obj, PackedLayerData):
+            raw = obj.raw
+            if sys.byteorder == 'big':
+                data = array.array(obj.typecode)
+                data.frombytes(raw)
+                data.byteswap()
+                raw = data.tobytes()
+
+            offset = _aligned(self.offset)
+            self.arrays.append((offset, raw))
+            self.offset = offset + len(raw)
+            return 'layer', obj.typecode, offset, obj.width, obj.height
+
+        return None
+
+
+class _MapUnpickler(pickle.Unpickler):
+    """ Unpickles a map pickled by _MapPickler, with layer data from buffer
+
+    Layers get a memoryview of the buffer as their data, without copying.
+    """
+
+    def __init__(self, fh, buf, image_loader):
+        pickle.Unpickler.__init__(self, fh)
+        self.buf = buf
+        self.image_loader = image_loader
+
+    def persistent_load(self, pid):
+        if pid[0] == 'image_loader':
+            return self.image_loader
+
+        typecode, offset, width, height = pid[1:]
+        size = array.array(typecode).itemsize * width * height
+        data = self.buf[offset:offset + size]
+
+        # the file is little-endian, so it cannot be used directly here
+        if sys.byteorder == 'big':
+            data = array.array(typecode, data.tobytes())
+            data.byteswap()
+            return data
+
+        return data.cast(typecode)
+
+
+def save_compiled(tiled_map, cache_filename=None):
+    """ Save a loaded map as a compiled cache
+
+    :param tiled_map: TiledMap loaded from a file
+    :param cache_filename: defaults to the filename of the map, with .tmxc
+    """
+    if cache_filename is None:
+        cache_filename = compiled_filename(tiled_map.filename)
+
+    key = json.dumps(_map_key(tiled_map), sort_keys=True).encode('utf-8')
+    fh = io.BytesIO()
+    pickler = _MapPickler(fh, tiled_map)
+    pickler.dump(tiled_map)
+    map_pickle = fh.getvalue()
+
+    # write to a temporary file first, so a map that is being loaded from
+    # the cache by another process never sees a partial file
+    temp = cache_filename + '.tmp'
+    with open(temp, 'wb') as fh:
+        fh.write(header.pack(MAGIC, VERSION, len(key), len(map_pickle)))
+        fh.write(key)
+        fh.write(map_pickle)
+        start = _aligned(fh.tell())
+        for offset, data in pickler.arrays:
+            fh.write(b'\0' * (start + offset - fh.tell()))
+            fh.write(data)
+    os.replace(temp, cache_filename)
+
+
+def _read_compiled(filename, cache_filename, image_loader, options):
+    """ Return the map from a compiled cache, or None if it is out of date
+    """
+    with open(cache_filename, 'rb') as fh:
+        buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    # the key is checked before anything is unpickled
+    magic, version, key_size, map_size = header.unpack_from(buf)
+    start = header.size
+    key = None
+    if magic == MAGIC and version == VERSION:
+        key = json.loads(buf[start:start + key_size].decode('utf-8'))
+
+    if (key is None or
+            key['source'][0] != os.path.abspath(filename) or
+            key['options'] != options or
+            any(_file_changed(i) for i in [key['source']] + key['externals'])):
+        buf.close()
+        return None
+
+    start += key_size
+    view = memoryview(buf)
+    fh = io.BytesIO(view[start:start + map_size])
+    arrays = view[_aligned(start + map_size):]
+    tiled_map = _MapUnpickler(fh, arrays, image_loader).load()
+
+    # layers use views of the mapped file, which keep it open
+    tiled_map._compiled_buffer = buf
+    return tiled_map
+
+
+def _load_source(filename, image_loader, kwargs):
+    """ Load a map from the TMX or JSON file, without the cache
+    """
+    if filename[-5:].lower() == '.json':
+        return TiledMap.from_json(filename, image_loader, **kwargs)
+    return TiledMap(filename, image_loader, **kwargs)
+
+
+def load_compiled(filename, image_loader=default_image_loader,
+                  cache_filename=None, **kwargs):
+    """ Load a map, using the compiled cache if it is up to date
+
+    If the cache is missing or out of date, the map is loaded normally and
+    a new cache is written.  Accepts the same keyword arguments as TiledMap.
+    Maps with a .json extension are loaded with TiledMap.from_json.
+
+    Maps loaded with a function as the layers or exclude_layers filter are
+    never cached.
+
+    The map is unpickled from the cache, and unpickling can run any code,
+    so the cache file must be trusted: do not load maps from directories
+    that others can write to.
+
+    Layer data of a map read from the cache is a view of the memory mapped
+    cache file.  The mapping is copy-on-write, so changing tiles does not
+    change the file, and it is closed when the map and all of its layers
+    have been garbage collected.
+
+    :param filename: filename of the TMX or JSON map
+    :param image_loader: function that will load images
+    :param cache_filename: defaults to the filename of the map, with .tmxc
+    :rtype: TiledMap
+    """
+    if cache_filename is None:
+        cache_filename = compiled_filename(filename)
+
+    layers = kwargs.get('layers', None)
+    exclude_layers = kwargs.get('exclude_layers', None)
+    if callable(layers) or callable(exclude_layers):
+        return _load_source(filename, image_loader, kwargs)
+
+    options = _options(kwargs.get('invert_y', True),
+                       kwargs.get('load_all', False),
+                       kwargs.get('optional_gids', ()),
+                       layers, exclude_layers,
+                       kwargs.get('headless', False),
+                       kwargs.get('raw_gids', False))
+
+    tiled_map = None
+    if os.path.exists(cache_filename):
+        try:
+            tiled_map = _read_compiled(filename, cache_filename,
+                                       image_loader, options)
+        except Exception:
+            msg = 'Cannot read compiled map {0}, it will be rebuilt'
+            logger.warning(msg.format(cache_filename))
+
+    if tiled_map is None:
+        tiled_map = _load_source(filename, image_loader, kwargs)
+        try:
+            save_compiled(tiled_map, cache_filename)
+        except (IOError, OSError):
+            msg = 'Cannot write compiled map {0}'
+            logger.warning(msg.format(cache_filename))
+
+        return tiled_map
+
+    TiledElement.allow_duplicate_names = \
+        kwargs.get('allow_duplicate_names', False)
+    tiled_map.filename = filename
+    tiled_map.lazy_images = kwargs.get('lazy_images', False)
+    tiled_map.image_threads = kwargs.get('image_threads', None)
+    tiled_map.reload_images()
+    return tiled_map
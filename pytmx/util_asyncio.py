@@ -0,0 +1,105 @@
+"""
+asyncio support for pytmx
+
+Loading a large map can take long enough to stall an event loop.  load_async
+does the same work as TiledMap, but every part that reads files or uses the
+CPU runs in an executor, one layer or tileset at a time, so other coroutines
+keep running while a map loads.
+
+Requires python 3.7+.
+
+    tiled_map = await load_async('map.tmx', image_loader=pygame_image_loader)
+"""
+import asyncio
+import json
+import logging
+from xml.etree import ElementTree
+
+from .pytmx import TiledMap, default_image_loader
+
+logger = logging.getLogger(__name__)
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+__all__ = ['load_async']
+
+
+def _read_file(filename):
+    with open(filename, 'rb') as fh:
+        return fh.read()
+
+
+async def load_async(filename, image_loader=default_image_loader,
+                     executor=None, **kwargs):
+    """ Load a TMX or JSON map without blocking the event loop
+
+    Accepts the same keyword arguments as TiledMap, except streaming: the
+    file is read in one piece in the executor, so streaming raises
+    ValueError.  Maps with a .json extension are loaded like
+    TiledMap.from_json.
+
+    With image_threads, image files are loaded together in a thread pool
+    of that size instead of one at a time in the executor.
+
+    If the task is cancelled, the step running in the executor is allowed
+    to finish, but no further steps are started and the map is discarded.
+
+    :param filename: filename of the TMX or JSON map
+    :param image_loader: function that will load images
+    :param executor: concurrent.futures executor; default is the loop's
+    :rtype: TiledMap
+    """
+    if kwargs.get('streaming', False):
+        msg = 'load_async cannot stream maps: {0}'
+        logger.error(msg.format(filename))
+        raise ValueError
+
+    loop = asyncio.get_running_loop()
+
+    def run(func, *args):
+        return loop.run_in_executor(executor, func, *args)
+
+    data = await run(_read_file, filename)
+
+    tiled_map = TiledMap(image_loader=image_loader, **kwargs)
+    tiled_map.filename = filename
+    if filename[-5:].lower() == '.json':
+        data = await run(json.loads, data.decode('utf-8'))
+        steps = tiled_map._parse_json_steps(data)
+    else:
+        node = await run(ElementTree.fromstring, data)
+        steps = tiled_map._parse_xml_steps(node)
+    del data
+
+    # each step parses one layer or tileset
+    while await run(next, steps, None) is not None:
+        pass
+
+    await run(tiled_map._register_tileset_gids)
+    if tiled_map.headless:
+        return tiled_map
+
+    sources = await run(tiled_map._collect_image_sources)
+    if tiled_map.lazy_images:
+        tiled_map._set_lazy_images(sources)
+    elif tiled_map.image_threads and len(sources) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        pool = ThreadPoolExecutor(tiled_map.image_threads)
+        try:
+            loaded = await asyncio.gather(
+                *[loop.run_in_executor(pool, source.load)
+                  for source in sources])
+        finally:
+            # do not block the loop if the task was cancelled
+            pool.shutdown(wait=False)
+        tiled_map._set_images(sources, loaded)
+    else:
+        loaded = list()
+        for source in sources:
+            loaded.append(await run(source.load))
+        tiled_map._set_images(sources, loaded)
+
+    return tiled_map
@@ -1,5 +1,4 @@
 import logging
-import itertools
 import pytmx
 
 logger = logging.getLogger(__name__)
@@ -126,72 +125,20 @@ def build_rects(tmxmap, layer, tileset=None, real_gid=None):
 
     GID Note: You will need to add 1 to the GID reported by Tiled.
 
+    Use pytmx.build_tile_rects to get tuples instead, without pygame.
+
     :param tmxmap: TiledMap object
     :param layer: int or string name of layer
     :param tileset: int or string name of tileset
     :param real_gid: Tiled GID of the tile + 1 (see note)
     :return: List of pygame Rect objects
     """
-    if isinstance(tileset, int):
-        try:
-            tileset = tmxmap.tilesets[tileset]
-        except IndexError:
-            msg = "Tileset #{0} not found in map {1}."
-            logger.debug(msg.format(tileset, tmxmap))
-            raise IndexError
-
-    elif isinstance(tileset, str):
-        try:
-            tileset = [t for t in tmxmap.tilesets if t.name == tileset].pop()
-        except IndexError:
-            msg = "Tileset \"{0}\" not found in map {1}."
-            logger.debug(msg.format(tileset, tmxmap))
-            raise ValueError
-
-    elif tileset:
-        msg = "Tileset must be either a int or string. got: {0}"
-        logger.debug(msg.format(type(tileset)))
-        raise TypeError
-
-    gid = None
-    if real_gid:
-        try:
-            gid, flags = tmxmap.map_gid(real_gid)[0]
-        except IndexError:
-            msg = "GID #{0} not found"
-            logger.debug(msg.format(real_gid))
-            raise ValueError
-
-    if isinstance(layer, int):
-        layer_data = tmxmap.get_layer_data(layer)
-    elif isinstance(layer, str):
-        try:
-            layer = [l for l in tmxmap.layers if l.name == layer].pop()
-            layer_data = layer.data
-        except IndexError:
-            msg = "Layer \"{0}\" not found in map {1}."
-            logger.debug(msg.format(layer, tmxmap))
-            raise ValueError
-
-    p = itertools.product(range(tmxmap.width), range(tmxmap.height))
-    if gid:
-        points = [(x, y) for (x, y) in p if layer_data[y][x] == gid]
-    else:
-        points = [(x, y) for (x, y) in p if layer_data[y][x]]
-
-    rects = simplify(points, tmxmap.tilewidth, tmxmap.tileheight)
-    return rects
+    rects = pytmx.build_tile_rects(tmxmap, layer, tileset, real_gid)
+    return [pygame.Rect(rect) for rect in rects]
 
 
 def simplify(all_points, tilewidth, tileheight):
     """Given a list of points, return list of rects that represent them
-    kludge:
-
-    "A kludge (or kluge) is a workaround, a quick-and-dirty solution,
-    a clumsy or inelegant, yet effective, solution to a problem, typically
-    using parts that are cobbled together."
-
-    -- wikipedia
 
     turn a list of points into a rects
     adjacent rects will be combined.
@@ -221,49 +168,13 @@ def simplify(all_points, tilewidth, tileheight):
 
         pretty cool, right?
 
-    there may be cases where the number of rectangles is not as low as possible,
-    but I haven't found that it is excessively bad.  certainly much better than
-    making a list of rects, one for each tile on the map!
+    each row is split into runs of points, and runs are merged with the
+    run below them when they cover the same columns, so this takes linear
+    time.  there may be cases where the number of rectangles is not as low
+    as possible, but it is much better than making a list of rects, one
+    for each tile on the map!
+
+    Use pytmx.simplify_points to get tuples instead, without pygame.
     """
-    def pick_rect(points, rects):
-        ox, oy = sorted([(sum(p), p) for p in points])[0][1]
-        x = ox
-        y = oy
-        ex = None
-
-        while 1:
-            x += 1
-            if not (x, y) in points:
-                if ex is None:
-                    ex = x - 1
-
-                if (ox, y + 1) in points:
-                    if x == ex + 1:
-                        y += 1
-                        x = ox
-
-                    else:
-                        y -= 1
-                        break
-                else:
-                    if x <= ex: y -= 1
-                    break
-
-        c_rect = pygame.Rect(ox * tilewidth, oy * tileheight,
-                             (ex - ox + 1) * tilewidth,
-                             (y - oy + 1) * tileheight)
-
-        rects.append(c_rect)
-
-        rect = pygame.Rect(ox, oy, ex - ox + 1, y - oy + 1)
-        kill = [p for p in points if rect.collidepoint(p)]
-        [points.remove(i) for i in kill]
-
-        if points:
-            pick_rect(points, rects)
-
-    rect_list = []
-    while all_points:
-        pick_rect(all_points, rect_list)
-
-    return rect_list
+    rects = pytmx.simplify_points(all_points, tilewidth, tileheight)
+    return [pygame.Rect(rect) for rect in rects]
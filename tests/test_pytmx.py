@@ -3,8 +3,17 @@ some tests for pytmx
 
 WIP - all code that isn't abandoned is WIP
 """
-from unittest import TestCase, skip
+from unittest import TestCase, skip, skipIf
+import json
+import os
+import shutil
 import sys
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 import pytmx
 from pytmx import convert_to_bool
@@ -17,6 +26,24 @@ class TiledMapTest(TestCase):
     def setUp(self):
         self.m = pytmx.TiledMap(self.filename)
 
+    def test_from_xml_string(self):
+        with open(self.filename) as fh:
+            text = fh.read()
+        m = pytmx.TiledMap.from_xml_string(text)
+        self.assertIsNone(m.filename)
+        self.assertEqual(m.layers[0].data, self.m.layers[0].data)
+        self.assertEqual(len(m.images), m.maxgid)
+
+        m = pytmx.TiledMap.from_xml_string('<map width="1" height="1" '
+                                           'tilewidth="8" tileheight="8"/>')
+        self.assertEqual(m.layers, [])
+
+    def test_parse_xml_stream_from_file_object(self):
+        m = pytmx.TiledMap()
+        with open(self.filename, 'rb') as fh:
+            m.parse_xml_stream(fh)
+        self.assertEqual(m.layers[0].data, self.m.layers[0].data)
+
     def test_build_rects(self):
         from pytmx import util_pygame
         rects = util_pygame.build_rects(self.m, "Grass and Water", "tileset", None)
@@ -47,11 +74,1451 @@ class TiledMapTest(TestCase):
         self.assertIsInstance(self.m.layers[0].width, int)
         self.assertIsInstance(self.m.layers[0].height, int)
 
+    def test_register_gids_registers_distinct_values_once(self):
+        m = pytmx.TiledMap()
+        flipped = 2 | pytmx.pytmx.GID_TRANS_FLIPX
+        gids = m.register_gids([1, 1, flipped, 0, 2, 1])
+        self.assertEqual(list(gids), [1, 1, 2, 0, 3, 1])
+        self.assertEqual(m.maxgid, 4)
+        self.assertTrue(m.gidmap[2][0][1].flipped_horizontally)
+
+    def test_image_threads_loads_same_images(self):
+        filename = os.path.join('..', 'apps', 'data', '0.9.1', 'TestMap.tmx')
+        expected = pytmx.TiledMap(filename)
+        m = pytmx.TiledMap(filename, image_threads=4)
+        self.assertEqual(m.images, expected.images)
+
+    def test_pickle(self):
+        import pickle
+        m = pickle.loads(pickle.dumps(self.m))
+        self.assertEqual(m.images, [])
+        m.reload_images()
+        self.assertEqual(m.images, self.m.images)
+        self.assertEqual(m.layers[0].data, self.m.layers[0].data)
+        self.assertIs(m.get_object_by_name('Castle').parent, m)
+
+    def test_load_maps(self):
+        filename = os.path.join('..', 'apps', 'data', '0.9.1', 'TestMap.tmx')
+        maps = pytmx.load_maps([self.filename, filename], max_workers=2)
+        self.assertEqual([m.filename for m in maps], [self.filename, filename])
+        self.assertEqual(maps[0].layers[0].data, self.m.layers[0].data)
+        self.assertEqual(maps[0].images, self.m.images)
+
     @skip('Need to make a better test')
     def test_import_pytmx_doesnt_import_pygame(self):
         self.assertTrue('pygame' not in sys.modules)
 
 
+class LazyImagesTest(TestCase):
+    filename = 'test01.tmx'
+
+    def setUp(self):
+        self.files = list()
+        self.tiles = list()
+
+        def image_loader(filename, colorkey, **kwargs):
+            self.files.append(filename)
+
+            def load(rect=None, flags=None):
+                self.tiles.append(rect)
+                return filename, rect, flags
+
+            return load
+
+        self.m = pytmx.TiledMap(self.filename, image_loader,
+                                lazy_images=True)
+
+    def test_nothing_loaded_until_used(self):
+        self.assertEqual(self.files, [])
+        self.assertEqual(self.tiles, [])
+        image = self.m.get_tile_image_by_gid(1)
+        self.assertEqual(len(self.files), 1)
+        self.assertEqual(self.tiles, [image[1]])
+
+        # loaded only once
+        self.m.get_tile_image_by_gid(1)
+        self.assertEqual(len(self.tiles), 1)
+
+    def test_same_images_as_eager(self):
+        expected = pytmx.TiledMap(self.filename)
+        self.assertEqual(list(self.m.images), expected.images)
+        self.assertEqual(list(self.m.layers[0].tiles()),
+                         list(expected.layers[0].tiles()))
+
+
+class LoadAsyncTest(TestCase):
+    filename = 'test01.tmx'
+
+    def run_async(self, coroutine):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_same_as_tiled_map(self):
+        from pytmx.util_asyncio import load_async
+        expected = pytmx.TiledMap(self.filename)
+        m = self.run_async(load_async(self.filename))
+        self.assertEqual(m.layers[0].data, expected.layers[0].data)
+        self.assertEqual(m.images, expected.images)
+        self.assertEqual(m.tile_properties, expected.tile_properties)
+
+    def test_tileset_gids_are_registered(self):
+        from pytmx.util_asyncio import load_async
+        for kwargs in ({'load_all': True}, {'headless': True, 'raw_gids': True}):
+            expected = pytmx.TiledMap(self.filename, **kwargs)
+            m = self.run_async(load_async(self.filename, **kwargs))
+            self.assertEqual(m.maxgid, expected.maxgid)
+            self.assertEqual(m.tiledgidmap, expected.tiledgidmap)
+
+    def test_image_threads(self):
+        from pytmx.util_asyncio import load_async
+        expected = pytmx.TiledMap(self.filename)
+        m = self.run_async(load_async(self.filename, image_threads=2))
+        self.assertEqual(m.images, expected.images)
+
+    def test_streaming_is_rejected(self):
+        from pytmx.util_asyncio import load_async
+        with self.assertRaises(ValueError):
+            self.run_async(load_async(self.filename, streaming=True))
+
+    def test_event_loop_is_not_blocked(self):
+        import asyncio
+        from pytmx.util_asyncio import load_async
+        ticks = list()
+
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        async def main():
+            task = asyncio.ensure_future(ticker())
+            await load_async(self.filename)
+            task.cancel()
+
+        self.run_async(main())
+        self.assertGreater(len(ticks), 1)
+
+    def test_cancel(self):
+        import asyncio
+        from pytmx.util_asyncio import load_async
+
+        async def main():
+            task = asyncio.ensure_future(load_async(self.filename))
+            await asyncio.sleep(0)
+            task.cancel()
+            await task
+
+        with self.assertRaises(asyncio.CancelledError):
+            self.run_async(main())
+
+
+class TiledTileLayerTest(TestCase):
+    legacy = os.path.join('..', 'apps', 'data', 'legacy')
+    encodings = ('base64', 'base64-gzip', 'base64-zlib', 'csv', 'xml')
+
+    def load(self, encoding):
+        filename = 'formosa-{0}.tmx'.format(encoding)
+        return pytmx.TiledMap(os.path.join(self.legacy, filename))
+
+    def test_all_encodings_produce_same_data(self):
+        expected = self.load('xml')
+        for encoding in self.encodings:
+            m = self.load(encoding)
+            self.assertEqual(m.tiledgidmap, expected.tiledgidmap)
+            for a, b in zip(m.layers, expected.layers):
+                if isinstance(a, pytmx.TiledTileLayer):
+                    self.assertEqual(a.data, b.data)
+
+    def test_streaming_produces_same_data(self):
+        for encoding in self.encodings:
+            expected = self.load(encoding)
+            filename = 'formosa-{0}.tmx'.format(encoding)
+            m = pytmx.TiledMap(os.path.join(self.legacy, filename),
+                               streaming=True)
+            self.assertEqual([l.name for l in m.layers],
+                             [l.name for l in expected.layers])
+            self.assertEqual(m.tile_properties, expected.tile_properties)
+            for a, b in zip(m.layers, expected.layers):
+                if isinstance(a, pytmx.TiledTileLayer):
+                    self.assertEqual(a.data, b.data)
+
+    def test_rows_are_views_of_buffer(self):
+        m = pytmx.TiledMap('test01.tmx')
+        layer = m.layers[0]
+        self.assertEqual(len(layer.buffer), layer.width * layer.height)
+        self.assertEqual(memoryview(layer.buffer).tobytes(),
+                         b''.join(row.tobytes() for row in layer.data))
+
+        layer.data[2][3] = 7
+        self.assertEqual(layer.buffer[2 * layer.width + 3], 7)
+
+    def test_pickled_layer_has_buffer(self):
+        import pickle
+        m = pytmx.TiledMap('test01.tmx')
+        layer = pickle.loads(pickle.dumps(m)).layers[0]
+        self.assertEqual(layer.buffer, m.layers[0].buffer)
+        layer.data[1][1] = 9
+        self.assertEqual(layer.buffer[layer.width + 1], 9)
+
+    def test_unpack_gids_keeps_flags(self):
+        gids = pytmx.pytmx.unpack_gids('1,2147483649,0', 'csv')
+        self.assertEqual(list(gids), [1, 1 | pytmx.pytmx.GID_TRANS_FLIPX, 0])
+
+
+class GidIndexTest(TestCase):
+    filename = 'test01.tmx'
+
+    def setUp(self):
+        self.m = pytmx.TiledMap(self.filename)
+
+    def scan(self, gid):
+        m = self.m
+        return sorted((l, y, x) for l in m.visible_tile_layers
+                      for x, y, g in m.layers[l] if g == gid)
+
+    def found(self, gid):
+        return sorted((l, y, x) for x, y, l
+                      in self.m.get_tile_locations_by_gid(gid))
+
+    def test_same_as_scan(self):
+        for gid in range(1, self.m.maxgid):
+            self.assertEqual(self.found(gid), self.scan(gid))
+
+    def test_invalid_gid(self):
+        with self.assertRaises(ValueError):
+            self.m.get_tile_locations_by_gid(self.m.maxgid)
+
+    def test_headless(self):
+        m = pytmx.TiledMap(self.filename, headless=True)
+        self.assertEqual(len(list(m.get_tile_locations_by_gid(1))),
+                         len(self.scan(1)))
+
+    def test_set_gid_updates_index(self):
+        layer = self.m.layers[1]
+        old = layer.data[4][3]
+        new = old % (self.m.maxgid - 1) + 1
+        self.found(new)
+
+        self.assertEqual(layer.set_gid(3, 4, new), old)
+        self.assertEqual(layer.data[4][3], new)
+        self.assertIn((3, 4), layer.get_locations_by_gid(new))
+        if old:
+            self.assertNotIn((3, 4), layer.get_locations_by_gid(old))
+        for gid in range(1, self.m.maxgid):
+            self.assertEqual(self.found(gid), self.scan(gid))
+
+        layer.set_gid(3, 4, 0)
+        self.assertNotIn((3, 4), layer.get_locations_by_gid(new))
+
+    def test_set_gid_checks_arguments(self):
+        layer = self.m.layers[0]
+        with self.assertRaises(ValueError):
+            layer.set_gid(0, 0, self.m.maxgid)
+        with self.assertRaises(ValueError):
+            layer.set_gid(layer.width, 0, 1)
+
+    def test_reset_caches(self):
+        layer = self.m.layers[0]
+        gid = layer.data[0][0]
+        self.assertIn((0, 0), layer.get_locations_by_gid(gid))
+        layer.data[0][0] = 0
+        layer.reset_caches()
+        self.assertNotIn((0, 0), layer.get_locations_by_gid(gid))
+
+    def test_infinite_map(self):
+        m = pytmx.TiledMap('infinite.tmx')
+        layer = m.layers[0]
+        rock = m.get_tile_gid(-15, 2, 0)
+        self.assertEqual(layer.get_locations_by_gid(rock), [(-15, 2), (36, 21)])
+
+        layer.set_gid(-40, -40, rock)
+        self.assertEqual(layer.get_locations_by_gid(rock),
+                         [(-40, -40), (-15, 2), (36, 21)])
+        self.assertEqual(m.get_tile_gid(-40, -40, 0), rock)
+        self.assertEqual((layer.startx, layer.starty), (-48, -48))
+        self.assertEqual((layer.width, layer.height), (96, 80))
+
+
+class TilesetIndexTest(TestCase):
+    filename = os.path.join('..', 'apps', 'data', '0.9.1', 'testtrack1.tmx')
+
+    def setUp(self):
+        self.m = pytmx.TiledMap(self.filename)
+
+    def slow_lookup(self, gid):
+        tiled_gid = self.m.tiledgidmap[gid]
+        return [ts for ts in self.m.tilesets if ts.firstgid <= tiled_gid][-1]
+
+    def test_every_gid(self):
+        self.assertGreater(len(self.m.tilesets), 1)
+        for gid in range(1, self.m.maxgid):
+            self.assertIs(self.m.get_tileset_from_gid(gid),
+                          self.slow_lookup(gid))
+
+    def test_invalid_gid(self):
+        for gid in (0, -1, self.m.maxgid, 'x'):
+            with self.assertRaises(ValueError):
+                self.m.get_tileset_from_gid(gid)
+
+    def test_new_tilesets(self):
+        m = self.m
+        gid = m.maxgid - 1
+        first = pytmx.TiledTileset(m)
+        first.firstgid = m.tiledgidmap[gid]
+        m.add_tileset(first)
+        self.assertIs(m.get_tileset_from_gid(gid), first)
+
+        # the first tileset added wins, and tilesets may be appended directly
+        second = pytmx.TiledTileset(m)
+        second.firstgid = first.firstgid
+        m.tilesets.append(second)
+        self.assertIs(m.get_tileset_from_gid(gid), first)
+
+        new_gid = m.register_gid(m.tiledgidmap[gid] + 1)
+        self.assertIs(m.get_tileset_from_gid(new_gid), first)
+
+    def test_tilesets_appended_after_lookup(self):
+        m = self.m
+        gid = m.maxgid - 1
+        old = m.get_tileset_from_gid(gid)
+        tileset = pytmx.TiledTileset(m)
+        tileset.firstgid = m.tiledgidmap[gid]
+        m.tilesets.append(tileset)
+        self.assertIs(m.get_tileset_from_gid(gid), tileset)
+
+        # the tileset count does not change, so the index must be reset
+        tileset.firstgid = m.tiledgidmap[gid] + 1
+        m.reset_tileset_index()
+        self.assertIs(m.get_tileset_from_gid(gid), old)
+
+    def test_new_gids_extend_the_table(self):
+        m = self.m
+        m.get_visible_tiles((0, 0, 64, 64))
+        table = m._get_gid_tilesets()
+        offsets = m._get_tile_draw_offsets()
+        tiled_gid = max(m.tiledgidmap.values()) + 1
+        gid = m.register_gid(tiled_gid)
+        self.assertIs(m._get_gid_tilesets(), table)
+        self.assertIs(m.get_tileset_from_gid(gid), self.slow_lookup(gid))
+        self.assertEqual(len(m._get_tile_draw_offsets()[0]), m.maxgid)
+        self.assertEqual(m._get_tile_draw_offsets()[3], offsets[3])
+
+    def test_draw_offsets_follow_tilesets(self):
+        m = self.m
+        gid = m.maxgid - 1
+        self.assertEqual(m._get_tile_draw_offsets()[0][gid], 0)
+        tileset = pytmx.TiledTileset(m)
+        tileset.firstgid = m.tiledgidmap[gid]
+        tileset.tilewidth, tileset.tileheight = m.tilewidth, m.tileheight
+        tileset.offset = (5, 0)
+        m.tilesets.append(tileset)
+        self.assertEqual(m._get_tile_draw_offsets()[0][gid], 5)
+
+        # a new gid of a taller tileset reaches further above its cell
+        offsets = m._get_tile_draw_offsets()
+        tileset.tileheight = m.tileheight * 2
+        new_gid = m.register_gid(tileset.firstgid + 1)
+        self.assertIsNot(m._get_tile_draw_offsets(), offsets)
+        self.assertEqual(m._get_tile_draw_offsets()[1][new_gid],
+                         -m.tileheight)
+        self.assertEqual(m._get_tile_draw_offsets()[3][1], m.tileheight)
+
+
+class HeadlessTest(TestCase):
+    filename = os.path.join('..', 'apps', 'data', 'legacy',
+                            'formosa-base64.tmx')
+
+    def test_no_images(self):
+        m = pytmx.TiledMap('test01.tmx', headless=True)
+        self.assertEqual(m.images, [])
+        self.assertEqual(m.get_layer_by_name('Image Layer 1').gid, 0)
+        expected = pytmx.TiledMap('test01.tmx')
+        self.assertEqual(m.layers[0].data, expected.layers[0].data)
+
+    def test_raw_gids(self):
+        expected = pytmx.TiledMap(self.filename)
+        m = pytmx.TiledMap(self.filename, headless=True, raw_gids=True)
+        flipped = 0
+        for i in expected.visible_tile_layers:
+            for x, y, gid in expected.layers[i]:
+                self.assertEqual(m.layers[i].data[y][x],
+                                 expected.tiledgidmap.get(gid, 0))
+                flags = m.get_tile_flags(x, y, i)
+                self.assertEqual(flags, expected.get_tile_flags(x, y, i))
+                flipped += flags != (0, 0, 0)
+        self.assertGreater(flipped, 0)
+
+        for gid, props in expected.tile_properties.items():
+            raw_props = m.get_tile_properties_by_gid(expected.tiledgidmap[gid])
+            self.assertEqual(raw_props.get('name'), props.get('name'))
+
+    def test_raw_gids_registers_tileset_gids(self):
+        expected = pytmx.TiledMap(self.filename, raw_gids=True)
+        m = pytmx.TiledMap(self.filename, headless=True, raw_gids=True)
+        self.assertEqual(m.maxgid, expected.maxgid)
+        self.assertEqual(m.tiledgidmap, expected.tiledgidmap)
+
+        x, y, gid = next(iter(m.layers[0]))
+        self.assertEqual(m.get_tileset_from_gid(gid).name,
+                         expected.get_tileset_from_gid(gid).name)
+        self.assertIn((x, y, 0), m.get_tile_locations_by_gid(gid))
+
+        usage = m.get_tileset_usage()
+        self.assertEqual([(u.tiles, u.cells) for u in usage],
+                         [(u.tiles, u.cells)
+                          for u in expected.get_tileset_usage()])
+        self.assertGreater(sum(u.cells for u in usage), 0)
+
+    def test_raw_gids_with_image_collection(self):
+        filename = os.path.join('..', 'apps', 'data', '0.9.1',
+                                'embed_tile_image.tmx')
+        m = pytmx.TiledMap(filename, raw_gids=True)
+        self.assertEqual(m.maxgid, 2)
+        self.assertEqual(list(m.layers[0].tiles()), [(5, 9, m.images[1])])
+
+        m = pytmx.TiledMap(filename, headless=True, raw_gids=True)
+        self.assertEqual(m.tiledgidmap, {1: 1})
+        self.assertEqual(m.get_tileset_from_gid(1).name, 'house')
+        self.assertEqual(list(m.get_tile_locations_by_gid(1)), [(5, 9, 0)])
+
+    def test_unused_tiles_are_not_looked_up(self):
+        m = pytmx.TiledMap(self.filename, headless=True)
+        self.assertTrue(all(m.gidmap.values()))
+
+    def test_mask_gids(self):
+        from array import array
+        flip = pytmx.pytmx.GID_TRANS_FLIPX | pytmx.pytmx.GID_TRANS_ROT
+        for gids, typecode in (([0, 1, 255], 'B'), ([1, 256, 65535], 'H'),
+                               ([1, 65536, 0x1fffffff], 'I')):
+            raw = array(pytmx.pytmx.gid_typecode, [g | flip for g in gids])
+            masked = pytmx.pytmx.mask_gids(raw)
+            self.assertEqual(masked.itemsize, array(typecode).itemsize)
+            self.assertEqual(list(masked), gids)
+            self.assertEqual(list(pytmx.pytmx.mask_gids(raw, 'I')), gids)
+
+    def test_raw_gids_in_chunks(self):
+        m = pytmx.TiledMap('infinite.tmx', headless=True, raw_gids=True)
+        self.assertEqual(m.get_tile_gid(-1, 15, 0), 3)
+        self.assertEqual(m.get_tile_gid(32, 16, 0), 3)
+        self.assertTrue(m.get_tile_flags(-1, 15, 0).flipped_horizontally)
+        self.assertFalse(m.get_tile_flags(32, 16, 0).flipped_horizontally)
+        self.assertEqual(m.get_tile_properties(-15, 2, 0)['kind'], 'rock')
+
+
+class LayerFilterTest(TestCase):
+    filename = 'test01.tmx'
+
+    def names(self, m):
+        return [layer.name for layer in m.layers]
+
+    def test_include_names(self):
+        m = pytmx.TiledMap(self.filename, layers=['Tile Layer 2',
+                                                  'Object Layer 1'])
+        self.assertEqual(self.names(m), ['Tile Layer 2', 'Object Layer 1'])
+        with self.assertRaises(ValueError):
+            m.get_layer_by_name('Grass and Water')
+
+    def test_exclude_predicate(self):
+        m = pytmx.TiledMap(self.filename,
+                           exclude_layers=lambda name: 'Tile' in name)
+        self.assertEqual(self.names(m), ['Grass and Water', 'Image Layer 1',
+                                         'Object Layer 1'])
+
+    def test_gids_of_skipped_layers_are_not_registered(self):
+        full = pytmx.TiledMap(self.filename)
+        m = pytmx.TiledMap(self.filename, layers=['Tile Layer 1'])
+        expected = full.get_layer_by_name('Tile Layer 1')
+        layer = m.get_layer_by_name('Tile Layer 1')
+        self.assertLess(m.maxgid, full.maxgid)
+        self.assertEqual(len(m.images), m.maxgid)
+        for (x, y, a), (_, _, b) in zip(layer, expected):
+            self.assertEqual(m.tiledgidmap.get(a), full.tiledgidmap.get(b))
+            self.assertEqual(m.images[a], full.images[b])
+
+    def test_streaming(self):
+        kwargs = {'exclude_layers': ['Grass and Water', 'Image Layer 1']}
+        expected = pytmx.TiledMap(self.filename, **kwargs)
+        m = pytmx.TiledMap(self.filename, streaming=True, **kwargs)
+        self.assertEqual(self.names(m), self.names(expected))
+        self.assertEqual(m.layers[0].data, expected.layers[0].data)
+
+    def test_json(self):
+        filename = os.path.join('..', 'apps', 'data', '0.9.1', 'formosa.json')
+        m = pytmx.TiledMap.from_json(filename, layers=['Tile Layer 1'])
+        self.assertEqual(self.names(m), ['Tile Layer 1'])
+
+
+@skipIf(numpy is None, 'numpy is not installed')
+class NumpyTest(TestCase):
+    filename = 'test01.tmx'
+
+    def setUp(self):
+        self.m = pytmx.TiledMap(self.filename)
+        self.layer = self.m.layers[0]
+
+    def test_as_array_shares_layer_memory(self):
+        a = self.layer.as_array()
+        self.assertEqual(a.shape, (self.layer.height, self.layer.width))
+        self.assertEqual(a[3, 2], self.layer.data[3][2])
+        a[3, 2] = 5
+        self.assertEqual(self.layer.data[3][2], 5)
+
+    def test_get_tile_gids(self):
+        xs = numpy.arange(15)
+        ys = numpy.arange(15)[::-1]
+        expected = [self.m.get_tile_gid(x, y, 0) for x, y in zip(xs, ys)]
+        self.assertEqual(self.m.get_tile_gids(xs, ys, 0).tolist(), expected)
+
+        grid = self.m.get_tile_gids(numpy.arange(15), numpy.arange(15)[:, None], 0)
+        self.assertTrue((grid == self.layer.as_array()).all())
+
+    def test_get_tile_gids_out_of_range(self):
+        with self.assertRaises(ValueError):
+            self.m.get_tile_gids([0, -1], [0, 0], 0)
+        with self.assertRaises(ValueError):
+            self.m.get_tile_gids([0], [15], 0)
+
+    def test_get_tile_property_column(self):
+        xs, ys = numpy.meshgrid(numpy.arange(15), numpy.arange(15))
+        names = self.m.get_tile_property_column('name', xs, ys, 0)
+        for x, y in zip(xs.ravel(), ys.ravel()):
+            props = self.m.get_tile_properties(x, y, 0) or dict()
+            self.assertEqual(names[y, x], props.get('name'))
+
+    def test_tile_property_column_is_cached(self):
+        m = self.m
+        gid = m.get_tile_gid(0, 0, 0)
+        m.get_tile_property_column('name', [0], [0], 0)
+        column = m._tile_property_columns['name'][1]
+        m.get_tile_property_column('name', [1], [0], 0)
+        self.assertIs(m._tile_property_columns['name'][1], column)
+
+        m.set_tile_properties(gid, {'name': 'changed'})
+        self.assertEqual(
+            m.get_tile_property_column('name', [0], [0], 0).tolist(),
+            ['changed'])
+
+        # a tile that was not used before registers a new gid
+        m.get_tile_property_column('width', [0], [0], 0)
+        tiled_gid = max(m.tiledgidmap.values()) + 1
+        m.set_tile_gid(1, 0, 0, tiled_gid)
+        self.assertEqual(
+            m.get_tile_property_column('width', [1], [0], 0).tolist(),
+            [(m.get_tile_properties(1, 0, 0) or dict()).get('width')])
+
+    def test_infinite_layer(self):
+        m = pytmx.TiledMap('infinite.tmx')
+        self.assertEqual(m.get_tile_gids([-15, -14, 36], [2, 2, 21], 0).tolist(),
+                         [m.get_tile_gid(-15, 2, 0), 0, m.get_tile_gid(36, 21, 0)])
+        with self.assertRaises(ValueError):
+            m.layers[0].as_array()
+
+
+class ObjectIndexTest(TestCase):
+    filename = 'test01.tmx'
+
+    def setUp(self):
+        self.m = pytmx.TiledMap(self.filename)
+        self.group = next(self.m.objectgroups)
+
+    def new_object(self, name, object_type=None, object_id=None):
+        obj = pytmx.TiledObject(self.m)
+        obj.name = name
+        obj.type = object_type
+        obj.id = object_id
+        return obj
+
+    def test_lookups(self):
+        castle = self.m.get_object_by_name('Castle')
+        self.assertEqual(castle.name, 'Castle')
+        self.assertIs(self.m.get_object_by_id(castle.id), castle)
+        self.assertEqual(self.m.get_objects_by_type(None), list(self.m.objects))
+        with self.assertRaises(ValueError):
+            self.m.get_object_by_name('missing')
+        with self.assertRaises(ValueError):
+            self.m.get_object_by_id(1000)
+        self.assertEqual(self.m.get_objects_by_type('missing'), [])
+
+    def test_group_changes_reset_index(self):
+        self.assertEqual(self.m.get_objects_by_type('npc'), [])
+        first = self.new_object('Castle', 'npc', 100)
+        second = self.new_object('Guard', 'npc', 101)
+        self.group.append(first)
+        self.group.insert(0, second)
+        self.assertEqual(self.m.get_objects_by_type('npc'), [second, first])
+        self.assertIs(self.m.get_object_by_id(100), first)
+        self.assertEqual(len(self.m.get_objects_by_name('Castle')), 2)
+        self.assertIsNot(self.m.get_object_by_name('Castle'), first)
+
+        self.group.remove(second)
+        del self.group[-1]
+        self.assertEqual(self.m.get_objects_by_type('npc'), [])
+        with self.assertRaises(ValueError):
+            self.m.get_object_by_id(100)
+
+    def test_slice_changes_reset_index(self):
+        guard = self.new_object('Guard', 'npc', 101)
+        self.assertEqual(self.m.get_objects_by_type('npc'), [])
+        self.group[len(self.group):] = [guard]
+        self.assertEqual(self.m.get_objects_by_type('npc'), [guard])
+
+        del self.group[-1:]
+        self.assertEqual(self.m.get_objects_by_type('npc'), [])
+
+        self.group[:0] = [guard]
+        self.assertIs(self.m.get_object_by_id(101), guard)
+        self.group.clear()
+        with self.assertRaises(ValueError):
+            self.m.get_object_by_id(101)
+
+    def test_new_group_resets_index(self):
+        self.assertEqual(self.m.get_objects_by_name('Guard'), [])
+        group = pytmx.TiledObjectGroup(self.m)
+        group.name = 'guards'
+        self.m.add_layer(group)
+        group.append(self.new_object('Guard'))
+        self.assertEqual(len(self.m.get_objects_by_name('Guard')), 1)
+
+    def test_objects_by_property(self):
+        castle = self.m.get_object_by_name('Castle')
+        self.assertEqual(self.m.get_objects_by_property('Population', '234'),
+                         [castle])
+        self.m.index_object_property('Population')
+        self.assertEqual(self.m.get_objects_by_property('Population', '234'),
+                         [castle])
+        self.assertEqual(self.m.get_objects_by_property('Population', '1'), [])
+
+        castle.properties['Population'] = '1'
+        self.m.reset_object_indexes()
+        self.assertEqual(self.m.get_objects_by_property('Population', '1'),
+                         [castle])
+
+    def test_pickle(self):
+        import pickle
+        self.m.get_object_by_name('Castle')
+        m = pickle.loads(pickle.dumps(self.m))
+        self.assertIsNone(m._object_index)
+        self.assertIs(m.get_object_by_name('Castle'),
+                      next(m.objectgroups)[0])
+
+
+class ObjectGridTest(TestCase):
+
+    def setUp(self):
+        self.m = pytmx.TiledMap()
+        self.m.tilewidth = self.m.tileheight = 16
+        self.group = pytmx.TiledObjectGroup(self.m)
+        self.m.add_layer(self.group)
+
+    def add(self, name, x, y, width=0, height=0, rotation=0, points=None,
+            closed=True):
+        obj = pytmx.TiledObject(self.m)
+        obj.name = name
+        obj.x, obj.y = x, y
+        obj.width, obj.height = width, height
+        obj.rotation = rotation
+        if points is not None:
+            obj._set_points(points, closed)
+        self.group.append(obj)
+        return obj
+
+    def names(self, objects):
+        return [obj.name for obj in objects]
+
+    def test_rect_and_point(self):
+        self.add('box', 10, 10, 20, 20)
+        self.add('far', 1000, 1000, 20, 20)
+        grid = self.m.object_grid
+        self.assertEqual(self.names(grid.query_point(15, 15)), ['box'])
+        self.assertEqual(grid.query_point(35, 15), [])
+        self.assertEqual(self.names(grid.query_rect((0, 0, 10, 10))), ['box'])
+        self.assertEqual(self.names(grid.query_rect((0, 0, 2000, 2000))),
+                         ['box', 'far'])
+
+    def test_rotation(self):
+        # a square rotated 45 degrees around its top left corner
+        self.add('diamond', 100, 100, 20, 20, rotation=45)
+        grid = self.m.object_grid
+        self.assertEqual(self.names(grid.query_point(100, 120)), ['diamond'])
+        self.assertEqual(grid.query_point(110, 105), [])
+        self.assertEqual(grid.query_rect((105, 95, 10, 8)), [])
+        self.assertEqual(self.names(grid.query_rect((90, 110, 5, 5))),
+                         ['diamond'])
+
+    def test_polygon_is_tested_exactly(self):
+        self.add('triangle', 0, 0, points=((0, 0), (100, 0), (0, 100)))
+        grid = self.m.object_grid
+        self.assertEqual(self.names(grid.query_point(10, 10)), ['triangle'])
+        self.assertEqual(grid.query_point(90, 90), [])
+        self.assertEqual(grid.query_rect((80, 80, 10, 10)), [])
+
+    def test_polyline_and_point(self):
+        self.add('line', 0, 0, points=((0, 0), (100, 100)), closed=False)
+        self.add('spot', 200, 200)
+        grid = self.m.object_grid
+        self.assertEqual(grid.query_point(50, 50), [])
+        self.assertEqual(grid.query_rect((60, 0, 30, 30)), [])
+        self.assertEqual(self.names(grid.query_rect((40, 40, 5, 5))), ['line'])
+        self.assertEqual(self.names(grid.query_rect((200, 200, 0, 0))),
+                         ['spot'])
+
+    def test_nearest(self):
+        self.add('box', 10, 10, 20, 20)
+        self.add('spot', 500, 20)
+        grid = self.m.object_grid
+        self.assertEqual(grid.nearest(0, 0).name, 'box')
+        self.assertEqual(grid.nearest(400, 0).name, 'spot')
+        self.assertIsNone(grid.nearest(300, 300, max_distance=10))
+        self.assertIsNone(pytmx.ObjectGrid([]).nearest(0, 0))
+
+    def test_same_as_scan(self):
+        import random
+        rnd = random.Random(0)
+        for i in range(200):
+            self.add(i, rnd.uniform(-500, 500), rnd.uniform(-500, 500),
+                     rnd.uniform(0, 80), rnd.uniform(0, 80),
+                     rotation=rnd.choice((0, 30, 90, 200)))
+        grid = self.m.object_grid
+        scan = pytmx.ObjectGrid(self.group, cell_size=10000)
+        for i in range(100):
+            x, y = rnd.uniform(-600, 600), rnd.uniform(-600, 600)
+            rect = x, y, rnd.uniform(0, 100), rnd.uniform(0, 100)
+            self.assertEqual(grid.query_rect(rect), scan.query_rect(rect))
+            self.assertEqual(grid.query_point(x, y), scan.query_point(x, y))
+            self.assertIs(grid.nearest(x, y), scan.nearest(x, y))
+
+    def test_group_changes_reset_grid(self):
+        self.add('box', 10, 10, 20, 20)
+        self.assertEqual(len(self.m.object_grid), 1)
+        self.assertEqual(len(self.group.object_grid), 1)
+        self.add('other', 100, 10, 20, 20)
+        self.assertEqual(len(self.m.object_grid), 2)
+        self.assertEqual(len(self.group.object_grid), 2)
+
+    def test_sized_tile_objects_use_loaded_position(self):
+        filename = os.path.join('..', 'apps', 'data', '0.9.1',
+                                'formosa-base64.tmx')
+        m = pytmx.TiledMap(filename)
+        for name in ('SandCave', 'large tile object'):
+            obj = m.get_object_by_name(name)
+            self.assertIn(obj, m.object_grid.query_point(obj.x + 1, obj.y + 1))
+            self.assertNotIn(obj, m.object_grid.query_point(obj.x + 1,
+                                                            obj.y - 1))
+
+        m = pytmx.TiledMap(filename, invert_y=False)
+        cave = m.get_object_by_name('SandCave')
+        self.assertIn(cave, m.object_grid.query_point(cave.x + 1, cave.y - 1))
+
+    def test_tile_object_is_anchored_at_bottom_left(self):
+        m = pytmx.TiledMap('test01.tmx')
+        cave = m.get_object_by_name('SandCave')
+        self.assertIn(cave, m.object_grid.query_point(cave.x + 1, cave.y - 1))
+        self.assertNotIn(cave, m.object_grid.query_point(cave.x + 1,
+                                                         cave.y + 1))
+
+
+class VisibleTilesTest(TestCase):
+    filename = 'test01.tmx'
+
+    def setUp(self):
+        self.m = pytmx.TiledMap(self.filename)
+
+    def scan(self, m, rect):
+        x, y, width, height = rect
+        found = list()
+        for layer in m.visible_layers:
+            if not isinstance(layer, pytmx.TiledTileLayer):
+                continue
+            for tx, ty, gid in layer.iter_data():
+                if not gid:
+                    continue
+                tileset = m.get_tileset_from_gid(gid)
+                w, h = tileset.tilewidth, tileset.tileheight
+                ix = tx * m.tilewidth + layer.offsetx + int(tileset.offset[0])
+                iy = ((ty + 1) * m.tileheight - h + layer.offsety +
+                      int(tileset.offset[1]))
+                if (ix < x + width and iy < y + height and
+                        ix + w > x and iy + h > y):
+                    found.append((ix, iy, m.images[gid]))
+        return sorted(found)
+
+    def check(self, m, count=200):
+        import random
+        rnd = random.Random(0)
+        right = m.width * m.tilewidth
+        bottom = m.height * m.tileheight
+        for i in range(count):
+            rect = (rnd.randint(-64, right), rnd.randint(-64, bottom),
+                    rnd.randint(0, 200), rnd.randint(0, 200))
+            self.assertEqual(sorted(m.get_visible_tiles(rect)),
+                             self.scan(m, rect))
+
+    def test_same_as_scan(self):
+        self.check(self.m)
+
+    def test_tall_tiles(self):
+        self.check(pytmx.TiledMap(
+            os.path.join('..', 'apps', 'data', '0.9.1', 'TestMap.tmx')))
+
+    def test_offsets(self):
+        self.m.layers[0].offsetx = 5
+        self.m.layers[1].offsety = -7
+        self.m.tilesets[0].offset = (3, 9)
+        self.m._tile_draw_offsets = None
+        self.check(self.m)
+
+    def test_infinite_map(self):
+        m = pytmx.TiledMap('infinite.tmx')
+        self.assertEqual(len(m.get_visible_tiles((-16, 0, 64, 32), True)),
+                         len(list(m.layers[0].tiles())))
+        self.check(m)
+
+    def test_headless_map(self):
+        m = pytmx.TiledMap('test01.tmx', headless=True)
+        with self.assertRaises(ValueError):
+            m.get_visible_tiles((0, 0, 64, 64))
+
+    def test_in_tiles(self):
+        tiles = self.m.get_visible_tiles((0, 0, self.m.width, self.m.height),
+                                         in_tiles=True)
+        self.assertEqual(len(tiles), sum(len(list(self.m.layers[i].tiles()))
+                                         for i in self.m.visible_tile_layers))
+        self.assertEqual(self.m.get_visible_tiles((-5, -5, 5, 5), True), [])
+
+    def test_hidden_layers(self):
+        rect = (0, 0, 64, 64)
+        for layer in self.m.layers:
+            layer.visible = False
+        self.assertEqual(self.m.get_visible_tiles(rect), [])
+
+    def test_set_gid_updates_rows(self):
+        layer = self.m.layers[2]
+        rect = (0, 0, self.m.width * 16, self.m.height * 16)
+        self.m.get_visible_tiles(rect)
+        empty = [y for y in range(layer.height) if not any(layer.data[y])]
+        self.assertTrue(empty)
+        y = empty[0]
+        layer.set_gid(layer.width - 1, y, 1)
+        self.check(self.m, 20)
+        layer.set_gid(layer.width - 1, y, 0)
+        self.check(self.m, 20)
+
+
+class GidCountsTest(TestCase):
+    filename = 'test01.tmx'
+
+    def setUp(self):
+        self.m = pytmx.TiledMap(self.filename)
+
+    def scan(self, layer):
+        counts = dict()
+        for x, y, gid in layer.iter_data():
+            if gid:
+                counts[gid] = counts.get(gid, 0) + 1
+        return counts
+
+    def test_same_as_scan(self):
+        for layer in self.m.layers:
+            if isinstance(layer, pytmx.TiledTileLayer):
+                self.assertEqual(layer.get_gid_counts(), self.scan(layer))
+                self.assertEqual(layer.used_gids(), set(self.scan(layer)))
+
+    def test_set_gid_updates_counts(self):
+        layer = self.m.layers[0]
+        layer.get_gid_counts()
+        old = layer.data[0][0]
+        layer.set_gid(0, 0, 0)
+        layer.set_gid(1, 0, old)
+        layer.set_gid(2, 0, 1)
+        self.assertEqual(layer.get_gid_counts(), self.scan(layer))
+
+    def test_returns_copies(self):
+        layer = self.m.layers[0]
+        layer.get_gid_counts().clear()
+        layer.used_gids().clear()
+        self.assertEqual(layer.get_gid_counts(), self.scan(layer))
+
+    def test_reset_caches(self):
+        layer = self.m.layers[0]
+        layer.get_gid_counts()
+        layer.data[0][0] = 0
+        layer.reset_caches()
+        self.assertEqual(layer.get_gid_counts(), self.scan(layer))
+
+    def test_infinite_map(self):
+        m = pytmx.TiledMap('infinite.tmx')
+        layer = m.layers[0]
+        self.assertEqual(layer.get_gid_counts(), self.scan(layer))
+        self.assertEqual(m.layers[1].used_gids(), set())
+        rock = m.get_tile_gid(-15, 2, 0)
+        self.assertEqual(dict(m.get_tile_properties_by_layer(0))[rock]['kind'],
+                         'rock')
+
+    def test_tile_properties_by_layer(self):
+        layer = self.m.layers[1]
+        expected = dict((gid, self.m.tile_properties[gid])
+                        for gid in set(self.scan(layer))
+                        if gid in self.m.tile_properties)
+        self.assertEqual(dict(self.m.get_tile_properties_by_layer(1)), expected)
+
+    def test_tileset_usage(self):
+        usage = self.m.get_tileset_usage()
+        self.assertEqual([i.tileset for i in usage], self.m.tilesets)
+        cells = sum(sum(self.scan(layer).values())
+                    for layer in self.m.layers
+                    if isinstance(layer, pytmx.TiledTileLayer))
+        self.assertEqual(sum(i.cells for i in usage), cells)
+
+        tiled_gids = set()
+        for layer in self.m.layers:
+            if isinstance(layer, pytmx.TiledTileLayer):
+                tiled_gids.update(self.m.tiledgidmap[gid]
+                                  for gid in layer.used_gids())
+        self.assertEqual(sum(i.tiles for i in usage), len(tiled_gids))
+
+        usage = self.m.get_tileset_usage([0])
+        self.assertEqual(sum(i.cells for i in usage),
+                         sum(self.scan(self.m.layers[0]).values()))
+
+
+class TilePropertyIndexTest(TestCase):
+    filename = 'test01.tmx'
+
+    def setUp(self):
+        self.m = pytmx.TiledMap(self.filename)
+
+    def scan_gids(self, key, value):
+        return sorted(gid for gid, props in self.m.tile_properties.items()
+                      if props.get(key) == value)
+
+    def scan_cells(self, key, value, layer):
+        gids = self.scan_gids(key, value)
+        return [(x, y) for x, y, gid in self.m.layers[layer].iter_data()
+                if gid in gids]
+
+    def test_gids(self):
+        for key, value in (('width', 16), ('type', 'SandCave'),
+                           ('name', 'missing'), ('missing', 1)):
+            self.assertEqual(self.m.get_gids_by_property(key, value),
+                             self.scan_gids(key, value))
+
+    def test_unhashable_value(self):
+        self.assertEqual(self.m.get_gids_by_property('frames', []),
+                         self.scan_gids('frames', []))
+
+    def test_locations(self):
+        found = self.m.get_tile_locations_by_property('width', 16)
+        self.assertEqual(sorted(found), list(self.m.visible_tile_layers))
+        for layer, cells in found.items():
+            self.assertEqual(cells, self.scan_cells('width', 16, layer))
+        self.assertEqual(
+            self.m.get_tile_locations_by_property('width', 16, 1),
+            {1: self.scan_cells('width', 16, 1)})
+
+    def test_set_tile_properties_resets_index(self):
+        self.assertEqual(self.m.get_gids_by_property('solid', 'true'), [])
+        self.m.set_tile_properties(1, {'solid': 'true'})
+        self.assertEqual(self.m.get_gids_by_property('solid', 'true'), [1])
+
+    def test_reset_tile_property_index(self):
+        gid = self.m.get_gids_by_property('type', 'SandCave')[0]
+        self.m.tile_properties[gid]['type'] = 'Cave'
+        self.m.reset_tile_property_index()
+        self.assertEqual(self.m.get_gids_by_property('type', 'SandCave'), [])
+        self.assertEqual(self.m.get_gids_by_property('type', 'Cave'), [gid])
+
+    def test_infinite_map(self):
+        m = pytmx.TiledMap('infinite.tmx')
+        found = m.get_tile_locations_by_property('kind', 'rock')
+        self.assertEqual(found[0], [(-15, 2), (36, 21)])
+
+
+class TileEditingTest(TestCase):
+    filename = 'test01.tmx'
+
+    def setUp(self):
+        self.m = pytmx.TiledMap(self.filename)
+
+    def unused_tile(self):
+        used = set(self.m.tiledgidmap.values())
+        return min(i for i in range(1, 337) if i not in used)
+
+    def test_set_tile_gid_registers_new_tiles(self):
+        m = self.m
+        tiled_gid = self.unused_tile()
+        maxgid = m.maxgid
+        gid = m.set_tile_gid(2, 3, 0, tiled_gid)
+        self.assertEqual(gid, maxgid)
+        self.assertEqual(m.get_tile_gid(2, 3, 0), gid)
+        self.assertEqual(m.tiledgidmap[gid], tiled_gid)
+        self.assertIsNotNone(m.get_tile_image(2, 3, 0))
+        self.assertIs(m.get_tileset_from_gid(gid), m.tilesets[0])
+        self.assertEqual(m.layers[0].get_locations_by_gid(gid), [(2, 3)])
+        self.assertEqual(m.layers[0].get_gid_counts()[gid], 1)
+
+        # the same tile is not registered again
+        self.assertEqual(m.set_tile_gid(4, 3, 0, tiled_gid), gid)
+
+    def test_new_tiles_get_properties(self):
+        m = pytmx.TiledMap(self.filename)
+        tiled_gid = 246
+        gid = m.set_tile_gid(0, 0, 0, tiled_gid)
+        self.assertEqual(m.get_tile_properties(0, 0, 0),
+                         m.tiled_tile_properties[tiled_gid])
+        key, value = next(iter(m.tiled_tile_properties[tiled_gid].items()))
+        self.assertIn(gid, m.get_gids_by_property(key, value))
+
+    def test_flags(self):
+        flags = pytmx.TileFlags(True, False, True)
+        gid = self.m.set_tile_gid(1, 1, 0, 5, flags)
+        self.assertEqual(self.m.get_tile_flags(1, 1, 0), flags)
+        self.assertNotEqual(gid, self.m.register_tile(5))
+
+        m = pytmx.TiledMap(self.filename, raw_gids=True)
+        self.assertEqual(m.set_tile_gid(1, 1, 0, 5, flags), 5)
+        self.assertEqual(m.get_tile_gid(1, 1, 0), 5)
+        self.assertEqual(m.get_tile_flags(1, 1, 0), flags)
+
+    def test_dirty_rects(self):
+        layer = self.m.layers[0]
+        self.assertEqual(layer.pop_dirty_rects(), [])
+        gid = layer.data[0][0]
+        self.m.set_tile_gid(0, 0, 0, self.m.tiledgidmap[gid])
+        self.assertEqual(layer.pop_dirty_rects(), [])
+
+        self.m.set_tile_gid(0, 0, 0, 0)
+        self.m.fill_rect((2, 2, 3, 2), 0, 7)
+        self.assertEqual(layer.pop_dirty_rects(), [(0, 0, 1, 1), (2, 2, 3, 2)])
+        self.assertEqual(layer.dirty_rects, [])
+
+    def test_fill_rect(self):
+        m = self.m
+        gid = m.fill_rect((2, 3, 4, 5), 1, 7)
+        for y in range(3, 8):
+            for x in range(2, 6):
+                self.assertEqual(m.get_tile_gid(x, y, 1), gid)
+        self.assertEqual(len(m.layers[1].get_locations_by_gid(gid)), 20)
+
+        before = list(m.layers[1].buffer)
+        with self.assertRaises(ValueError):
+            m.fill_rect((m.width - 1, 0, 2, 1), 1, 7)
+        self.assertEqual(list(m.layers[1].buffer), before)
+
+    def test_paste(self):
+        m = self.m
+        flipped = 9 | pytmx.pytmx.GID_TRANS_FLIPX
+        m.paste(1, 1, 0, [[8, 0, flipped], [0, 8]], skip_empty=True)
+        old = m.get_tile_gid(2, 1, 0)
+        self.assertEqual(m.tiledgidmap[m.get_tile_gid(1, 1, 0)], 8)
+        self.assertEqual(m.get_tile_gid(2, 1, 0), old)
+        self.assertTrue(m.get_tile_flags(3, 1, 0).flipped_horizontally)
+        self.assertEqual(m.layers[0].pop_dirty_rects(), [(1, 1, 3, 2)])
+
+        m.paste(1, 1, 0, [[0]])
+        self.assertEqual(m.get_tile_gid(1, 1, 0), 0)
+
+    def test_paste_widens_layers(self):
+        m = self.m
+        self.assertEqual(m.layer_typecode, 'B')
+        m.paste(0, 0, 0, [list(range(1, 226))[i:i + 15]
+                          for i in range(0, 225, 15)])
+        self.assertEqual(m.layer_typecode, 'H')
+        self.assertEqual(m.tiledgidmap[m.get_tile_gid(14, 14, 0)], 225)
+        for layer in m.visible_tile_layers:
+            self.assertEqual(m.layers[layer].buffer.typecode, 'H')
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            self.m.set_tile_gid(0, 0, 4, 1)
+        with self.assertRaises(ValueError):
+            self.m.set_tile_gid(self.m.width, 0, 0, 1)
+        with self.assertRaises(ValueError):
+            self.m.paste(self.m.width - 1, 0, 0, [[1, 1]])
+
+    def test_infinite_map(self):
+        m = pytmx.TiledMap('infinite.tmx')
+        layer = m.layers[0]
+        gid = m.set_tile_gid(100, -40, 0, 6)
+        self.assertEqual(m.get_tile_gid(100, -40, 0), gid)
+        self.assertEqual(m.get_tile_properties(100, -40, 0)['kind'], 'rock')
+        self.assertEqual(layer.pop_dirty_rects(), [(100, -40, 1, 1)])
+        m.fill_rect((-50, -50, 3, 3), 0, 6)
+        self.assertEqual(len(layer.get_locations_by_gid(gid)), 12)
+
+
+class SimplifyPointsTest(TestCase):
+
+    def covered(self, rects):
+        cells = list()
+        for x, y, w, h in rects:
+            cells.extend((i, j) for i in range(x, x + w) for j in range(y, y + h))
+        return cells
+
+    def test_example(self):
+        data = ['0111000',
+                '0110000',
+                '0000040',
+                '0000040',
+                '0000000',
+                '0011111']
+        points = [(x, y) for y, row in enumerate(data)
+                  for x, c in enumerate(row) if c != '0']
+        rects = pytmx.simplify_points(points, 2, 1)
+        self.assertEqual(rects, [(2, 0, 6, 1), (2, 1, 4, 1),
+                                 (10, 2, 2, 2), (4, 5, 10, 1)])
+
+    def test_covers_points_once(self):
+        import random
+        rnd = random.Random(0)
+        points = set((rnd.randint(-20, 20), rnd.randint(-20, 20))
+                     for i in range(800))
+        cells = self.covered(pytmx.simplify_points(points))
+        self.assertEqual(len(cells), len(points))
+        self.assertEqual(set(cells), points)
+
+    def test_large_area(self):
+        points = [(x, y) for x in range(512) for y in range(512)
+                  if (x // 64 + y // 64) % 2]
+        rects = pytmx.simplify_points(points)
+        self.assertEqual(len(rects), 32)
+        self.assertEqual(pytmx.simplify_points([]), [])
+
+    def test_build_tile_rects(self):
+        m = pytmx.TiledMap('test01.tmx')
+        rects = pytmx.build_tile_rects(m, 0)
+        self.assertEqual(rects, [(0, 0, 240, 240)])
+        rects = pytmx.build_tile_rects(m, 'Tile Layer 1', real_gid=18)
+        gid = m.map_gid(18)[0][0]
+        cells = set((x * 16, y * 16) for x, y
+                    in m.layers[1].get_locations_by_gid(gid))
+        self.assertEqual(set((x, y) for x, y, w, h in rects
+                             for x in range(x, x + w, 16)
+                             for y in range(y, y + h, 16)), cells)
+
+    def test_pygame_rects(self):
+        from pytmx import util_pygame
+        points = [(0, 0), (1, 0), (3, 3)]
+        rects = util_pygame.simplify(points, 16, 16)
+        self.assertEqual(rects, pytmx.simplify_points(points, 16, 16))
+        self.assertTrue(all(isinstance(r, util_pygame.pygame.Rect)
+                            for r in rects))
+
+
+class LayerTypecodeTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def load(self, *layers):
+        """ Load a map that has a layer with each list of gids
+        """
+        import base64
+        from array import array
+
+        width = max(len(gids) for gids in layers)
+        text = ['<map version="1.0" orientation="orthogonal" width="{0}" '
+                'height="1" tilewidth="16" tileheight="16">'.format(width),
+                '<tileset firstgid="1" name="tiles" tilewidth="16" '
+                'tileheight="16"/>']
+        for gids in layers:
+            data = array(pytmx.pytmx.gid_typecode, gids)
+            data.extend([0] * (width - len(gids)))
+            if sys.byteorder == 'big':
+                data.byteswap()
+            text.append('<layer width="{0}" height="1"><data encoding='
+                        '"base64">{1}</data></layer>'.format(
+                width, base64.b64encode(data.tobytes()).decode('ascii')))
+        text.append('</map>')
+
+        filename = os.path.join(self.path, 'typecode.tmx')
+        with open(filename, 'w') as fh:
+            fh.write('\n'.join(text))
+        return pytmx.TiledMap(filename)
+
+    def check(self, m, typecode):
+        self.assertEqual(m.layer_typecode, typecode)
+        for layer in m.visible_tile_layers:
+            self.assertEqual(m.layers[layer].buffer.typecode, typecode)
+            for row in m.layers[layer].data:
+                self.assertEqual(row.format, typecode)
+
+    def test_byte(self):
+        m = self.load(range(1, 256))
+        self.check(m, 'B')
+        self.assertEqual(list(m.layers[0].data[0]), list(range(1, 256)))
+
+    def test_short(self):
+        m = self.load(range(1, 257))
+        self.check(m, 'H')
+        self.assertEqual(m.layers[0].data[0][-1], 256)
+
+    def test_int(self):
+        m = self.load(range(1, 65537))
+        self.check(m, pytmx.pytmx.gid_typecode)
+        self.assertEqual(m.layers[0].data[0][-1], 65536)
+
+    def test_flags_count_as_gids(self):
+        flipped = [gid | pytmx.pytmx.GID_TRANS_FLIPX for gid in range(1, 129)]
+        m = self.load(list(range(1, 129)) + flipped)
+        self.check(m, 'H')
+
+    def test_earlier_layers_are_widened(self):
+        m = self.load([1, 2, 3], range(1, 300))
+        self.check(m, 'H')
+        self.assertEqual(list(m.layers[0].data[0][:4]), [1, 2, 3, 0])
+        self.assertEqual(m.layers[1].data[0][298], 299)
+
+    def test_gids_registered_after_layers_widen_them(self):
+        m = pytmx.TiledMap('test01.tmx', load_all=True)
+        self.assertGreater(m.maxgid, 256)
+        self.check(m, 'H')
+        m.layers[0].set_gid(0, 0, m.maxgid - 1)
+        self.assertEqual(m.get_tile_gid(0, 0, 0), m.maxgid - 1)
+
+
+class InfiniteMapTest(TestCase):
+    filename = 'infinite.tmx'
+
+    def setUp(self):
+        self.m = pytmx.TiledMap(self.filename)
+        self.layer = self.m.get_layer_by_name('Ground')
+
+    def test_rows_cannot_be_iterated(self):
+        with self.assertRaises(TypeError):
+            list(self.layer.data)
+        with self.assertRaises(TypeError):
+            list(self.layer.data[0])
+
+    def test_chunks_are_decoded_when_used(self):
+        chunks = self.layer.data.chunks
+        self.assertEqual(sorted(chunks), [(-1, 0), (2, 1)])
+        self.assertTrue(all(isinstance(i, tuple) for i in chunks.values()))
+
+        self.m.get_tile_gid(-15, 2, 0)
+        self.assertNotIsInstance(chunks[(-1, 0)], tuple)
+        self.assertIsInstance(chunks[(2, 1)], tuple)
+
+    def test_bounds(self):
+        self.assertEqual((self.layer.startx, self.layer.starty), (-16, 0))
+        self.assertEqual((self.layer.width, self.layer.height), (64, 32))
+
+    def test_empty_layer(self):
+        layer = self.m.get_layer_by_name('Empty')
+        self.assertEqual(layer.data.chunks, dict())
+        self.assertEqual(layer.data[5][5], 0)
+
+    def test_cells(self):
+        m = self.m
+        rock = m.get_tile_gid(-15, 2, 0)
+        self.assertEqual(m.get_tile_properties(-15, 2, 0)['kind'], 'rock')
+        self.assertEqual(m.get_tile_gid(36, 21, 0), rock)
+        self.assertEqual(m.get_tile_gid(-14, 2, 0), 0)
+        self.assertEqual(m.get_tile_gid(1000, -1000, 0), 0)
+
+        flipped = m.get_tile_image(-1, 15, 0)
+        self.assertTrue(flipped[2].flipped_horizontally)
+        self.assertEqual(m.get_tile_image(32, 16, 0)[1], flipped[1])
+
+    def test_images_of_new_tiles(self):
+        self.assertEqual(self.m.images, [None])
+        image = self.m.get_tile_image(-15, 2, 0)
+        self.assertEqual(image[1], (80, 0, 16, 16))
+        self.assertEqual(len(self.m.images), self.m.maxgid)
+
+    def test_tiles(self):
+        tiles = [(x, y) for x, y, image in self.layer.tiles()]
+        self.assertEqual(tiles, [(-15, 2), (-1, 15), (32, 16), (36, 21)])
+
+    def test_streaming(self):
+        m = pytmx.TiledMap(self.filename, streaming=True)
+        self.assertEqual(list(m.layers[0].iter_data()),
+                         list(self.layer.iter_data()))
+
+    def test_json(self):
+        cells = list(self.layer.iter_data())
+        chunks = list()
+        for key in sorted(self.layer.data.chunks):
+            data = [self.m.tiledgidmap.get(gid, 0)
+                    for x, y, gid in cells[:256]]
+            cells = cells[256:]
+            chunks.append({'x': key[0] * 16, 'y': key[1] * 16,
+                           'width': 16, 'height': 16, 'data': data})
+
+        doc = {'version': 1, 'orientation': 'orthogonal', 'infinite': True,
+               'width': 30, 'height': 20, 'tilewidth': 16, 'tileheight': 16,
+               'tilesets': [{'firstgid': 1, 'name': 'tileset',
+                             'tilewidth': 16, 'tileheight': 16,
+                             'image': 'tileset.png', 'imagewidth': 256,
+                             'imageheight': 336, 'margin': 0, 'spacing': 0}],
+               'layers': [{'type': 'tilelayer', 'name': 'Ground',
+                           'chunks': chunks, 'startx': -16, 'starty': 0,
+                           'width': 64, 'height': 32, 'x': 0, 'y': 0,
+                           'opacity': 1, 'visible': True}]}
+
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'infinite.json')
+            with open(filename, 'w') as fh:
+                json.dump(doc, fh)
+            m = pytmx.TiledMap.from_json(filename)
+        finally:
+            shutil.rmtree(path)
+
+        self.assertEqual(m.layers[0].startx, -16)
+        self.assertNotEqual(m.get_tile_gid(-15, 2, 0), 0)
+        self.assertEqual(m.get_tile_gid(-15, 2, 0), m.get_tile_gid(36, 21, 0))
+        self.assertEqual(m.get_tile_gid(-14, 2, 0), 0)
+
+
+class TiledMapJsonTest(TestCase):
+    filename = os.path.join('..', 'apps', 'data', '0.9.1', 'formosa.json')
+    expected = os.path.join('..', 'apps', 'data', 'legacy', 'formosa-csv.tmx')
+
+    def setUp(self):
+        self.m = pytmx.TiledMap.from_json(self.filename)
+
+    def test_same_as_tmx(self):
+        expected = pytmx.TiledMap(self.expected)
+        self.assertEqual(self.m.tile_properties, expected.tile_properties)
+        for i in expected.visible_tile_layers:
+            self.assertEqual(self.m.layers[i].name, expected.layers[i].name)
+            self.assertEqual(self.m.layers[i].data, expected.layers[i].data)
+
+    def test_objects(self):
+        castle = self.m.get_object_by_name('Castle')
+        self.assertEqual(castle.properties, {'Population': '234'})
+        self.assertEqual(castle.points[1], (192.0, 48.0))
+        self.assertIsNone(castle.type)
+
+    def test_base64_layer_data(self):
+        data = {'type': 'tilelayer', 'name': 'layer', 'width': 2,
+                'height': 1, 'encoding': 'base64', 'compression': '',
+                'data': 'AQAAAAIAAAA='}
+        layer = pytmx.TiledTileLayer(self.m).parse_json(data)
+        self.assertEqual(len(layer.data[0]), 2)
+        self.assertEqual(self.m.tiledgidmap[layer.data[0][1]], 2)
+
+
+class CompiledMapTest(TestCase):
+    filename = 'test01.tmx'
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = os.path.join(self.path, 'test01.tmxc')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_load_from_cache(self):
+        from pytmx.tmxc import load_compiled
+        expected = load_compiled(self.filename, cache_filename=self.cache)
+        self.assertTrue(os.path.exists(self.cache))
+        m = load_compiled(self.filename, cache_filename=self.cache)
+        self.assertIsInstance(m.layers[0].buffer, memoryview)
+        self.assertEqual(m.layers[0].data, expected.layers[0].data)
+        self.assertEqual(m.images, expected.images)
+        self.assertEqual(m.tile_properties, expected.tile_properties)
+        self.assertEqual(m.get_object_by_name('Castle').points,
+                         expected.get_object_by_name('Castle').points)
+
+    def test_changed_map_is_parsed_again(self):
+        from pytmx.tmxc import load_compiled
+        filename = os.path.join(self.path, 'test01.tmx')
+        shutil.copy(self.filename, filename)
+        load_compiled(filename)
+        with open(filename, 'a') as fh:
+            fh.write('\n')
+        m = load_compiled(filename)
+        self.assertNotIsInstance(m.layers[0].buffer, memoryview)
+
+    def test_layer_filters(self):
+        from pytmx.tmxc import load_compiled
+        load_compiled(self.filename, cache_filename=self.cache,
+                      layers=['Tile Layer 1'])
+        m = load_compiled(self.filename, cache_filename=self.cache,
+                          layers=['Tile Layer 1'])
+        self.assertIsInstance(m.layers[0].buffer, memoryview)
+        self.assertEqual([l.name for l in m.layers], ['Tile Layer 1'])
+
+        m = load_compiled(self.filename, cache_filename=self.cache,
+                          layers=lambda name: name == 'Tile Layer 2')
+        self.assertEqual([l.name for l in m.layers], ['Tile Layer 2'])
+        self.assertNotIsInstance(m.layers[0].buffer, memoryview)
+
+    def test_different_options_are_parsed_again(self):
+        from pytmx.tmxc import load_compiled
+        load_compiled(self.filename, cache_filename=self.cache)
+        m = load_compiled(self.filename, cache_filename=self.cache,
+                          invert_y=False)
+        self.assertNotIsInstance(m.layers[0].buffer, memoryview)
+        self.assertFalse(m.invert_y)
+
+    def test_out_of_date_cache_is_not_unpickled(self):
+        import pickle
+        from pytmx import tmxc
+
+        class Marker(object):
+            def __reduce__(self):
+                return os.mkdir, (marker,)
+
+        # a cache of another map, which would make a directory if unpickled
+        marker = os.path.join(self.path, 'unpickled')
+        other = os.path.join(self.path, 'other.tmx')
+        shutil.copy(self.filename, other)
+        key = json.dumps(tmxc._map_key(pytmx.TiledMap(other))).encode('utf-8')
+        data = pickle.dumps(Marker())
+        with open(self.cache, 'wb') as fh:
+            fh.write(tmxc.header.pack(tmxc.MAGIC, tmxc.VERSION, len(key),
+                                      len(data)))
+            fh.write(key)
+            fh.write(data)
+
+        m = tmxc.load_compiled(self.filename, cache_filename=self.cache)
+        self.assertFalse(os.path.exists(marker))
+        self.assertNotIsInstance(m.layers[0].buffer, memoryview)
+
+    def test_cached_map_keeps_its_buffer(self):
+        import pickle
+        from pytmx.tmxc import load_compiled
+        load_compiled(self.filename, cache_filename=self.cache)
+        m = load_compiled(self.filename, cache_filename=self.cache)
+        self.assertIsNotNone(m._compiled_buffer)
+
+        copy = pickle.loads(pickle.dumps(m))
+        self.assertIsNone(copy._compiled_buffer)
+        self.assertEqual(copy.layers[0].data, m.layers[0].data)
+
+
+class TilesetCacheTest(TestCase):
+    filename = os.path.join('..', 'apps', 'data', '0.9.1', 'testtrack1.tmx')
+
+    def setUp(self):
+        pytmx.tileset_cache.clear()
+
+    def test_external_tilesets_are_parsed_once(self):
+        a = pytmx.TiledMap(self.filename)
+        self.assertEqual(pytmx.tileset_cache.misses, 2)
+        self.assertEqual(pytmx.tileset_cache.hits, 0)
+        b = pytmx.TiledMap(self.filename)
+        self.assertEqual(pytmx.tileset_cache.misses, 2)
+        self.assertEqual(pytmx.tileset_cache.hits, 2)
+        self.assertEqual(a.tile_properties, b.tile_properties)
+        self.assertEqual(a.images, b.images)
+
+    def test_maps_do_not_share_properties(self):
+        a = pytmx.TiledMap(self.filename)
+        b = pytmx.TiledMap(self.filename)
+        a.tilesets[0].properties['foo'] = 'bar'
+        self.assertNotIn('foo', b.tilesets[0].properties)
+
+
 class handle_bool_TestCase(TestCase):
     def test_when_passed_true_it_should_return_true(self):
         self.assertTrue(convert_to_bool("true"))